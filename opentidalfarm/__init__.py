@@ -20,17 +20,24 @@ from solvers import *
 from problems import *
 from domains import *
 from functionals import *
+from boundary_forcing import *
 from tidal import *
 from optimisation_helpers import *
 from reduced_functional import *
 from fenics_reduced_functional import *
 from boundary_conditions import *
 from turbine_function import *
+from run_log import *
+from precompile import *
+from profiling import *
+from evaluation_pool import *
 
 from dolfin import *
 from dolfin import parameters
-from dolfin_adjoint import minimize, maximize, Function, solve, Control, \
-                           Constant
+from dolfin_adjoint import Function, solve, Control, Constant
+from optimisation import *
+from multilevel import *
+from adaptive_reduced_functional import *
 
 parameters["form_compiler"]["representation"] = "uflacs"
 
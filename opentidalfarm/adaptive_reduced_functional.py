@@ -0,0 +1,176 @@
+"""
+.. module:: Adaptive reduced functional
+   :synopsis: A reduced functional whose mesh is refined around the current
+       turbine positions between optimisation iterations.
+"""
+
+import numpy
+import dolfin
+from dolfin import log, INFO
+from reduced_functional_prototype import ReducedFunctionalPrototype
+from multilevel import _prolong_state
+
+__all__ = ["AdaptiveReducedFunctional", "turbine_refinement_markers"]
+
+
+def turbine_refinement_markers(domain, positions, radius):
+    """ Marks the cells of a domain that are closer than radius to one of the
+    turbine positions.
+
+    :param domain: The domain.
+    :param positions: The turbine positions.
+    :type positions: list of (x, y) tuples
+    :param radius: The refinement radius around each turbine.
+    :type radius: float
+    :returns: A boolean :class:`dolfin.CellFunction` for :meth:`Domain.refine`.
+    """
+    mesh = domain.mesh
+    markers = dolfin.CellFunction("bool", mesh)
+    markers.set_all(False)
+
+    positions = numpy.reshape(numpy.asarray(positions, dtype=float), (-1, 2))
+    if len(positions) == 0:
+        return markers
+
+    vertices = mesh.coordinates()[mesh.cells()][:, :, :2]
+    midpoints = vertices.mean(axis=1)
+    # The distance from the midpoint to the furthest vertex of each cell, so
+    # that cells which are partly within the radius are marked as well
+    sizes = numpy.sqrt(((vertices - midpoints[:, None, :])**2).sum(axis=2))
+    distances = numpy.sqrt(((midpoints[:, None, :] -
+                             positions[None, :, :])**2).sum(axis=2))
+
+    markers.array()[:] = distances.min(axis=1) < radius + sizes.max(axis=1)
+    return markers
+
+
+class AdaptiveReducedFunctional(ReducedFunctionalPrototype):
+    """ A reduced functional for discrete turbines on a mesh that is refined
+    around the current turbine positions.
+
+    The mesh is created from a coarse base domain, whose cells within a
+    radius around each turbine are refined `levels` times. Hence the number of
+    degrees of freedom grows with the number of turbines rather than with the
+    area of the farm site. When the turbines move, :meth:`adapt` recreates the
+    mesh from the base domain, so that the cells around the old positions
+    become coarse again. Use it as the callback of the optimisation to adapt
+    the mesh between optimisation iterations:
+
+    .. code-block:: python
+
+        def build_rf(domain):
+            ...
+            return ReducedFunctional(functional, control, solver, rf_params)
+
+        rf = AdaptiveReducedFunctional(build_rf, coarse_domain, levels=3)
+        maximize(rf, bounds=[lb, ub], callback=rf.adapt)
+
+    On each adaptation, a new :class:`ReducedFunctional` is created on the
+    new mesh. The turbine parameters are copied to its farm, which rebuilds
+    its turbine cache on the new mesh. The cached flow states are
+    interpolated onto the new mesh as the initial guesses for the Newton
+    solver. The automatic scaling factor and the optimisation and search
+    iteration counters of the solver are carried over. The memoisation
+    caches start empty, since the functional values of the old mesh differ
+    from those of the new mesh. The interpolation only works in serial.
+
+    :param build_rf: A function that creates the reduced functional for a
+        given domain.
+    :param domain: The coarse base domain.
+    :param levels: The number of local refinements around the turbines.
+        Default: 2
+    :param radius: The refinement radius around each turbine. Default: the
+        turbine diameter.
+    :param tolerance: The mesh is only adapted if a turbine moved further
+        than this fraction of the radius since the last adaptation.
+        Default: 0.5
+    """
+
+    def __init__(self, build_rf, domain, levels=2, radius=None, tolerance=0.5):
+        self.build_rf = build_rf
+        self.base_domain = domain
+        self.levels = levels
+        self.tolerance = tolerance
+
+        #: The :class:`ReducedFunctional` on the current mesh.
+        self.rf = build_rf(domain)
+        farm = self.rf.solver.problem.parameters.tidal_farm
+        if farm.turbine_specification.smeared:
+            raise ValueError("The adaptive refinement requires discrete "
+                             "turbines.")
+
+        if radius is None:
+            radius = farm.turbine_specification.diameter
+        self.radius = radius
+
+        self._positions = None
+        self.adapt()
+
+    @property
+    def controls(self):
+        return self.rf.controls
+
+    @property
+    def domain(self):
+        """ The domain of the current mesh. """
+        return self.rf.solver.problem.parameters.domain
+
+    def adapt(self, m=None):
+        """ Refines the base domain around the turbine positions of the
+        controls m and moves the reduced functional to the new mesh.
+
+        :param m: The control values. Default: the current controls.
+        :type m: numpy array
+        :returns: bool -- True if the mesh was adapted, False if no turbine
+            moved far enough.
+        """
+        if m is None:
+            m = self.controls[0].data()
+        m = numpy.array(m, dtype=float)
+        self.rf._update_turbine_farm(m)
+
+        farm = self.rf.solver.problem.parameters.tidal_farm
+        positions = numpy.reshape(numpy.array(farm.turbine_positions,
+                                              dtype=float), (-1, 2))
+        if (self._positions is not None and
+            self._positions.shape == positions.shape and
+            (len(positions) == 0 or
+             numpy.sqrt(((positions - self._positions)**2).sum(axis=1)).max()
+             <= self.tolerance*self.radius)):
+            return False
+
+        domain = self.base_domain
+        for level in range(self.levels):
+            markers = turbine_refinement_markers(domain, positions,
+                                                 self.radius)
+            domain = domain.refine(markers)
+        log(INFO, "Adapted the mesh to the turbine positions. %s" % domain)
+
+        rf = self.build_rf(domain)
+        # Continue with the scaling and the output numbering of the
+        # optimisation, so that the optimiser sees the same objective scale.
+        rf._automatic_scaling_factor = self.rf._automatic_scaling_factor
+        rf.solver.optimisation_iteration = \
+            self.rf.solver.optimisation_iteration
+        rf.solver.search_iteration = self.rf.solver.search_iteration
+        rf._update_turbine_farm(m)
+        _prolong_state(self.rf, rf)
+
+        self.rf = rf
+        self._positions = positions
+        return True
+
+    def evaluate(self, m, **kwargs):
+        return self.rf.evaluate(m, **kwargs)
+
+    def derivative(self, m, **kwargs):
+        return self.rf.derivative(m, **kwargs)
+
+    def value_and_derivative(self, m, **kwargs):
+        return self.rf.value_and_derivative(m, **kwargs)
+
+    def hessian(self, m, m_dot):
+        return self.rf.hessian(m, m_dot)
+
+    def _update_turbine_farm(self, m):
+        self.rf._update_turbine_farm(m)
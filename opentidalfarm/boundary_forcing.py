@@ -0,0 +1,241 @@
+"""
+.. module:: Boundary forcing
+   :synopsis: This module provides a base class for boundary forcings that are
+       stored as a Function and evaluated for all boundary degrees of freedom
+       at once.
+"""
+
+import os.path
+import hashlib
+import numpy
+import dolfin
+from numpy.lib.format import open_memmap
+from dolfin_adjoint import Function
+from helpers import get_rank, mesh_signature
+
+__all__ = ["BoundaryForcing", "ExpressionBoundaryForcing"]
+
+
+def boundary_dofs(V, facet_ids, boundary_ids):
+    """ Returns the local degrees of freedom of V on the given boundaries and
+    their coordinates.
+
+    :param V: A scalar function space.
+    :param facet_ids: The facet markers of the mesh.
+    :param boundary_ids: A list of facet ids.
+    :returns: (numpy.ndarray, numpy.ndarray) -- the dof indices and a
+        (n, 2) array with their coordinates.
+    """
+    if V.ufl_element().family() == "Discontinuous Lagrange":
+        method = "geometric"
+    else:
+        method = "topological"
+
+    dofs = set()
+    for boundary_id in boundary_ids:
+        bc = dolfin.DirichletBC(V, dolfin.Constant(0), facet_ids, boundary_id,
+                                method=method)
+        dofs.update(bc.get_boundary_values().keys())
+
+    # Only keep the dofs owned by this process
+    first, last = V.dofmap().ownership_range()
+    dofs = numpy.array(sorted(dofs), dtype=int)
+    dofs = dofs[dofs < last - first]
+
+    gdim = V.mesh().geometry().dim()
+    coordinates = V.tabulate_dof_coordinates().reshape(-1, gdim)[dofs]
+
+    return dofs, coordinates
+
+
+class _ForcingCache(object):
+    """ Stores the boundary forcing values of a list of times in a memory
+    mapped numpy array on disk. Rows are filled when they are first computed.
+    """
+
+    def __init__(self, filename, times, ndofs):
+        self.times = numpy.asarray(times, dtype=float)
+        flags_filename = filename[:-len(".npy")] + "_filled.npy"
+
+        shape = (len(self.times), ndofs)
+        if os.path.exists(filename) and os.path.exists(flags_filename):
+            self.values = open_memmap(filename, mode="r+")
+            self.filled = open_memmap(flags_filename, mode="r+")
+            if self.values.shape != shape:
+                raise ValueError("The forcing cache %s does not match the "
+                                 "forcing." % filename)
+        else:
+            self.values = open_memmap(filename, mode="w+", dtype=float,
+                                      shape=shape)
+            self.filled = open_memmap(flags_filename, mode="w+",
+                                      dtype=numpy.bool_,
+                                      shape=(len(self.times),))
+
+    def index(self, t):
+        """ Returns the row of time t or None if t is not cached. """
+        i = numpy.searchsorted(self.times, t)
+        for j in (i - 1, i):
+            if (0 <= j < len(self.times) and
+                abs(self.times[j] - t) <= 1e-8 * max(1., abs(t))):
+                return j
+        return None
+
+    def get(self, t):
+        i = self.index(t)
+        if i is not None and self.filled[i]:
+            return numpy.array(self.values[i])
+        return None
+
+    def set(self, t, values):
+        i = self.index(t)
+        if i is not None:
+            self.values[i] = values
+            self.values.flush()
+            self.filled[i] = True
+            self.filled.flush()
+
+
+class BoundaryForcing(Function):
+    """ A Function that holds the forcing values on a part of the boundary.
+
+    Subclasses implement :meth:`evaluate`, which returns the forcing values at
+    all boundary degrees of freedom (:attr:`coordinates`) for a given time.
+    Setting :attr:`t` writes these values into the Function, so that a
+    BoundaryForcing can be used in a
+    :class:`opentidalfarm.BoundaryConditionSet` in place of an Expression with
+    a time attribute. The Function is zero away from the forced boundaries.
+
+    :param V: The scalar function space of the forcing, e.g. the free-surface
+        function space.
+    :param facet_ids: The facet markers of the mesh, e.g.
+        :attr:`domain.facet_ids`.
+    :param boundary_ids: The ids of the forced boundaries.
+    :type boundary_ids: list
+
+    With :meth:`use_cache`, the values of a fixed list of times are stored on
+    disk when they are first evaluated, so that repeated forward runs (e.g.
+    in an optimisation) do not evaluate the forcing again.
+    """
+
+    def __init__(self, V, facet_ids, boundary_ids):
+        Function.__init__(self, V)
+
+        self.dofs, self.coordinates = boundary_dofs(V, facet_ids,
+                                                    boundary_ids)
+        # The values are written into a Function that is not annotated and
+        # then assigned, so that each time level is recorded for the adjoint.
+        self._values = dolfin.Function(V)
+        self._t = None
+        self._cache = None
+
+    def evaluate(self, t):
+        """ Returns the forcing values at the boundary degrees of freedom.
+
+        :param t: The time.
+        :type t: float
+        :returns: numpy.ndarray -- one value per entry of :attr:`dofs`.
+        """
+        raise NotImplementedError("BoundaryForcing.evaluate needs to be "
+                                  "implemented by a subclass.")
+
+    def cache_key(self):
+        """ Returns a string that identifies the forcing parameters, used for
+        the name of the forcing cache. Subclasses that support caching
+        implement this. """
+        raise NotImplementedError("%s does not support caching." %
+                                  self.__class__.__name__)
+
+    def use_cache(self, times, cache_dir="forcing_cache"):
+        """ Stores the forcing values of the given times in a memory mapped
+        file in cache_dir. The file name depends on :meth:`cache_key`, the
+        mesh, the process number and the times, so an existing cache is reused
+        if all of these match.
+
+        :param times: The times at which the forcing will be evaluated, e.g.
+            the timesteps of the simulation.
+        :type times: list
+        :param cache_dir: The directory of the cache files.
+        :type cache_dir: str
+        """
+        times = numpy.asarray(times, dtype=float)
+
+        sha = hashlib.sha1()
+        sha.update(self.__class__.__name__)
+        sha.update(self.cache_key())
+        sha.update(mesh_signature(self.function_space().mesh()))
+        sha.update(str(self.function_space().ufl_element()))
+        sha.update(numpy.ascontiguousarray(self.dofs).tostring())
+        sha.update(numpy.ascontiguousarray(self.coordinates).tostring())
+        sha.update(str(get_rank()))
+        sha.update(numpy.ascontiguousarray(times).tostring())
+
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Another process created the directory
+                pass
+
+        filename = os.path.join(cache_dir, "forcing_%s.npy" % sha.hexdigest())
+        dolfin.log(dolfin.INFO, "Using boundary forcing cache %s." % filename)
+        self._cache = _ForcingCache(filename, times, len(self.dofs))
+
+    def _get_t(self):
+        return self._t
+
+    def _set_t(self, t):
+        t = float(t)
+        if t == self._t:
+            return
+        self._t = t
+
+        if self._cache is not None:
+            forcing = self._cache.get(t)
+            if forcing is None:
+                forcing = self.evaluate(t)
+                self._cache.set(t, forcing)
+        else:
+            forcing = self.evaluate(t)
+
+        values = self._values.vector().get_local()
+        values[self.dofs] = forcing
+        self._values.vector().set_local(values)
+        self._values.vector().apply("insert")
+        self.assign(self._values)
+
+    t = property(_get_t, _set_t, doc="The current time. Setting it updates "
+                                     "the forcing values.")
+
+
+class ExpressionBoundaryForcing(BoundaryForcing):
+    """ A boundary forcing that evaluates an Expression with a time attribute
+    at the boundary degrees of freedom, e.g. a :class:`TidalForcing`.
+
+    The Expression is still evaluated point by point, so this is mainly useful
+    together with :meth:`use_cache`.
+
+    :param expression: The Expression.
+    :param key: A string that identifies the Expression parameters. Required
+        for caching.
+    :type key: str
+    """
+
+    def __init__(self, V, facet_ids, boundary_ids, expression, key=None):
+        BoundaryForcing.__init__(self, V, facet_ids, boundary_ids)
+        self.expression = expression
+        self.key = key
+
+    def cache_key(self):
+        if self.key is None:
+            raise ValueError("ExpressionBoundaryForcing requires a key to be "
+                             "cached.")
+        return self.key
+
+    def evaluate(self, t):
+        self.expression.t = t
+        value = numpy.zeros(1)
+        values = numpy.empty(len(self.dofs))
+        for i, x in enumerate(self.coordinates):
+            self.expression.eval(value, x)
+            values[i] = value[0]
+        return values
@@ -28,3 +28,46 @@ class Domain(object):
     def dx(self):
         """A :class:`dolfin.Measure` for the cell subdomains."""
         return self._dx
+
+    def refine(self, cell_markers=None):
+        """ Returns a refined copy of the domain. The facet and cell markers
+        are transferred to the refined mesh.
+
+        :param cell_markers: A boolean :class:`dolfin.CellFunction` that marks
+            the cells to be refined. If None, all cells are refined.
+        :returns: A domain of the same type with the refined mesh.
+        """
+        # The facet markers can only be transferred if the refinement
+        # stores the parent facets.
+        algorithm = parameters["refinement_algorithm"]
+        parameters["refinement_algorithm"] = "plaza_with_parent_facets"
+        try:
+            if cell_markers is None:
+                mesh = refine(self.mesh)
+            else:
+                mesh = refine(self.mesh, cell_markers)
+        finally:
+            parameters["refinement_algorithm"] = algorithm
+
+        domain = object.__new__(type(self))
+        domain._parent = self
+        domain.mesh = mesh
+        domain.facet_ids = adapt(self.facet_ids, mesh)
+        domain.cell_ids = adapt(self.cell_ids, mesh)
+        domain._ds = Measure('ds')(subdomain_data=domain.facet_ids)
+        domain._dx = Measure("dx")(subdomain_data=domain.cell_ids)
+
+        return domain
+
+    def coarsen(self):
+        """ Returns a coarser version of the domain, i.e. the domain from which
+        this domain was created with :meth:`refine`.
+
+        :raises: NotImplementedError if no coarser domain is known.
+        """
+        parent = getattr(self, "_parent", None)
+        if parent is None:
+            raise NotImplementedError("The domain cannot be coarsened "
+                    "automatically. Create it with refine() from a coarser "
+                    "domain.")
+        return parent
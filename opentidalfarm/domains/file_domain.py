@@ -4,39 +4,118 @@ from domain import Domain
 
 
 class FileDomain(Domain):
-    """ Create a domain from DOLFIN mesh files (.xml).
+    """ Create a domain from DOLFIN mesh files (.xml, .h5 or .xdmf).
 
-    :param mesh_file: The .xml file of the mesh.
+    :param mesh_file: The .xml, .h5 or .xdmf file of the mesh. A .h5 file
+        contains the mesh in the dataset "/mesh" and the markers in the
+        datasets "/facet_ids" and "/cell_ids" (see :meth:`write_hdf5`).
     :type mesh_file: str
-    :param facet_ids_file: The .xml file containing the facet ids of the mesh.
-        If None, the default is to `mesh_file` + "_facet_region.xml".
+    :param facet_ids_file: The .xml (or .xdmf) file containing the facet ids
+        of the mesh. If None, the default is to `mesh_file` +
+        "_facet_region.xml" (or "_facet_region.xdmf"). Ignored for .h5 files.
     :type facet_ids_file: str
-    :param cell_ids_file: The .xml file containing the cell ids of the mesh.
-        If None, the default is to `mesh_file` + "_physical_region.xml".
+    :param cell_ids_file: The .xml (or .xdmf) file containing the cell ids of
+        the mesh. If None, the default is to `mesh_file` +
+        "_physical_region.xml" (or "_physical_region.xdmf"). Ignored for .h5
+        files.
     :type cell_ids_file: str
+    :param cache: If True, an .xml mesh and its markers are converted to a
+        .h5 file next to the mesh file on first use, which is loaded instead
+        of the .xml files in later runs. Default: False
+    :type cache: bool
     """
 
-    def __init__(self, mesh_file, facet_ids_file=None, cell_ids_file=None):
+    def __init__(self, mesh_file, facet_ids_file=None, cell_ids_file=None,
+                 cache=False):
 
-        #: A :class:`dolfin.Mesh` containing the mesh.
-        self.mesh = dolfin.Mesh(mesh_file)
+        basename, ext = os.path.splitext(mesh_file)
+        if ext == ".xdmf":
+            default_ext = ".xdmf"
+        else:
+            default_ext = ".xml"
 
         # Read facet markers
         if facet_ids_file is None:
-            facet_ids_file = (os.path.splitext(mesh_file)[0] +
-                              "_facet_region.xml")
+            facet_ids_file = basename + "_facet_region" + default_ext
 
         # Read cell markers
         if cell_ids_file is None:
-            cell_ids_file = (os.path.splitext(mesh_file)[0] +
-                            "_physical_region.xml")
+            cell_ids_file = basename + "_physical_region" + default_ext
+
+        if ext == ".h5":
+            self._read_hdf5(mesh_file)
+        elif ext == ".xdmf":
+            self._read_xdmf(mesh_file, facet_ids_file, cell_ids_file)
+        else:
+            cache_file = basename + ".h5"
+            input_files = [mesh_file, facet_ids_file, cell_ids_file]
+            if cache and self._is_up_to_date(cache_file, input_files):
+                dolfin.log(dolfin.INFO, "Loading cached mesh %s." % cache_file)
+                self._read_hdf5(cache_file)
+            else:
+                self._read_xml(mesh_file, facet_ids_file, cell_ids_file)
+                if cache:
+                    dolfin.log(dolfin.INFO, "Caching mesh in %s." % cache_file)
+                    self.write_hdf5(cache_file)
 
-        #: A :class:`dolfin.FacetFunction` containing the surface markers.
-        self.facet_ids = dolfin.MeshFunction("size_t", self.mesh, facet_ids_file)
         #: A :class:`dolfin.Measure` for the facet parts.
         self._ds = dolfin.Measure('ds')(subdomain_data=self.facet_ids)
+        #: A :class:`dolfin.Measure` for the cell subdomains.
+        self._dx = dolfin.Measure("dx")(subdomain_data=self.cell_ids)
+
+    @staticmethod
+    def _is_up_to_date(cache_file, input_files):
+        if not os.path.exists(cache_file):
+            return False
+        mtime = os.path.getmtime(cache_file)
+        return all(os.path.getmtime(f) <= mtime for f in input_files)
 
+    def _read_xml(self, mesh_file, facet_ids_file, cell_ids_file):
+        #: A :class:`dolfin.Mesh` containing the mesh.
+        self.mesh = dolfin.Mesh(mesh_file)
+        #: A :class:`dolfin.FacetFunction` containing the surface markers.
+        self.facet_ids = dolfin.MeshFunction("size_t", self.mesh, facet_ids_file)
         #: A :class:`dolfin.CellFunction` containing the area markers.
         self.cell_ids = dolfin.MeshFunction("size_t", self.mesh, cell_ids_file)
-        #: A :class:`dolfin.Measure` for the cell subdomains.
-        self._dx = dolfin.Measure("dx")(subdomain_data=self.cell_ids)
+
+    def _read_xdmf(self, mesh_file, facet_ids_file, cell_ids_file):
+        comm = dolfin.mpi_comm_world()
+        self.mesh = dolfin.Mesh()
+        dolfin.XDMFFile(comm, mesh_file).read(self.mesh)
+
+        dim = self.mesh.topology().dim()
+        self.facet_ids = dolfin.MeshFunction("size_t", self.mesh, dim - 1)
+        dolfin.XDMFFile(comm, facet_ids_file).read(self.facet_ids)
+        self.cell_ids = dolfin.MeshFunction("size_t", self.mesh, dim)
+        dolfin.XDMFFile(comm, cell_ids_file).read(self.cell_ids)
+
+    def _read_hdf5(self, mesh_file):
+        f = dolfin.HDF5File(dolfin.mpi_comm_world(), mesh_file, "r")
+        self.mesh = dolfin.Mesh()
+        f.read(self.mesh, "/mesh", False)
+
+        dim = self.mesh.topology().dim()
+        self.facet_ids = dolfin.MeshFunction("size_t", self.mesh, dim - 1)
+        self.cell_ids = dolfin.MeshFunction("size_t", self.mesh, dim)
+        for name, markers in [("/facet_ids", self.facet_ids),
+                              ("/cell_ids", self.cell_ids)]:
+            if f.has_dataset(name):
+                f.read(markers, name)
+            else:
+                dolfin.log(dolfin.WARNING, "%s does not contain %s, setting "
+                           "all markers to 0." % (mesh_file, name))
+                markers.set_all(0)
+        f.close()
+
+    def write_hdf5(self, filename):
+        """ Writes the mesh and the markers to a .h5 file that can be loaded
+        with FileDomain.
+
+        :param filename: The .h5 filename.
+        :type filename: str
+        """
+        f = dolfin.HDF5File(self.mesh.mpi_comm(), filename, "w")
+        f.write(self.mesh, "/mesh")
+        f.write(self.facet_ids, "/facet_ids")
+        f.write(self.cell_ids, "/cell_ids")
+        f.close()
@@ -22,6 +22,8 @@ class RectangularDomain(Domain):
 
 
     def __init__(self, x0, y0, x1, y1, nx, ny):
+        self._rectangle = (x0, y0, x1, y1, nx, ny)
+
         #: A :class:`dolfin.Mesh` containing the mesh.
         mpi_comm = dolfin.mpi_comm_world()
         self.mesh = dolfin.RectangleMesh(mpi_comm, dolfin.Point(x0, y0),
@@ -59,3 +61,13 @@ class RectangularDomain(Domain):
         self.cell_ids.set_all(0)
         #: A :class:`dolfin.Measure` for the cell cell_ids.
         self._dx = dolfin.Measure("dx")(subdomain_data=self.cell_ids)
+
+    def coarsen(self):
+        """ Returns a coarser version of the domain. This is the domain from
+        which this domain was refined, or else the same rectangle with half
+        the number of elements in each direction. """
+        if getattr(self, "_parent", None) is not None:
+            return self._parent
+
+        x0, y0, x1, y1, nx, ny = self._rectangle
+        return RectangularDomain(x0, y0, x1, y1, max(nx/2, 1), max(ny/2, 1))
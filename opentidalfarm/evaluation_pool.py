@@ -0,0 +1,154 @@
+"""
+.. module:: Evaluation pool
+   :synopsis: Evaluates a batch of control arrays of a reduced functional on a
+       pool of worker processes.
+"""
+
+import os
+import numpy
+import dolfin
+from dolfin import log, INFO
+from precompile import precompile_forms
+
+__all__ = ["EvaluationPool"]
+
+# The reduced functional of a worker process. It is set before the workers are
+# forked, so that each worker inherits the problem, the compiled forms and the
+# turbine cache of the parent process.
+_worker_rf = None
+
+
+def _initialise_worker():
+    """ Disables the output of the worker and gives it its own directory for
+    the checkpointing snapshots. """
+    rf = _worker_rf
+    rf.solver.parameters.dump_period = -1
+    if rf._snapshot_dir is not None:
+        rf._snapshot_dir = os.path.join(rf._snapshot_dir,
+                                        "worker_%i" % os.getpid())
+        if not os.path.exists(rf._snapshot_dir):
+            os.makedirs(rf._snapshot_dir)
+
+
+def _evaluate(args):
+    """ Computes the unscaled functional value, and optionally the gradient,
+    in a worker process. """
+    m, gradient = args
+    rf = _worker_rf
+    j = rf._compute_functional(m, annotate=gradient)
+    if gradient:
+        dj = rf._compute_gradient(m, forget=True)
+    else:
+        dj = None
+    return j, dj
+
+
+class EvaluationPool(object):
+    """ A pool of worker processes that evaluates a :class:`ReducedFunctional`
+    for many independent control arrays, e.g. for multi-start optimisations or
+    initial designs from :meth:`RectangularFarm.add_lhs_turbine_layout`.
+
+    The workers are forked from the current process, so each worker starts
+    with the problem, the compiled forms and the turbine cache of the reduced
+    functional. The results are stored in the memoisation caches of the
+    reduced functional, so that later calls to
+    :meth:`ReducedFunctional.evaluate` or
+    :meth:`ReducedFunctional.derivative` with the same controls do not solve
+    again.
+
+    .. code-block:: python
+
+        with EvaluationPool(rf) as pool:
+            js = pool.evaluate_batch(initial_layouts)
+
+    The workers do not write any output. The pool only works in serial,
+    since each worker is a serial process.
+
+    :param rf: The reduced functional.
+    :type rf: :class:`ReducedFunctional`
+    :param processes: The number of worker processes. Defaults to the number
+        of CPUs.
+    :type processes: int
+    :param precompile: Compile the forms before forking the workers, so that
+        the workers do not compile them again. Default: True
+    :type precompile: bool
+    :raises: ValueError
+    """
+
+    def __init__(self, rf, processes=None, precompile=True):
+        global _worker_rf
+
+        if dolfin.MPI.size(dolfin.mpi_comm_world()) > 1:
+            raise ValueError("The EvaluationPool does not work in parallel. "
+                             "Run the batch evaluation in serial.")
+
+        self.rf = rf
+        if precompile:
+            precompile_forms(rf.solver, rf.functional)
+
+        # Imported here, so that importing opentidalfarm stays fast
+        import multiprocessing
+
+        _worker_rf = rf
+        self._pool = multiprocessing.Pool(processes,
+                                          initializer=_initialise_worker)
+        self.processes = self._pool._processes
+
+    def evaluate_batch(self, ms, gradient=False):
+        """ Evaluates the reduced functional for a batch of control arrays.
+
+        Control arrays that are already in the memoisation caches are not
+        evaluated again.
+
+        :param ms: The control arrays.
+        :type ms: list of numpy.ndarray
+        :param gradient: Also compute the derivatives. Default: False
+        :type gradient: bool
+        :returns: list -- The (scaled) functional values as returned by
+            :meth:`ReducedFunctional.evaluate`, or a list of
+            (value, derivative) pairs if gradient is True.
+        """
+        rf = self.rf
+        ms = [numpy.array(m, dtype=float) for m in ms]
+
+        # The automatic scaling factor is computed from the first gradient.
+        scaling = (rf.parameters.automatic_scaling and
+                   rf._automatic_scaling_factor is None)
+
+        jobs = []
+        for i, m in enumerate(ms):
+            need_gradient = gradient or (scaling and i == 0)
+            if (not rf._compute_functional_mem.has_cache(m, annotate=True) or
+                (need_gradient and
+                 not rf._compute_gradient_mem.has_cache(m, True))):
+                jobs.append((m, need_gradient))
+
+        log(INFO, "Evaluating %i of %i control arrays on %i processes." %
+            (len(jobs), len(ms), self.processes))
+        results = self._pool.map(_evaluate, jobs, chunksize=1)
+
+        for (m, need_gradient), (j, dj) in zip(jobs, results):
+            rf._compute_functional_mem.insert(j, m, annotate=True)
+            if need_gradient:
+                # The gradient does not depend on the forget argument.
+                rf._compute_gradient_mem.insert(dj, m, True)
+                rf._compute_gradient_mem.insert(dj, m, False)
+
+        js = [rf.evaluate(m) for m in ms]
+        if not gradient:
+            return js
+
+        djs = [rf._dj(m, True, new_optimisation_iteration=False) for m in ms]
+        return zip(js, djs)
+
+    def close(self):
+        """ Stops the worker processes. """
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
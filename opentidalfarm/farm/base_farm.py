@@ -2,6 +2,7 @@ import numpy
 import dolfin
 import dolfin_adjoint
 from ..optimisation_helpers import MinimumDistanceConstraints
+from ..optimisation_helpers import MinimumDistanceConstraintsSparse
 from ..optimisation_helpers import MinimumDistanceConstraintsLargeArrays
 from ..turbine_cache import TurbineCache
 
@@ -26,6 +27,7 @@ class BaseFarm(object):
         self._set_turbine_specification(turbine)
 
         # The measure of the farm site
+        self.site_ids = site_ids
         self.site_dx = self.domain.dx(site_ids)
 
     def update(self):
@@ -364,16 +366,19 @@ class BaseFarm(object):
                                    "boundaries.")
 
 
-    def minimum_distance_constraints(self, large=False):
+    def minimum_distance_constraints(self, large=False, sparse=False):
         """Returns an instance of MinimumDistanceConstraints.
 
         :param bool large: Use a minimum distance implementation that is
             suitable for large farms (i.e. many turbines). Default: False
+        :param bool sparse: Use a neighbour list implementation with one
+            constraint per turbine. Default: False
         :returns: An instance of dolfin_adjoint.InequalityConstraint that
             enforces a minimum distance between turbines.
         :rtype: :py:class:`MinimumDistanceConstraints`
-            (if large=False) or :py:class:`MinimumDistanceConstraintsLargeArray`
-            (if large=True)
+            (if large=False and sparse=False),
+            :py:class:`MinimumDistanceConstraintsSparse` (if sparse=True) or
+            :py:class:`MinimumDistanceConstraintsLargeArray` (if large=True)
 
         """
         # Check we have some turbines.
@@ -381,11 +386,16 @@ class BaseFarm(object):
         if (n_turbines < 1):
             raise ValueError("Turbines must be deployed before minimum "
                              "distance constraints can be calculated.")
+        if large and sparse:
+            raise ValueError("Only one of large and sparse can be True.")
 
         controls = self._turbine_specification.controls
         minimum_distance = self._turbine_specification.minimum_distance
         positions = self.turbine_positions
         if large:
             return MinimumDistanceConstraintsLargeArrays(positions, minimum_distance, controls)
+        elif sparse:
+            return MinimumDistanceConstraintsSparse(positions, minimum_distance,
+                                                    controls)
         else:
             return MinimumDistanceConstraints(positions, minimum_distance, controls)
@@ -3,6 +3,7 @@ from dolfin_adjoint import Functional, ReducedFunctional
 from dolfin_adjoint import compute_gradient, enlisting, adj_reset
 from solvers import Solver
 from functionals import TimeIntegrator, PrototypeFunctional
+from profiling import profiler
 
 __all__ = ["FenicsReducedFunctional"]
 
@@ -16,11 +17,16 @@ class FenicsReducedFunctional(ReducedFunctional):
     :ivar functional: a :class:`PrototypeFunctional` class.
     :ivar controls: a (optionally list of) :class:`dolfin_adjoint.DolfinAdjointControl` object.
     :ivar solver: a :class:`Solver` object.
+    :ivar auxiliary_functionals: an optional dictionary of further
+        :class:`PrototypeFunctional` objects that are integrated in each
+        forward run, but are excluded from the adjoint. The values of the last
+        forward run are stored in the dictionary `auxiliary_values`.
 
     This class has a parameter attribute for further adjustments.
     """
 
-    def __init__(self, functional, controls, solver):
+    def __init__(self, functional, controls, solver,
+                 auxiliary_functionals=None):
 
         self.solver = solver
         if not isinstance(solver, Solver):
@@ -30,6 +36,12 @@ class FenicsReducedFunctional(ReducedFunctional):
         if not isinstance(functional, PrototypeFunctional):
             raise ValueError, "invalid functional argument."
 
+        self.auxiliary_functionals = auxiliary_functionals or {}
+        for aux in self.auxiliary_functionals.itervalues():
+            if not isinstance(aux, PrototypeFunctional):
+                raise ValueError, "invalid auxiliary functional argument."
+        self.auxiliary_values = {}
+
         # Hidden attributes
         self._solver_params = solver.parameters
         self._problem_params = solver.problem.parameters
@@ -69,13 +81,16 @@ class FenicsReducedFunctional(ReducedFunctional):
         final_only = (not self.solver.problem._is_transient or
                       self._problem_params.functional_final_time_only)
         self.time_integrator = TimeIntegrator(self.solver.problem,
-                                              self._functional, final_only)
+                                              self._functional, final_only,
+                                              self.auxiliary_functionals)
 
-        for sol in self.solver.solve(annotate=annotate):
-            self.time_integrator.add(sol["time"], sol["state"], sol["tf"],
-                                     sol["is_final"])
+        with profiler.phase("forward_solve"):
+            for sol in self.solver.solve(annotate=annotate):
+                self.time_integrator.add(sol["time"], sol["state"], sol["tf"],
+                                         sol["is_final"])
 
         j = self.time_integrator.integrate()
+        self.auxiliary_values = self.time_integrator.integrate_auxiliary()
 
         timer.stop()
 
@@ -119,8 +134,24 @@ class FenicsReducedFunctional(ReducedFunctional):
         if not hasattr(self, "time_integrator"):
             self.evaluate()
         self.functional = self.time_integrator.dolfin_adjoint_functional(self.solver.state)
-        dj = compute_gradient(self.functional, self.controls, forget=forget, **kwargs)
-        parameters["adjoint"]["stop_annotating"] = False
+
+        farm = self.solver.problem.parameters.tidal_farm
+        if (self.solver.steady_adjoint_available() and farm is not None and
+            not kwargs.get("project", False) and
+            all(c.coeff is farm.friction_function for c in self.controls)):
+            # Steady fast path: one transpose solve with the factorisation of
+            # the forward Newton solve
+            with profiler.phase("adjoint_solve"):
+                djdtf = self.solver.steady_adjoint_friction_gradient(
+                    self._functional)
+            dj = [djdtf for c in self.controls]
+            if forget:
+                adj_reset()
+        else:
+            with profiler.phase("adjoint_solve"):
+                dj = compute_gradient(self.functional, self.controls,
+                                      forget=forget, **kwargs)
+            parameters["adjoint"]["stop_annotating"] = False
 
         log(INFO, "Runtime: " + str(timer.stop()) + " s")
 
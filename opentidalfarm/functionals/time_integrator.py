@@ -2,32 +2,62 @@ import numpy
 from dolfin import *
 from dolfin_adjoint import *
 from ..problems import MultiSteadySWProblem
+from ..profiling import profiler
 
 
 class TimeIntegrator(object):
-
-    def __init__(self, problem, functional, final_only):
+    """ Integrates a functional over the timesteps of a forward run.
+
+    :param problem: The problem.
+    :param functional: The :class:`PrototypeFunctional` to integrate.
+    :param final_only: Only evaluate the functional at the final time.
+    :param auxiliary_functionals: A dictionary of further functionals, e.g.
+        {"cost": CostFunctional(problem)}, that are evaluated at the same
+        timesteps, for example for reporting. They are not part of the
+        dolfin-adjoint functional. Default: None
+    """
+
+    def __init__(self, problem, functional, final_only,
+                 auxiliary_functionals=None):
         self.problem = problem
         self.functional = functional
         self.final_only = final_only
+        self.auxiliary_functionals = auxiliary_functionals or {}
 
         self.vals = []
         self.times = []
+        self.auxiliary_vals = dict((name, []) for name in
+                                   self.auxiliary_functionals)
 
     def add(self, time, state, tf, is_final):
         if not self.final_only or (self.final_only and is_final):
-            val = assemble(self.functional.Jt(state, tf))
+            with profiler.phase("functional_assembly"):
+                val = assemble(self.functional.Jt(state, tf))
+                for name, functional in self.auxiliary_functionals.iteritems():
+                    self.auxiliary_vals[name].append(
+                        assemble(functional.Jt(state, tf)))
             self.vals.append(val)
             self.times.append(time)
 
     def integrate(self):
         """ Integrats the functional with a second order scheme. """
+        return self._integrate(self.vals)
+
+    def integrate_auxiliary(self):
+        """ Integrates the auxiliary functionals with the same scheme as
+        :meth:`integrate`.
+
+        :returns: dict -- The integrated value of each auxiliary functional.
+        """
+        return dict((name, float(self._integrate(vals)))
+                    for name, vals in self.auxiliary_vals.iteritems())
 
-        if len(self.vals) == 0:
+    def _integrate(self, vals):
+        if len(vals) == 0:
             raise ValueError("Cannot integrate empty set.")
 
         if self.final_only:
-            return self.vals[-1]
+            return vals[-1]
 
         # FIXME: Don't assume constant timesteps
         dt = self.times[1]-self.times[0]
@@ -45,7 +75,7 @@ class TimeIntegrator(object):
             w[0] = 0.5
         w[-1] += 0.5
 
-        return sum(w * dt * self.vals)
+        return sum(w * dt * vals)
 
     def dolfin_adjoint_functional(self, state):
         """ Constructs the dolfin-adjoint.Functional """
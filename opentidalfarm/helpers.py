@@ -1,10 +1,11 @@
 import random
-import yaml
+import hashlib
 import os.path
 import dolfin
 import numpy
 from dolfin import *
 from dolfin_adjoint import *
+from profiling import profiled
 
 
 def norm_approx(u, alpha=1e-4):
@@ -44,12 +45,18 @@ def get_rank():
 
 
 def test_gradient_array(J, dJ, x, seed=0.01, perturbation_direction=None,
-                        number_of_tests=5, plot_file=None):
+                        number_of_tests=5, plot_file=None, J_batch=None):
     '''Checks the correctness of the derivative dJ.
        x must be an array that specifies at which point in the parameter space
        the gradient is to be checked. The functions J(x) and dJ(x) must return
        the functional value and the functional derivative respectivaly.
 
+       The optional function J_batch(xs) must return the list of functional
+       values for a list of arrays, e.g. :meth:`EvaluationPool.evaluate_batch`.
+       If given, the unperturbed and perturbed functional values are
+       computed with one call of J_batch, so that they can be computed
+       concurrently.
+
        This function returns the order of convergence of the Taylor
        series remainder, which should be 2 if the gradient is correct.'''
 
@@ -59,8 +66,8 @@ def test_gradient_array(J, dJ, x, seed=0.01, perturbation_direction=None,
     log(INFO, "Running Taylor remainder convergence analysis to check the "
               "gradient... ")
 
-    # First run the problem unperturbed
-    j_direct = J(x)
+    if J_batch is None:
+        J_batch = lambda xs: [J(xx) for xx in xs]
 
     # Randomise the perturbation direction:
     if perturbation_direction is None:
@@ -70,16 +77,16 @@ def test_gradient_array(J, dJ, x, seed=0.01, perturbation_direction=None,
         for i in range(len(x)):
             perturbation_direction[i] = random.random()
 
-    # Run the forward problem for various perturbed initial conditions
-    functional_values = []
-    perturbations = []
+    # Run the forward problem unperturbed and for various perturbed initial
+    # conditions
     perturbation_sizes = [seed / (2 ** i) for i in range(number_of_tests)]
-    for perturbation_size in perturbation_sizes:
-        perturbation = perturbation_direction.copy() * perturbation_size
-        perturbations.append(perturbation)
+    perturbations = [perturbation_direction.copy() * perturbation_size
+                     for perturbation_size in perturbation_sizes]
+    perturbed_xs = [x.copy() + perturbation for perturbation in perturbations]
 
-        perturbed_x = x.copy() + perturbation
-        functional_values.append(J(perturbed_x))
+    values = J_batch([x] + perturbed_xs)
+    j_direct = values[0]
+    functional_values = values[1:]
 
     # First-order Taylor remainders (not using adjoint)
     no_gradient = [abs(perturbed_j - j_direct) for perturbed_j in
@@ -136,6 +143,7 @@ class StateWriter:
             solver.function_space.mesh())
         self.callback = callback
 
+    @profiled("output")
     def write(self, state):
         log(PROGRESS, "Projecting velocity and pressure to CG1 for visualisation")
         rhs = assemble(inner(self.v_out, state.split()[0]) * dx)
@@ -154,6 +162,15 @@ class StateWriter:
                             .tidal_farm.turbine_positions:
                 u_at_turbines.append((state[0](position)**2
                                       +state[1](position)**2)**0.5)
+
+            if self.solver.parameters.output_run_log:
+                self.solver.get_run_log().write(
+                    "abs_u_at_turbine_positions",
+                    optimisation_iteration=self.solver.optimisation_iteration,
+                    search_iteration=self.solver.search_iteration,
+                    timestep=self.timestep,
+                    values=u_at_turbines)
+            else:
                 dir = self.solver.get_optimisation_and_search_directory()
                 filename = os.path.join(dir, "abs_u_at_turb_pos_t_{}.txt"\
                                         .format(self.timestep))
@@ -226,6 +243,133 @@ def function_eval(func, point):
         return maxval
 
 
+def transfer_function(func, function_space):
+    ''' Interpolates a function onto a function space on a different mesh,
+        without annotating the interpolation. Points of the new mesh outside
+        the old mesh are extrapolated. Only works in serial. '''
+    func.set_allow_extrapolation(True)
+    return dolfin.interpolate(func, function_space)
+
+
+def mesh_signature(mesh):
+    ''' Returns a hash of the local mesh vertex coordinates and cells, which
+        identifies a mesh across runs. '''
+    sha = hashlib.sha1()
+    sha.update(numpy.ascontiguousarray(mesh.coordinates()).tostring())
+    sha.update(numpy.ascontiguousarray(mesh.cells()).tostring())
+    return sha.hexdigest()
+
+
+def revolve_repetitions(n_timesteps, snapshots):
+    """ The number of times that the revolve checkpointing algorithm
+    recomputes a forward timestep (at most), if it can store the given number
+    of snapshots. This is the smallest r with
+    :math:`\binom{s + r}{s} \geq n`.
+
+    :param n_timesteps: The number of timesteps.
+    :type n_timesteps: int
+    :param snapshots: The number of snapshots.
+    :type snapshots: int
+    :returns: int -- The repetition number.
+    """
+    r = 0
+    timesteps = 1   # binomial(snapshots + r, snapshots)
+    while timesteps < n_timesteps:
+        r += 1
+        timesteps = timesteps * (snapshots + r) // r
+    return r
+
+
+def revolve_parameters(n_timesteps, snapshot_size, ram_budget, use_disk=False,
+                       verbose=False):
+    """ Chooses the revolve checkpointing settings of the adjoint tape for a
+    memory budget.
+
+    As many snapshots as fit into the RAM budget are kept in memory. If
+    use_disk is True, further snapshots are stored on disk, so that each
+    forward timestep is recomputed at most twice during the adjoint run.
+
+    :param n_timesteps: The number of timesteps of the forward run.
+    :type n_timesteps: int
+    :param snapshot_size: The memory of one snapshot in bytes.
+    :type snapshot_size: int
+    :param ram_budget: The memory available for snapshots in bytes.
+    :type ram_budget: int
+    :param use_disk: Allow snapshots on disk. Default: False
+    :type use_disk: bool
+    :returns: The tuple (strategy, snaps_on_disk, snaps_in_ram, verbose) for
+        :func:`dolfin_adjoint.adj_checkpointing`, or None if all timesteps fit
+        into the budget and no checkpointing is needed.
+    :raises: ValueError if not even one snapshot fits into the budget.
+    """
+    snaps_in_ram = int(ram_budget // snapshot_size)
+    if snaps_in_ram >= n_timesteps:
+        return None
+    if snaps_in_ram < 1:
+        raise ValueError("The RAM budget of %i bytes is too small for a "
+                         "snapshot of %i bytes." % (ram_budget, snapshot_size))
+
+    snaps_on_disk = 0
+    if use_disk:
+        snaps = snaps_in_ram
+        while revolve_repetitions(n_timesteps, snaps) > 2:
+            snaps += 1
+        snaps_on_disk = snaps - snaps_in_ram
+
+    return ("multistage", snaps_on_disk, snaps_in_ram, verbose)
+
+
+class working_directory(object):
+    """ A context manager that changes the working directory and changes back
+    on exit. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.previous = os.getcwd()
+        if self.path is not None:
+            os.chdir(self.path)
+
+    def __exit__(self, *args):
+        os.chdir(self.previous)
+        return False
+
+
+class snapshot_directory(working_directory):
+    """ A context manager that changes into the directory in which libadjoint
+    writes its disk snapshots. The callback of the solver parameters is run in
+    the previous working directory, so that relative paths in user code are
+    not affected. If path is None, nothing is changed. """
+
+    def __init__(self, path, solver_params):
+        super(snapshot_directory, self).__init__(path)
+        self.solver_params = solver_params
+
+    def __enter__(self):
+        super(snapshot_directory, self).__enter__()
+        if self.path is None or not hasattr(self.solver_params, "callback"):
+            return
+
+        callback = self.solver_params.callback
+        previous = self.previous
+
+        def callback_in_previous_directory(sol):
+            with working_directory(previous):
+                return callback(sol)
+
+        self.callback = self.solver_params.__dict__.get("callback")
+        self.solver_params.callback = callback_in_previous_directory
+
+    def __exit__(self, *args):
+        if self.path is not None and hasattr(self.solver_params, "callback"):
+            if self.callback is None:
+                del self.solver_params.callback
+            else:
+                self.solver_params.callback = self.callback
+        return super(snapshot_directory, self).__exit__(*args)
+
+
 class FrozenClass(object):
     """ A class which can be (un-)frozen. If the class is frozen, no attributes
         can be added to the class. """
@@ -258,6 +402,8 @@ attribute." % (self, key))
             return str(attr)
 
     def __str__(self):
+        import yaml
+
         attrs = dir(self)
         attrs_dict = {}
 
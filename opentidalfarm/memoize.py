@@ -45,10 +45,12 @@ class MemoizeMutable:
         return h in self.memo
 
     # Insert a function value into the cache manually.
-    def __add__(self, value, *args, **kwds):
+    def insert(self, value, *args, **kwds):
         h = self.get_key(args, kwds)
         self.memo[h] = value
 
+    __add__ = insert
+
     @cpu0only
     def save_checkpoint(self, filename):
         def sig_save(sig, stack):
@@ -0,0 +1,137 @@
+"""
+.. module:: Multilevel optimisation
+   :synopsis: Optimises a farm on a hierarchy of meshes, from the coarsest to
+       the finest mesh.
+"""
+
+import numpy
+import dolfin_adjoint
+from dolfin import log, INFO
+from helpers import transfer_function
+from optimisation import minimize
+
+__all__ = ["domain_hierarchy", "multilevel_minimize", "multilevel_maximize"]
+
+
+def domain_hierarchy(domain, levels):
+    """ Returns a hierarchy of uniformly refined domains, starting with the
+    given (coarsest) domain.
+
+    :param domain: The coarsest domain, e.g. a :class:`RectangularDomain` or a
+        :class:`FileDomain`.
+    :param levels: The number of domains in the hierarchy.
+    :type levels: int
+    :returns: list -- The domains, from the coarsest to the finest.
+    """
+    domains = [domain]
+    for level in range(1, levels):
+        domains.append(domains[-1].refine())
+    return domains
+
+
+def _prolong_controls(m, coarse_rf, fine_rf):
+    """ Returns the control array m of the coarse reduced functional as
+    controls of the fine reduced functional. """
+    coarse_farm = coarse_rf.solver.problem.parameters.tidal_farm
+    fine_farm = fine_rf.solver.problem.parameters.tidal_farm
+
+    # The positions and frictions of discrete turbines do not depend on the
+    # mesh.
+    if not coarse_farm.turbine_specification.smeared:
+        return numpy.copy(m)
+
+    coarse_rf._update_turbine_farm(m)
+    tf = coarse_farm.friction_function
+    fine_space = fine_farm.friction_function.function_space()
+    fine_tf = transfer_function(tf, fine_space)
+    return dolfin_adjoint.optimization.get_global(fine_tf)
+
+
+def _prolong_state(coarse_rf, fine_rf):
+    """ Transfers the cached flow states of the coarse solver to the fine
+    solver, where they are used as the initial guesses of the Newton solver.
+    """
+    coarse_cache = getattr(coarse_rf.solver, "state_cache", None)
+    fine_cache = getattr(fine_rf.solver, "state_cache", None)
+    if not coarse_cache or fine_cache is None:
+        return
+
+    log(INFO, "Transfer %i cached states to the fine mesh." %
+        len(coarse_cache))
+    fine_space = fine_rf.solver.function_space
+    for t, state in coarse_cache.iteritems():
+        fine_cache[t] = transfer_function(state, fine_space)
+
+
+def multilevel_minimize(build_rf, domains, method="L-BFGS-B", tol=None,
+                        tol_factor=10., **kwargs):
+    """ Minimises a reduced functional on a hierarchy of meshes.
+
+    The optimisation starts on the coarsest mesh. The optimal controls of
+    each level are the initial controls of the next finer level, so that
+    the optimisation on the finest mesh needs only a few iterations. The
+    cached flow states of each level are interpolated onto the next finer
+    mesh as the initial guesses for the Newton solver (see
+    `cache_forward_state` in :class:`CoupledSWSolverParameters`).
+
+    .. code-block:: python
+
+        def build_rf(domain):
+            ...
+            return ReducedFunctional(functional, control, solver, rf_params)
+
+        domains = domain_hierarchy(RectangularDomain(0, 0, 640, 320, 20, 10), 3)
+        m, rf = multilevel_maximize(build_rf, domains, bounds=[lb, ub],
+                                    tol=1e-6)
+
+    The controls of smeared turbine farms and the flow states are
+    interpolated between the levels, which requires a serial run.
+
+    :param build_rf: A function that creates the reduced functional for a
+        given domain.
+    :param domains: The domains, from the coarsest to the finest, e.g. from
+        :func:`domain_hierarchy` or a list of :class:`FileDomain` objects.
+    :param method: The optimisation method. Default: "L-BFGS-B"
+    :param tol: The optimisation tolerance on the finest level, or a list of
+        tolerances for each level. Default: None
+    :param tol_factor: If tol is a number, the tolerance of each level is
+        this factor larger than the one of the next finer level.
+        Default: 10
+    :param kwargs: Further arguments for :func:`minimize`, e.g. bounds,
+        scale and options. They are used on each level.
+    :returns: tuple -- the optimal control values and the reduced functional
+        on the finest mesh.
+    """
+    levels = len(domains)
+    if tol is None or numpy.isscalar(tol):
+        tols = [tol if tol is None else tol*tol_factor**(levels - 1 - level)
+                for level in range(levels)]
+    else:
+        tols = list(tol)
+        if len(tols) != levels:
+            raise ValueError("The number of tolerances must be equal to the "
+                             "number of levels.")
+
+    m = None
+    rf = None
+    for level, domain in enumerate(domains):
+        fine_rf = build_rf(domain)
+        if rf is not None:
+            m = _prolong_controls(m, rf, fine_rf)
+            fine_rf._update_turbine_farm(m)
+            _prolong_state(rf, fine_rf)
+        rf = fine_rf
+
+        log(INFO, "Multilevel optimisation on level %i of %i (tol=%s)." %
+            (level + 1, levels, tols[level]))
+        m = minimize(rf, method=method, tol=tols[level], **kwargs)
+
+    return m, rf
+
+
+def multilevel_maximize(build_rf, domains, method="L-BFGS-B", tol=None,
+                        tol_factor=10., scale=1.0, **kwargs):
+    """ Maximises a reduced functional on a hierarchy of meshes. The
+    arguments are the same as for :func:`multilevel_minimize`. """
+    return multilevel_minimize(build_rf, domains, method=method, tol=tol,
+                               tol_factor=tol_factor, scale=-scale, **kwargs)
@@ -0,0 +1,130 @@
+"""
+.. module:: Optimisation
+   :synopsis: Wrappers around the dolfin-adjoint optimisation drivers that
+       evaluate the functional value and its derivative in one combined
+       forward and adjoint run.
+"""
+
+import numpy
+import dolfin_adjoint
+from dolfin import log, INFO
+
+__all__ = ["minimize", "maximize"]
+
+# The scipy methods that accept the functional value and the gradient from one
+# combined function (jac=True).
+_fused_methods = ["L-BFGS-B", "TNC", "BFGS", "CG"]
+# The scipy methods that use Hessian actions (hessp).
+_newton_methods = ["Newton-CG", "trust-ncg"]
+
+
+def _serialise_bound(bound, n):
+    """ Converts one bound (a scalar, a Constant, or a list or array of them)
+    into a list of n floats. """
+    if bound is None:
+        return [None]*n
+    if isinstance(bound, (list, tuple, numpy.ndarray)):
+        values = [None if b is None else float(b) for b in bound]
+        if len(values) != n:
+            raise ValueError("The bounds must have the same length as the "
+                             "controls.")
+        return values
+    return [float(bound)]*n
+
+
+def _serialise_bounds(bounds, n):
+    """ Converts the [lower, upper] bounds (scalars, Constants or lists of
+    them, e.g. from :meth:`RectangularFarm.site_boundary_constraints`) into
+    the list of (lower, upper) pairs of floats expected by scipy. """
+    lb, ub = [_serialise_bound(b, n) for b in bounds]
+    return zip(lb, ub)
+
+
+def _uses_fused_evaluation(rf, method, kwargs):
+    # Controls with dolfin objects as data (e.g. the FunctionControls of a
+    # FenicsReducedFunctional) are updated by dolfin-adjoint only.
+    return (hasattr(rf, "value_and_derivative")
+            and method in _fused_methods + _newton_methods
+            and "constraints" not in kwargs
+            and not kwargs.get("project", False)
+            and all(isinstance(c.data(), numpy.ndarray)
+                    for c in rf.controls))
+
+
+def minimize(rf, method="L-BFGS-B", scale=1.0, **kwargs):
+    """ Minimises the reduced functional.
+
+    For reduced functionals with a ``value_and_derivative`` method (such as
+    :class:`ReducedFunctional`) and the unconstrained scipy methods L-BFGS-B,
+    TNC, BFGS and CG, the functional value and its derivative are computed
+    together with one forward and one adjoint run per iteration. All other
+    cases, e.g. IPOPT, SLSQP, problems with constraints, controls that are
+    not numpy arrays or ``project=True``, are passed to
+    :func:`dolfin_adjoint.minimize`.
+
+    The bounds may be scalars, Constants or lists of them, as returned by
+    :meth:`RectangularFarm.site_boundary_constraints`.
+
+    The Newton-type methods Newton-CG and trust-ncg also use the Hessian
+    actions of :meth:`ReducedFunctional.hessian`. The annotation of the
+    forward run is kept for them, so each Hessian action costs one tangent
+    linear and one second order adjoint run. These methods do not support
+    bounds.
+
+    :param rf: The reduced functional.
+    :param method: The optimisation method. Default: "L-BFGS-B"
+    :param scale: A scaling factor for the functional. Default: 1.0
+    :param kwargs: Further arguments as accepted by
+        :func:`dolfin_adjoint.minimize`, e.g. bounds, tol and options.
+    :returns: numpy.ndarray -- the optimal control values. For the fused
+        evaluation this is the flat control array, and the turbine farm of a
+        :class:`ReducedFunctional` is updated to it. For a
+        :class:`TurbineFarmControl` this is the same as the control data that
+        :func:`dolfin_adjoint.minimize` returns.
+    """
+    if not _uses_fused_evaluation(rf, method, kwargs):
+        return dolfin_adjoint.minimize(rf, method=method, scale=scale,
+                                       **kwargs)
+
+    # Imported here, so that importing opentidalfarm stays fast
+    import scipy.optimize
+
+    forget = kwargs.pop("forget", True)
+    # project=False is the default of dolfin_adjoint.minimize
+    kwargs.pop("project", None)
+    bounds = kwargs.pop("bounds", None)
+
+    m = numpy.hstack([numpy.asarray(c.data(), dtype=float).flatten()
+                      for c in rf.controls])
+    if bounds is not None:
+        bounds = _serialise_bounds(bounds, len(m))
+
+    if method in _newton_methods:
+        if bounds is not None:
+            raise ValueError("The %s method does not support bounds." %
+                             method)
+        # The Hessian actions reuse the annotation of the forward run.
+        forget = False
+        kwargs["hessp"] = lambda m, m_dot: (
+            scale*numpy.asarray(rf.hessian(m, m_dot), dtype=float))
+    else:
+        kwargs["bounds"] = bounds
+
+    def fun(m):
+        j, dj = rf.value_and_derivative(m, forget=forget)
+        return scale*j, scale*numpy.asarray(dj, dtype=float)
+
+    log(INFO, "Start %s optimisation with fused functional and derivative "
+              "evaluations." % method)
+    res = scipy.optimize.minimize(fun, m, method=method, jac=True, **kwargs)
+    log(INFO, res.message)
+
+    if hasattr(rf, "_update_turbine_farm"):
+        rf._update_turbine_farm(res.x)
+    return res.x
+
+
+def maximize(rf, method="L-BFGS-B", scale=1.0, **kwargs):
+    """ Maximises the reduced functional. The arguments are the same as for
+    :func:`minimize`. """
+    return minimize(rf, method=method, scale=-scale, **kwargs)
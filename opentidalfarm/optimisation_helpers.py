@@ -5,9 +5,11 @@ from dolfin import Constant, log, INFO
 from helpers import function_eval
 from dolfin_adjoint import InequalityConstraint, EqualityConstraint
 
-__all__ = ["MinimumDistanceConstraints", "MinimumDistanceConstraintsLargeArrays",
+__all__ = ["MinimumDistanceConstraints", "MinimumDistanceConstraintsSparse",
+    "MinimumDistanceConstraintsLargeArrays",
     "friction_constraints", "get_domain_constraints", "position_constraints",
-    "get_distance_function", "ConvexPolygonSiteConstraint", "DomainRestrictionConstraints"]
+    "get_distance_function", "ConvexPolygonSiteConstraint", "PolygonSiteConstraint",
+    "DomainRestrictionConstraints"]
 
 def position_constraints(config):
     ''' This function returns the constraints to ensure that the turbine
@@ -45,6 +47,91 @@ def friction_constraints(config, lb=0.0, ub=None):
     return n * [Constant(lb)], n * [Constant(ub)]
 
 
+class _P1Probe(object):
+    ''' Evaluates a continuous piecewise linear function and its (cellwise
+    constant) gradient at many points at once.
+
+    The cell that contains each point is cached, so that only points that
+    moved into another cell require a bounding box tree search. Points outside
+    the local mesh get the value nan. In parallel, the values are combined with
+    one MPI reduction for all points. '''
+
+    def __init__(self, function):
+        mesh = function.function_space().mesh()
+        coordinates = mesh.coordinates()
+        cells = mesh.cells()
+
+        self.mesh = mesh
+        self.tree = mesh.bounding_box_tree()
+        self.cell_values = function.compute_vertex_values(mesh)[cells]
+
+        # Affine map from the physical to the barycentric coordinates
+        self.origins = coordinates[cells[:, 0]]
+        jacobians = numpy.dstack((coordinates[cells[:, 1]] - self.origins,
+                                  coordinates[cells[:, 2]] - self.origins))
+        self.inverse_jacobians = numpy.linalg.inv(jacobians)
+
+        # Gradients of the basis functions are constant per cell
+        dphi = self.inverse_jacobians
+        self.cell_gradients = (
+            (self.cell_values[:, 1:2] - self.cell_values[:, 0:1])*dphi[:, 0, :]
+          + (self.cell_values[:, 2:3] - self.cell_values[:, 0:1])*dphi[:, 1, :])
+
+        self._cells = numpy.zeros(0, dtype=int)
+
+    def _barycentric(self, cells, points):
+        local = numpy.einsum("nij,nj->ni", self.inverse_jacobians[cells],
+                             points - self.origins[cells])
+        return numpy.column_stack((1 - local.sum(axis=1), local))
+
+    def _locate(self, points):
+        ''' Returns the local cell index of each point, or -1 if the point is
+        not in the local mesh. '''
+        if len(self._cells) != len(points):
+            self._cells = -numpy.ones(len(points), dtype=int)
+
+        # Only search the points that left their cached cell
+        cells = self._cells
+        known = cells >= 0
+        inside = numpy.zeros(len(points), dtype=bool)
+        if known.any():
+            bary = self._barycentric(cells[known], points[known])
+            inside[known] = (bary >= -1e-12).all(axis=1)
+
+        num_cells = self.mesh.num_cells()
+        for i in numpy.where(~inside)[0]:
+            cell = self.tree.compute_first_entity_collision(
+                dolfin.Point(*points[i]))
+            cells[i] = cell if cell < num_cells else -1
+
+        return cells
+
+    def __call__(self, points):
+        ''' Returns the function values, shape (N,), and gradients,
+        shape (N, 2), at the points. '''
+        points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        cells = self._locate(points)
+        found = cells >= 0
+
+        values = -numpy.inf*numpy.ones(len(points))
+        gradients = -numpy.inf*numpy.ones((len(points), 2))
+        bary = self._barycentric(cells[found], points[found])
+        values[found] = (bary*self.cell_values[cells[found]]).sum(axis=1)
+        gradients[found] = self.cell_gradients[cells[found]]
+
+        # Combine the values of all processes
+        if dolfin.MPI.size(dolfin.mpi_comm_world()) > 1:
+            from mpi4py import MPI as pyMPI
+            buf = numpy.column_stack((values, gradients))
+            pyMPI.COMM_WORLD.Allreduce(pyMPI.IN_PLACE, buf, op=pyMPI.MAX)
+            values, gradients = buf[:, 0], buf[:, 1:]
+
+        outside = values == -numpy.inf
+        values[outside] = numpy.nan
+        gradients[outside] = numpy.nan
+        return values, gradients
+
+
 class DomainRestrictionConstraints(InequalityConstraint):
     def __init__(self, config, feasible_area, attraction_center):
         '''
@@ -53,11 +140,20 @@ class DomainRestrictionConstraints(InequalityConstraint):
         '''
         self.config = config
         self.feasible_area = feasible_area
+        self.attraction_center = numpy.asarray(attraction_center, dtype=float)
+
+        degree = feasible_area.function_space().ufl_element().degree()
+        if degree == 1:
+            # The feasible area and its gradient are evaluated at all turbines
+            # at once
+            self._probe = _P1Probe(feasible_area)
+            return
+
+        self._probe = None
 
         # Compute the gradient of the feasible area
         fs = dolfin.FunctionSpace(feasible_area.function_space().mesh(),
-                                  "DG",
-                                  feasible_area.function_space().ufl_element().degree() - 1)
+                                  "DG", degree - 1)
 
         feasible_area_grad = (dolfin.Function(fs),
                               dolfin.Function(fs))
@@ -71,91 +167,116 @@ class DomainRestrictionConstraints(InequalityConstraint):
                 dolfin.solve(form == 0, feasible_area_grad[i], solver_parameters={"newton_solver": {"linear_solver": "cg", "preconditioner": "amg"}})
         self.feasible_area_grad = feasible_area_grad
 
-        self.attraction_center = attraction_center
-
     def length(self):
         m_pos = self.config.params['turbine_pos']
         return len(m_pos)
 
-    def function(self, m):
-        ieqcons = []
+    def _positions(self, m):
         if len(self.config.params['controls']) == 2:
         # If the controls consists of the the friction and the positions, then we need to first extract the position part
             assert(len(m) % 3 == 0)
             m_pos = m[len(m) / 3:]
         else:
             m_pos = m
+        return numpy.reshape(numpy.asarray(m_pos, dtype=float), (-1, 2))
+
+    def _evaluate(self, positions):
+        ''' Returns the feasible area and its gradient at the turbine
+        positions. Turbines outside the domain are attracted to the attraction
+        center. '''
+        if self._probe is not None:
+            values, gradients = self._probe(positions)
+        else:
+            values = numpy.empty(len(positions))
+            gradients = numpy.empty((len(positions), 2))
+            for i, (x, y) in enumerate(positions):
+                try:
+                    values[i] = function_eval(self.feasible_area, (x, y))
+                    gradients[i, 0] = function_eval(self.feasible_area_grad[0], (x, y))
+                    gradients[i, 1] = function_eval(self.feasible_area_grad[1], (x, y))
+                except RuntimeError:
+                    values[i] = numpy.nan
+
+        outside = numpy.isnan(values)
+        if outside.any():
+            print "Warning: a turbine is outside the domain"
+            diff = positions[outside] - self.attraction_center
+            values[outside] = (diff ** 2).sum(axis=1)  # Point is outside domain
+            gradients[outside] = 2 * diff
+
+        return values, gradients
 
-        for i in range(len(m_pos) / 2):
-            x = m_pos[2 * i]
-            y = m_pos[2 * i + 1]
-            try:
-                ieqcons.append(function_eval(self.feasible_area, (x, y)))
-            except RuntimeError:
-                print "Warning: a turbine is outside the domain"
-                ieqcons.append((x - self.attraction_center[0]) ** 2 + (y - self.attraction_center[1]) ** 2)  # Point is outside domain
+    def function(self, m):
+        values, _ = self._evaluate(self._positions(m))
 
-        arr = -numpy.array(ieqcons)
+        arr = -values
         if any(arr <= 0):
           log(INFO, "Domain restriction inequality constraints (should be >= 0): %s" % arr)
         return arr
 
     def jacobian(self, m):
-        ieqcons = []
-        if len(self.config.params['controls']) == 2:
-        # If the controls consists of the the friction and the positions, then we need to first extract the position part
-            assert(len(m) % 3 == 0)
-            m_pos = m[len(m) / 3:]
-        else:
-            m_pos = m
+        positions = self._positions(m)
+        _, gradients = self._evaluate(positions)
 
-        for i in range(len(m_pos) / 2):
-            x = m_pos[2 * i]
-            y = m_pos[2 * i + 1]
-            primes = numpy.zeros(len(m))
-            try:
-                primes[2 * i] = function_eval(self.feasible_area_grad[0], (x, y))
-                primes[2 * i + 1] = function_eval(self.feasible_area_grad[1], (x, y))
+        ieqcons = numpy.zeros((len(positions), len(m)))
+        rows = numpy.arange(len(positions))
+        ieqcons[rows, 2 * rows] = gradients[:, 0]
+        ieqcons[rows, 2 * rows + 1] = gradients[:, 1]
 
-            except RuntimeError:
-                primes[2 * i] = 2 * (x - self.attraction_center[0])
-                primes[2 * i + 1] = 2 * (y - self.attraction_center[1])
-            ieqcons.append(primes)
-
-        return -numpy.array(ieqcons)
+        return -ieqcons
 
 def get_domain_constraints(config, feasible_area, attraction_center):
     return DomainRestrictionConstraints(config, feasible_area, attraction_center)
 
 def get_distance_function(config, domains):
-    V = dolfin.FunctionSpace(config.domain.mesh, "CG", 1)
+    ''' Returns the solution of a diffusion problem with a constant source term
+    that is zero in the feasible area, i.e. at the vertices of cells marked
+    with 1 in domains that are at least the turbine size away from any other
+    cell. The feasible vertices are found with mesh topology operations on the
+    cell markers. '''
+    mesh = config.domain.mesh
+    V = dolfin.FunctionSpace(mesh, "CG", 1)
     v = dolfin.TestFunction(V)
     d = dolfin.TrialFunction(V)
     sol = dolfin.Function(V)
     s = dolfin.interpolate(Constant(1.0), V)
-    domains_func = dolfin.Function(dolfin.FunctionSpace(config.domain.mesh, "DG", 0))
-    domains_func.vector().set_local(domains.array().astype(numpy.float))
-
-    def boundary(x):
-        eps_x = config.params["turbine_x"]
-        eps_y = config.params["turbine_y"]
-
-        min_val = 1
-        for e_x, e_y in [(-eps_x, 0), (eps_x, 0), (0, -eps_y), (0, eps_y)]:
-            try:
-                min_val = min(min_val, domains_func((x[0] + e_x, x[1] + e_y)))
-            except RuntimeError:
-                pass
-
-        return min_val == 1.0
 
-    bc = dolfin.DirichletBC(V, 0.0, boundary)
+    # Vertices of cells outside the feasible area
+    coordinates = mesh.coordinates()
+    infeasible = numpy.zeros(mesh.num_vertices(), dtype=bool)
+    infeasible[mesh.cells()[domains.array() != 1].flatten()] = True
+
+    # A vertex is in the feasible area if no infeasible vertex lies within
+    # the turbine extent around it
+    scale = numpy.array([config.params["turbine_x"], config.params["turbine_y"]],
+                        dtype=float)
+    feasible = ~infeasible
+    if infeasible.any():
+        from scipy.spatial import cKDTree
+        tree = cKDTree(coordinates[infeasible] / scale)
+        distance, _ = tree.query(coordinates[feasible] / scale,
+                                 distance_upper_bound=1.0)
+        feasible[feasible] = distance > 1.0
+
+    # Owned degrees of freedom of the feasible vertices
+    dofs = dolfin.vertex_to_dof_map(V)[feasible]
+    dofs = dofs[dofs < V.dofmap().ownership_range()[1] - V.dofmap().ownership_range()[0]]
 
     # Solve the diffusion problem with a constant source term
     log(INFO, "Solving diffusion problem to identify feasible area ...")
     a = dolfin.inner(dolfin.grad(d), dolfin.grad(v)) * dolfin.dx
     L = dolfin.inner(s, v) * dolfin.dx
-    dolfin.solve(a == L, sol, bc)
+    A = dolfin.assemble(a)
+    b = dolfin.assemble(L)
+
+    # Apply the homogeneous Dirichlet condition in the feasible area
+    A.ident_local(dofs.astype(numpy.intc))
+    b_local = b.get_local()
+    b_local[dofs] = 0.0
+    b.set_local(b_local)
+    b.apply("insert")
+
+    dolfin.solve(A, sol.vector(), b)
 
     return sol
 
@@ -200,15 +321,24 @@ class MinimumDistanceConstraints(InequalityConstraint):
         return sum([v**2 for v in x])
 
 
+    def _positions(self, m):
+        """Returns the turbine positions of m as a (N, 2) array and the offset
+        of the positions in the control vector."""
+        positions = numpy.reshape(numpy.asarray(m, dtype=float), (-1, 2))
+
+        # Need to add space for zeros for the friction
+        if self._controls.position and self._controls.friction:
+            friction_length = len(positions)
+        else:
+            friction_length = 0
+
+        return positions, friction_length
+
+
     def length(self):
         """Returns the number of constraints ``len(function(m))``."""
-        n_constraints = 0
-        for i in range(len(self._turbines)):
-          for j in range(len(self._turbines)):
-            if i <= j:
-              continue
-            n_constraints += 1
-        return n_constraints
+        n = len(self._turbines)/2
+        return n*(n-1)/2
 
 
     def function(self, m):
@@ -221,16 +351,13 @@ class MinimumDistanceConstraints(InequalityConstraint):
 
         """
         dolfin.log(dolfin.PROGRESS, "Calculating minimum distance constraints.")
-        inequality_constraints = []
-        for i in range(len(m)/2):
-            for j in range(len(m)/2):
-                if i <= j:
-                    continue
-                inequality_constraints.append(self._sl2norm([m[2*i]-m[2*j],
-                                                             m[2*i+1]-m[2*j+1]])
-                                              - self._minimum_distance**2)
-
-        inequality_constraints = numpy.array(inequality_constraints)
+        positions, _ = self._positions(m)
+        i, j = _turbine_pairs(len(positions))
+
+        diff = positions[i] - positions[j]
+        inequality_constraints = ((diff**2).sum(axis=1)
+                                  - self._minimum_distance**2)
+
         if any(inequality_constraints <= 0):
             dolfin.log(dolfin.WARNING,
                        "Minimum distance inequality constraints (should all "
@@ -252,33 +379,138 @@ class MinimumDistanceConstraints(InequalityConstraint):
         """
         dolfin.log(dolfin.PROGRESS, "Calculating the jacobian of minimum "
                    "distance constraints function.")
-        inequality_constraints = []
+        positions, friction_length = self._positions(m)
+        i, j = _turbine_pairs(len(positions))
+
+        diff = positions[i] - positions[j]
+        rows = numpy.arange(len(i))
+
+        # The control vector contains the friction coefficients first,
+        # so we need to shift here
+        p_ineq_c = numpy.zeros((len(i), friction_length + len(m)))
+        p_ineq_c[rows, friction_length+2*i] = 2*diff[:, 0]
+        p_ineq_c[rows, friction_length+2*j] = -2*diff[:, 0]
+        p_ineq_c[rows, friction_length+2*i+1] = 2*diff[:, 1]
+        p_ineq_c[rows, friction_length+2*j+1] = -2*diff[:, 1]
+
+        return p_ineq_c
+
+
+class MinimumDistanceConstraintsSparse(MinimumDistanceConstraints):
+    """This class implements minimum distance constraints between turbines
+    with a neighbour list and one constraint per turbine.
+
+    The constraint of the i'th turbine aggregates a smooth penalty over its
+    neighbours:
+
+    .. math::
 
-        for i in range(len(m)/2):
-            for j in range(len(m)/2):
-                if i <= j:
-                    continue
+        -\frac{1}{D^2} \sum_{j \ne i} \max(D^2 - ||p_i - p_j||^2, 0)^2 \ge 0
 
-                # Need to add space for zeros for the friction
-                if self._controls.position and self._controls.friction:
-                    prime_inequality_constraints = numpy.zeros(len(m)*3/2)
-                    friction_length = len(m)/2
-                else:
-                    prime_inequality_constraints = numpy.zeros(len(m))
-                    friction_length = 0
+    where D is the minimum distance. The penalty is continuously
+    differentiable, and only pairs that are closer than D contribute. These
+    pairs are found with a KD-tree, so that the cost per call is
+    :math:`O(N \log N)` for N turbines. The constraint vector has N entries
+    and the jacobian N rows with at most four nonzero entries per close pair,
+    i.e. the optimiser receives :math:`O(N)` constraints instead of the
+    :math:`N(N-1)/2` of :class:`MinimumDistanceConstraints`.
 
-                # Provide a shorter handle
-                p_ineq_c = prime_inequality_constraints
+    .. note:: As for :class:`MinimumDistanceConstraintsLargeArrays`, the
+        constraints are zero for all feasible turbine positions, and their
+        gradient only pushes turbines apart once they are too close.
 
-                # The control vector contains the friction coefficients first,
-                # so we need to shift here
-                p_ineq_c[friction_length+2*i] = 2*(m[2*i] - m[2*j])
-                p_ineq_c[friction_length+2*j] = -2*(m[2*i] - m[2*j])
-                p_ineq_c[friction_length+2*i+1] = 2*(m[2*i+1] - m[2*j+1])
-                p_ineq_c[friction_length+2*j+1] = -2*(m[2*i+1] - m[2*j+1])
-                inequality_constraints.append(p_ineq_c)
+    """
+    def length(self):
+        """Returns the number of constraints ``len(function(m))``."""
+        return len(self._turbines)/2
 
-        return numpy.array(inequality_constraints)
+
+    def _close_pairs(self, positions):
+        """Returns the index pairs (i, j), i > j, of all turbines that are
+        closer than the minimum distance and their position differences."""
+        i, j = _neighbour_pairs(positions, self._minimum_distance)
+        diff = positions[i] - positions[j]
+
+        # Remove pairs that the tree considers close due to round-off
+        close = (diff**2).sum(axis=1) < self._minimum_distance**2
+        return i[close], j[close], diff[close]
+
+
+    def function(self, m):
+        """Return an object which must be >=0 for the point to be feasible.
+
+        :param m: The serialized paramaterisation of the turbines.
+        :tpye m: numpy.ndarray.
+        :returns: numpy.ndarray -- the constraint of each turbine.
+
+        """
+        dolfin.log(dolfin.PROGRESS, "Calculating minimum distance constraints.")
+        positions, _ = self._positions(m)
+        i, j, diff = self._close_pairs(positions)
+
+        d2 = self._minimum_distance**2
+        penalty = (d2 - (diff**2).sum(axis=1))**2 / d2
+        inequality_constraints = -(numpy.bincount(i, penalty, len(positions)) +
+                                   numpy.bincount(j, penalty, len(positions)))
+
+        if len(i) > 0:
+            dolfin.log(dolfin.WARNING,
+                       "%i turbine pairs are closer than the minimum "
+                       "distance. Inequality constraints (should all be "
+                       ">= 0): %s" % (len(i), inequality_constraints))
+        return inequality_constraints
+
+
+    def jacobian(self, m):
+        """Returns the gradient of the constraint function.
+
+        :param m: The serialized paramaterisation of the turbines.
+        :tpye m: numpy.ndarray.
+        :returns: numpy.ndarray -- the gradient of the constraint function
+            with respect to each input parameter m.
+
+        """
+        dolfin.log(dolfin.PROGRESS, "Calculating the jacobian of minimum "
+                   "distance constraints function.")
+        positions, friction_length = self._positions(m)
+        i, j, diff = self._close_pairs(positions)
+
+        # d/dp_i of -(D^2 - |p_i - p_j|^2)^2/D^2
+        d2 = self._minimum_distance**2
+        factor = 4 * (d2 - (diff**2).sum(axis=1)) / d2
+        grad = factor[:, None] * diff
+
+        # Both rows i and j depend on p_i and p_j. The control vector contains
+        # the friction coefficients first, so we need to shift here
+        p_ineq_c = numpy.zeros((len(positions), friction_length + len(m)))
+        for row in (i, j):
+            for k in range(2):
+                numpy.add.at(p_ineq_c, (row, friction_length + 2*i + k),
+                             grad[:, k])
+                numpy.add.at(p_ineq_c, (row, friction_length + 2*j + k),
+                             -grad[:, k])
+
+        return p_ineq_c
+
+
+def _turbine_pairs(n):
+    """Returns the index pairs (i, j), i > j, of n turbines in the order
+    (1, 0), (2, 0), (2, 1), (3, 0), ..."""
+    return numpy.tril_indices(n, -1)
+
+
+def _neighbour_pairs(positions, radius):
+    """Returns the index pairs (i, j), i > j, of all turbines that are at most
+    radius apart, sorted in the order of :func:`_turbine_pairs`."""
+    from scipy.spatial import cKDTree
+
+    pairs = cKDTree(positions).query_pairs(radius)
+    pairs = numpy.array(list(pairs), dtype=int).reshape(-1, 2)
+
+    i = pairs.max(axis=1)
+    j = pairs.min(axis=1)
+    order = numpy.lexsort((j, i))
+    return i[order], j[order]
 
 
 class MinimumDistanceConstraintsLargeArrays(InequalityConstraint):
@@ -339,15 +571,30 @@ class MinimumDistanceConstraintsLargeArrays(InequalityConstraint):
 
 
     def _penalty(self, x_sq):
-        return min(0, x_sq - self._minimum_distance**2)
+        return numpy.minimum(0, x_sq - self._minimum_distance**2)
 
 
     def _dpenalty(self, x_sq):
         """ Returns the derivative of the penalty function """
-        if x_sq - self._minimum_distance**2 > 0:
-            return 0.0
-        else:
-            return 1.0
+        return (x_sq - self._minimum_distance**2 <= 0).astype(float)
+
+
+    def _close_pairs(self, m):
+        """Returns the index pairs (i, j), i > j, of all turbines that are
+        closer than the minimum distance, their position differences and
+        squared distances.
+
+        Only these pairs contribute to the penalty, and they are found with a
+        KD-tree instead of looping over all pairs."""
+        positions = numpy.reshape(numpy.asarray(m, dtype=float), (-1, 2))
+        i, j = _neighbour_pairs(positions, self._minimum_distance)
+
+        diff = positions[i] - positions[j]
+        dist_sq = (diff**2).sum(axis=1)
+
+        # Remove pairs that the tree considers close due to round-off
+        close = self._dpenalty(dist_sq) > 0
+        return i[close], j[close], diff[close], dist_sq[close]
 
 
     def function(self, m):
@@ -365,14 +612,8 @@ class MinimumDistanceConstraintsLargeArrays(InequalityConstraint):
             friction_length = len(m)/3
             m = m[friction_length:]
 
-        value = 0
-        for i in range(len(m)/2):
-            for j in range(len(m)/2):
-                if i <= j:
-                    continue
-                dist_sq = self._sl2norm([m[2*i]-m[2*j],
-                                         m[2*i+1]-m[2*j+1]])
-                value += self._penalty(dist_sq)
+        i, j, diff, dist_sq = self._close_pairs(m)
+        value = self._penalty(dist_sq).sum()
 
         if value <= 0:
             dolfin.log(dolfin.WARNING,
@@ -395,7 +636,6 @@ class MinimumDistanceConstraintsLargeArrays(InequalityConstraint):
         """
         dolfin.log(dolfin.PROGRESS, "Calculating the jacobian of minimum "
                    "distance constraints function.")
-        inequality_constraints = []
 
         if self._controls.position and self._controls.friction:
             friction_length = len(m)/3
@@ -403,33 +643,76 @@ class MinimumDistanceConstraintsLargeArrays(InequalityConstraint):
         else:
             friction_length = 0
 
-        p_ineq_c = numpy.zeros(friction_length + len(m))
-
-        for i in range(len(m)/2):
-            for j in range(len(m)/2):
-                if i <= j:
-                    continue
+        i, j, diff, dist_sq = self._close_pairs(m)
+        dvalue = 2*self._dpenalty(dist_sq)[:, numpy.newaxis]*diff
 
-                dist_sq = self._sl2norm([m[2*i]-m[2*j],
-                                         m[2*i+1]-m[2*j+1]])
-                dvalue = self._dpenalty(dist_sq)
+        # Accumulate the pair contributions for each turbine
+        dpositions = numpy.zeros((len(m)/2, 2))
+        numpy.add.at(dpositions, i, dvalue)
+        numpy.add.at(dpositions, j, -dvalue)
 
-                # The control vector contains the friction coefficients first,
-                # so we need to shift here
-                p_ineq_c[friction_length+2*i] += dvalue * 2*(m[2*i] - m[2*j])
-                p_ineq_c[friction_length+2*j] += dvalue * (-2*(m[2*i] - m[2*j]))
-                p_ineq_c[friction_length+2*i+1] += dvalue * 2*(m[2*i+1] - m[2*j+1])
-                p_ineq_c[friction_length+2*j+1] += dvalue * (-2*(m[2*i+1] - m[2*j+1]))
+        # The control vector contains the friction coefficients first,
+        # so we need to shift here
+        p_ineq_c = numpy.zeros(friction_length + len(m))
+        p_ineq_c[friction_length:] = dpositions.flatten()
 
         return numpy.array([p_ineq_c])
 
+def _site_positions(farm, m):
+    """ Returns the turbine positions in m as a (N, 2) array and the offset of
+    the positions in the control vector. """
+    controlled_by = farm.turbine_specification.controls
+    if (controlled_by.position and
+        (controlled_by.friction or controlled_by.dynamic_friction)):
+        # If the controls consists of the the friction and the positions, then
+        # we need to first extract the position part
+        assert(len(m) % 3 == 0)
+        m_pos = m[len(m) / 3:]
+        mf_len = len(m_pos) / 2
+    else:
+        m_pos = m
+        mf_len = 0
+
+    return numpy.reshape(numpy.asarray(m_pos, dtype=float), (-1, 2)), mf_len
+
+
+def _turbine_jacobian(gradients, mf_len, m_len, sparse):
+    """ Assembles the jacobian of constraints that each depend on the position
+    of one turbine only.
+
+    :param gradients: The gradients with respect to the turbine position,
+        shape (N, k, 2) for k constraints per turbine.
+    :returns: The (N*k, m_len) jacobian, either as numpy.ndarray or as
+        scipy.sparse.csr_matrix (if sparse=True).
+    """
+    n, k = gradients.shape[:2]
+    rows = numpy.arange(n*k)
+    cols = mf_len + 2*numpy.repeat(numpy.arange(n), k)
+    dx = gradients[:, :, 0].flatten()
+    dy = gradients[:, :, 1].flatten()
+
+    if sparse:
+        from scipy.sparse import csr_matrix
+        return csr_matrix((numpy.concatenate((dx, dy)),
+                           (numpy.concatenate((rows, rows)),
+                            numpy.concatenate((cols, cols+1)))),
+                          shape=(n*k, m_len))
+    else:
+        arr = numpy.zeros((n*k, m_len))
+        arr[rows, cols] = dx
+        arr[rows, cols+1] = dy
+        return arr
+
+
 class ConvexPolygonSiteConstraint(InequalityConstraint):
     ''' Generates the inequality constraints for generic polygon constraints.
     The parameter polygon must be a list of point coordinates that describes the
-    site edges in anti-clockwise order. '''
+    site edges in anti-clockwise order. If sparse is True, the jacobian is
+    returned as a scipy.sparse.csr_matrix. '''
 
-    def __init__(self, farm, vertices):
+    def __init__(self, farm, vertices, sparse=False):
         self.farm = farm
+        self.sparse = sparse
 
         V = numpy.array(vertices)
         assert len(V.shape) == 2
@@ -458,53 +741,162 @@ class ConvexPolygonSiteConstraint(InequalityConstraint):
         # our function is b - A*x.
 
     def length(self):
-        return len(self.config.params['turbine_pos']) * self.nvertices
+        return self.farm.number_of_turbines * self.nvertices
 
     def output_workspace(self):
         return numpy.array([0]*self.length())
 
     def function(self, m):
-        ieqcons = []
-        controlled_by = self.farm.turbine_specification.controls
-        if (controlled_by.position and
-            (controlled_by.friction or controlled_by.dynamic_friction)):
-        # If the controls consists of the the friction and the positions, then we need to first extract the position part
-            assert(len(m) % 3 == 0)
-            m_pos = m[len(m) / 3:]
-        else:
-            m_pos = m
+        positions, _ = _site_positions(self.farm, m)
 
-        for i in range(len(m_pos) / 2):
-            pos = numpy.array([m_pos[2 * i], m_pos[2 * i + 1]])
-            c = self.b - numpy.dot(self.A, pos)
-            ieqcons = ieqcons + list(c)
-
-        arr = numpy.array(ieqcons)
+        # One row per turbine, one column per edge
+        arr = (self.b - numpy.dot(positions, self.A.T)).flatten()
         if any(arr < 0):
           log(INFO, "Convex site position constraints (should be >= 0): %s" % arr)
         return arr
 
     def jacobian(self, m):
-        ieqcons = []
-        controlled_by = self.farm.turbine_specification.controls
-        if (controlled_by.position and
-            (controlled_by.friction or controlled_by.dynamic_friction)):
-            # If the controls consists of the the friction and the positions, then we need to first extract the position part
-            assert(len(m) % 3 == 0)
-            m_pos = m[len(m) / 3:]
-            mf_len = len(m_pos) / 2
-        else:
-            m_pos = m
-            mf_len = 0
-
-        for i in range(len(m_pos) / 2):
-            pos = numpy.array([m_pos[2 * i], m_pos[2 * i + 1]])
-            for constraint in range(self.nvertices):
-                d = -self.A[constraint, :]
-                prime = numpy.zeros(len(m))
-                prime[mf_len + 2 * i] = d[0]
-                prime[mf_len + 2 * i + 1] = d[1]
-                ieqcons.append(prime)
-
-        arr = numpy.array(ieqcons)
+        positions, mf_len = _site_positions(self.farm, m)
+
+        gradients = numpy.empty((len(positions), self.nvertices, 2))
+        gradients[:] = -self.A
+        return _turbine_jacobian(gradients, mf_len, len(m), self.sparse)
+
+
+class PolygonSiteConstraint(InequalityConstraint):
+    ''' Generates one inequality constraint per turbine that keeps the turbine
+    inside a site of arbitrary shape.
+
+    The site is given by one or more closed polygons. A point is inside the site
+    if it is inside an odd number of polygons, so holes are described by
+    polygons that lie inside another polygon. The polygons may be non-convex.
+
+    The signed distance to the site boundary (positive inside) is precomputed
+    on a regular grid that covers the site. The constraint of each turbine is
+    the bilinear interpolation of this grid, so the cost per call does not
+    depend on the number of polygon edges. Outside of the grid, the distance to
+    the grid is subtracted.
+
+    :param farm: The farm.
+    :param polygons: A list of polygons, each given as a list of vertex
+        coordinates.
+    :param resolution: The number of grid cells along the longer side of the
+        bounding box of the polygons. Default: 200
+    :type resolution: int
+    :param sparse: If True, the jacobian is returned as a
+        scipy.sparse.csr_matrix. Default: False
+    :type sparse: bool
+    '''
+
+    def __init__(self, farm, polygons, resolution=200, sparse=False):
+        self.farm = farm
+        self.sparse = sparse
+
+        edges = []
+        for polygon in polygons:
+            V = numpy.array(polygon, dtype=float)
+            assert len(V.shape) == 2
+            assert V.shape[1] == 2
+            edges.append(numpy.hstack((V, numpy.roll(V, -1, axis=0))))
+        edges = numpy.vstack(edges)
+
+        # The grid covers the bounding box of the polygons plus a margin of
+        # 10% on each side
+        lower = edges[:, :2].min(axis=0)
+        upper = edges[:, :2].max(axis=0)
+        margin = 0.1*(upper - lower).max()
+        lower -= margin
+        upper += margin
+
+        h = (upper - lower).max()/resolution
+        shape = numpy.ceil((upper - lower)/h).astype(int) + 1
+
+        self.lower = lower
+        self.h = h
+        self.shape = shape
+
+        x = lower[0] + h*numpy.arange(shape[0])
+        y = lower[1] + h*numpy.arange(shape[1])
+
+        log(INFO, "Computing signed distance grid with %i x %i points for "
+                  "%i polygon edges." % (shape[0], shape[1], len(edges)))
+        self.values = numpy.empty(shape)
+        for k in range(shape[0]):
+            points = numpy.column_stack((x[k]*numpy.ones(shape[1]), y))
+            self.values[k, :] = self._signed_distance(points, edges)
+
+    @staticmethod
+    def _signed_distance(points, edges):
+        """ Computes the signed distance of the points to the polygon edges,
+        positive inside. """
+        p = points[:, numpy.newaxis, :]
+        a = edges[numpy.newaxis, :, :2]
+        b = edges[numpy.newaxis, :, 2:]
+
+        # Distance to the closest point on each edge
+        ab = b - a
+        ab_sq = (ab**2).sum(axis=2)
+        ab_sq[ab_sq == 0] = 1.
+        t = numpy.clip(((p - a)*ab).sum(axis=2)/ab_sq, 0., 1.)
+        closest = a + t[:, :, numpy.newaxis]*ab
+        distance = numpy.sqrt(((p - closest)**2).sum(axis=2)).min(axis=1)
+
+        # Even-odd rule: count the edges that a ray in +x direction crosses
+        ay, by = a[:, :, 1], b[:, :, 1]
+        px, py = p[:, :, 0], p[:, :, 1]
+        straddles = (ay > py) != (by > py)
+        dy = numpy.where(straddles, by - ay, 1.)
+        x_cross = a[:, :, 0] + (py - ay)*ab[:, :, 0]/dy
+        crossings = (straddles & (px < x_cross)).sum(axis=1)
+
+        return numpy.where(crossings % 2 == 1, distance, -distance)
+
+    def _interpolate(self, positions):
+        """ Returns the signed distance at the positions and its gradient. """
+        # Points outside the grid are moved to the grid boundary
+        upper = self.lower + self.h*(self.shape - 1)
+        clamped = numpy.clip(positions, self.lower, upper)
+        outside = positions - clamped
+        outside_distance = numpy.sqrt((outside**2).sum(axis=1))
+
+        # Bilinear interpolation
+        xi = (clamped - self.lower)/self.h
+        ij = numpy.minimum(numpy.floor(xi).astype(int), self.shape - 2)
+        tx, ty = (xi - ij).T
+        i, j = ij.T
+
+        f00 = self.values[i, j]
+        f10 = self.values[i+1, j]
+        f01 = self.values[i, j+1]
+        f11 = self.values[i+1, j+1]
+
+        value = ((1-tx)*(1-ty)*f00 + tx*(1-ty)*f10 + (1-tx)*ty*f01
+                 + tx*ty*f11)
+        gradient = numpy.column_stack((
+            ((1-ty)*(f10-f00) + ty*(f11-f01))/self.h,
+            ((1-tx)*(f01-f00) + tx*(f11-f10))/self.h))
+
+        # Extrapolation outside the grid
+        gradient[outside != 0] = 0.
+        is_outside = outside_distance > 0
+        value[is_outside] -= outside_distance[is_outside]
+        gradient[is_outside] -= (outside[is_outside]
+                                 / outside_distance[is_outside, numpy.newaxis])
+
+        return value, gradient
+
+    def length(self):
+        return self.farm.number_of_turbines
+
+    def function(self, m):
+        positions, _ = _site_positions(self.farm, m)
+        arr, _ = self._interpolate(positions)
+        if any(arr < 0):
+            log(INFO, "Site position constraints (should be >= 0): %s" % arr)
         return arr
+
+    def jacobian(self, m):
+        positions, mf_len = _site_positions(self.farm, m)
+        _, gradient = self._interpolate(positions)
+        return _turbine_jacobian(gradient[:, numpy.newaxis, :], mf_len, len(m),
+                                 self.sparse)
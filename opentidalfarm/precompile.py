@@ -0,0 +1,103 @@
+"""
+.. module:: Precompile
+   :synopsis: This module compiles the forms of a solver ahead of time, so that
+       the first solve does not wait for the just-in-time compiler.
+"""
+
+import time
+import dolfin
+import ufl
+
+__all__ = ["precompile_forms"]
+
+
+def _compile(form):
+    """ Compiles a form with the current form compiler parameters, or loads
+    it from the JIT cache if it has been compiled before. Returns the time
+    this took. """
+    start = time.time()
+    dolfin.Form(form)
+    return time.time() - start
+
+
+def _adjoint_forms(forms):
+    """ Returns the adjoints of the bilinear forms, which are assembled by the
+    adjoint solves. """
+    adjoint_forms = []
+    for name, form in forms:
+        if len(form.arguments()) == 2:
+            adjoint_forms.append(("adjoint_" + name, ufl.adjoint(form)))
+    return adjoint_forms
+
+
+def precompile_forms(solver, functional=None):
+    """ Builds the forms of the solver and its adjoint and compiles them into
+    the JIT cache.
+
+    The forms are built by running the solver up to the first timestep, with
+    the annotation and the state output disabled. The main forms of the adjoint
+    model are derived from the forward forms: the adjoints of the bilinear
+    forms and, for the coupled solver, the derivative of the residual with
+    respect to the turbine friction. If a functional is given, the functional
+    and its derivatives with respect to the state and the turbine friction are
+    compiled as well.
+
+    The compiled forms are stored in the JIT cache of FEniCS. A later run with
+    the same problem setup loads them from the cache instead of compiling
+    them. It is best to run this in serial, once per installation, before
+    starting a parallel run.
+
+    :param solver: The solver, e.g. a :class:`CoupledSWSolver` or a
+        :class:`IPCSSWSolver`.
+    :param functional: The functional of the optimisation (optional), e.g. a
+        :class:`PowerFunctional`.
+    :returns: list -- a list of (name, compile time in seconds) tuples, one
+        per compiled form.
+    """
+
+    # Build the forms without recording them on the tape or writing output
+    stop_annotating = dolfin.parameters["adjoint"]["stop_annotating"]
+    dolfin.parameters["adjoint"]["stop_annotating"] = True
+    dump_period = getattr(solver.parameters, "dump_period", -1)
+    if dump_period > 0:
+        solver.parameters.dump_period = -1
+
+    try:
+        solutions = solver.solve(annotate=False)
+        result = next(solutions)
+        solutions.close()
+    finally:
+        dolfin.parameters["adjoint"]["stop_annotating"] = stop_annotating
+        if dump_period > 0:
+            solver.parameters.dump_period = dump_period
+
+    forms = sorted(solver.forms.items())
+    forms += _adjoint_forms(forms)
+
+    state = result.get("state")
+    tf = result.get("tf")
+    control = tf if isinstance(tf, dolfin.Function) else None
+
+    if "residual" in solver.forms and control is not None:
+        dFdm = dolfin.derivative(solver.forms["residual"], control)
+        forms.append(("adjoint_residual_friction_derivative",
+                      ufl.adjoint(dFdm)))
+
+    if functional is not None:
+        if state is None:
+            raise ValueError("The solver does not return the state, so the "
+                             "functional cannot be compiled.")
+        Jt = functional.Jt(state, tf)
+        forms.append(("functional", Jt))
+        forms.append(("functional_state_derivative",
+                      dolfin.derivative(Jt, state)))
+        if control is not None:
+            forms.append(("functional_friction_derivative",
+                          dolfin.derivative(Jt, control)))
+
+    timings = []
+    for name, form in forms:
+        dolfin.log(dolfin.INFO, "Compiling form %s." % name)
+        timings.append((name, _compile(form)))
+
+    return timings
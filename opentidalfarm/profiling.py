@@ -0,0 +1,197 @@
+"""
+.. module:: Profiling
+   :synopsis: This module records the wall time and the number of calls of the
+       phases of the forward and adjoint evaluations, such as assembly, solves,
+       turbine cache updates and output.
+"""
+
+import time
+import json
+import functools
+import dolfin
+
+__all__ = ["Profiler", "ProfileReport", "profiler"]
+
+
+class ProfileReport(object):
+    """ The wall times and call counts of the phases of one optimisation
+    iteration.
+
+    Phases can be nested, and the time of a phase includes the time of the
+    phases inside it. For example, "forward_solve" includes "newton_solve"
+    and "functional_assembly".
+
+    :ivar iteration: The optimisation iteration.
+    :ivar phases: A dictionary that maps the phase name to a dictionary with
+        the entries "time" (in seconds) and "calls".
+    """
+
+    def __init__(self, iteration, phases):
+        self.iteration = iteration
+        self.phases = phases
+
+    def time(self, name):
+        """ Returns the total wall time of a phase in seconds. """
+        return self.phases.get(name, {"time": 0.})["time"]
+
+    def calls(self, name):
+        """ Returns the number of calls of a phase. """
+        return self.phases.get(name, {"calls": 0})["calls"]
+
+    def to_dict(self):
+        return {"iteration": self.iteration, "phases": self.phases}
+
+    def __str__(self):
+        lines = ["Profile of optimisation iteration %s" % self.iteration,
+                 "%-30s %10s %8s" % ("phase", "time [s]", "calls")]
+        for name, phase in sorted(self.phases.iteritems(),
+                                  key=lambda item: -item[1]["time"]):
+            lines.append("%-30s %10.3f %8i" % (name, phase["time"],
+                                               phase["calls"]))
+        return "\n".join(lines)
+
+
+class _Phase(object):
+    """ A context manager that adds its wall time to a phase. """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, time.time() - self.start)
+        return False
+
+
+class _NoPhase(object):
+    """ A context manager that does nothing, used if the profiler is
+    disabled. """
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        return False
+
+_no_phase = _NoPhase()
+
+
+class Profiler(object):
+    """ Records the wall time and the number of calls of named phases.
+
+    The profiler is disabled by default, in which case :meth:`phase` returns a
+    context manager that does nothing. OpenTidalFarm uses the global instance
+    :data:`profiler`:
+
+    .. code-block:: python
+
+        profiler.enable("profile.jsonl")
+        maximize(rf)
+        for report in profiler.reports:
+            print report
+
+    The :class:`ReducedFunctional` calls :meth:`end_iteration` at the start of
+    each new optimisation iteration. Other drivers can call it themselves.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.filename = None
+        #: The list of :class:`ProfileReport` of the finished iterations.
+        self.reports = []
+        self._phases = {}
+        self._iteration = 0
+
+    def enable(self, filename=None):
+        """ Starts recording.
+
+        :param filename: If given, each :class:`ProfileReport` is appended as
+            one JSON line to this file (on the first process only).
+        :type filename: str
+        """
+        self.enabled = True
+        self.filename = filename
+
+    def disable(self):
+        """ Stops recording. """
+        self.enabled = False
+
+    def reset(self):
+        """ Removes all recorded data. """
+        self.reports = []
+        self._phases = {}
+        self._iteration = 0
+
+    def phase(self, name):
+        """ Returns a context manager that records the wall time of the
+        enclosed block as one call of the given phase.
+
+        :param name: The name of the phase, e.g. "newton_solve".
+        :type name: str
+        """
+        if not self.enabled:
+            return _no_phase
+        return _Phase(self, name)
+
+    def record(self, name, elapsed):
+        """ Adds one call with the given wall time to a phase. """
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = {"time": 0., "calls": 0}
+        phase["time"] += elapsed
+        phase["calls"] += 1
+
+    def current(self):
+        """ Returns a :class:`ProfileReport` of the iteration in progress. """
+        phases = dict((name, dict(phase))
+                      for name, phase in self._phases.iteritems())
+        return ProfileReport(self._iteration, phases)
+
+    def end_iteration(self, iteration=None):
+        """ Finishes the current iteration and starts a new one.
+
+        :param iteration: The number of the finished iteration. Defaults to
+            the number of calls to :meth:`end_iteration` so far.
+        :type iteration: int
+        :returns: :class:`ProfileReport` -- The report of the finished
+            iteration, or None if the profiler is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        report = self.current()
+        if iteration is not None:
+            report.iteration = iteration
+        self.reports.append(report)
+        self._phases = {}
+        self._iteration += 1
+
+        dolfin.log(dolfin.INFO, str(report))
+        if (self.filename is not None and
+            dolfin.MPI.rank(dolfin.mpi_comm_world()) == 0):
+            f = open(self.filename, "a")
+            f.write(json.dumps(report.to_dict()) + "\n")
+            f.close()
+
+        return report
+
+
+#: The :class:`Profiler` that is used by OpenTidalFarm.
+profiler = Profiler()
+
+
+def profiled(name):
+    """ A decorator that records each call of the function as a call of the
+    given phase of :data:`profiler`. """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with profiler.phase(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -6,8 +6,11 @@ import dolfin_adjoint
 from dolfin import *
 from dolfin_adjoint import *
 from solvers import Solver
+from problems import MultiSteadySWProblem
 from functionals import TimeIntegrator, PrototypeFunctional
 from memoize import MemoizeMutable
+from evaluation_pool import EvaluationPool
+from profiling import profiler, profiled
 from reduced_functional_prototype import ReducedFunctionalPrototype
 
 __all__ = ["ReducedFunctional", "ReducedFunctionalParameters",
@@ -46,11 +49,50 @@ class ReducedFunctional(ReducedFunctionalPrototype):
     :ivar controls: a :class:`TurbineFarmControl` or :class:`dolfin_adjoint.DolfinAdjointControl` class.
     :ivar solver: a :class:`Solver` object.
     :ivar parameters: a :class:`ReducedFunctionalParameters` object.
+    :ivar auxiliary_functionals: an optional dictionary of further
+        :class:`PrototypeFunctional` objects, e.g. {"cost":
+        CostFunctional(problem)}. They are integrated in each forward run,
+        but are not part of the optimisation objective and its adjoint. The
+        integrated values of the last forward run are stored in the
+        dictionary `auxiliary_values`, and in the run log.
 
     This class has a parameter attribute for further adjustments.
     """
 
-    def __init__(self, functional, controls, solver, parameters):
+    def __init__(self, functional, controls, solver, parameters,
+                 auxiliary_functionals=None):
+        self._init_state(functional, controls, solver, parameters,
+                         auxiliary_functionals)
+        self._init_outputs()
+
+        # Load checkpoints from file
+        if self.parameters.load_checkpoints:
+            self._load_checkpoint()
+
+    @classmethod
+    def _for_functional(cls, rf, functional):
+        """ Returns a :class:`ReducedFunctional` of another functional that
+        shares the solver, the controls, the auxiliary functionals and the
+        output files with rf.
+
+        Unlike the constructor, it does not reset the output files and keeps
+        the output writer of the solver. It has no scaling and no
+        checkpointing, since its functional differs from the one of rf. """
+        parameters = cls.default_parameters()
+        parameters.automatic_scaling = False
+
+        shared = cls.__new__(cls)
+        shared._init_state(functional, rf.controls, rf.solver, parameters,
+                           rf.auxiliary_functionals)
+        for name in ["turbine_file", "power_file"]:
+            if hasattr(rf, name):
+                setattr(shared, name, getattr(rf, name))
+        return shared
+
+    def _init_state(self, functional, controls, solver, parameters,
+                    auxiliary_functionals):
+        """ Initialises the attributes of the reduced functional, without any
+        output side effects. """
         # For consistency with the dolfin-adjoint API.
         self.scale = parameters.scale
         self.rf = self
@@ -62,6 +104,12 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         if not isinstance(functional, PrototypeFunctional):
             raise ValueError, "invalid functional argument."
 
+        self.auxiliary_functionals = auxiliary_functionals or {}
+        for aux in self.auxiliary_functionals.itervalues():
+            if not isinstance(aux, PrototypeFunctional):
+                raise ValueError, "invalid auxiliary functional argument."
+        self.auxiliary_values = {}
+
         # Create the default parameters
         self.parameters = parameters
 
@@ -70,6 +118,20 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         self._problem_params = solver.problem.parameters
         self._time_integrator = None
         self._automatic_scaling_factor = None
+        self._revolve_parameters = None
+
+        # libadjoint writes the disk snapshots into the working directory,
+        # which is changed to the snapshot directory during the forward and
+        # adjoint runs if disk snapshots are used (see _snapshot_directory).
+        # Hence the output directory must not be relative.
+        self._snapshot_dir = getattr(solver.parameters,
+                                     "adjoint_snapshot_dir", None)
+        if self._snapshot_dir is not None:
+            self._snapshot_dir = os.path.abspath(self._snapshot_dir)
+            solver.parameters.output_dir = os.path.abspath(
+                solver.parameters.output_dir)
+            if not os.path.exists(self._snapshot_dir):
+                os.makedirs(self._snapshot_dir)
 
         # For storing the friction function for each time step as one changing
         # function and not as multiple functions
@@ -84,6 +146,29 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         # Caching variables that store which controls the last forward run was
         # performed
         self.last_m = None
+        # The controls of the last forward run if its annotation is still
+        # available, and the gradient with respect to the turbine friction
+        # field of the last forward run. Both are required for Hessian
+        # actions.
+        self._tape_m = None
+        self._djdtf = None
+        self._second_derivative_terms = None
+
+        # dolfin-adjoint requires the ReducedFunctional to have a member
+        # variable `parameter` which must be a list comprising an instance of a
+        # class (here, TurbineFarmControl) which has a method named `data`
+        # which returns a numpy.ndarray of the parameters used for optimisation,
+        # e.g. the turbine frictions and positions.
+        if not hasattr(controls, "__getitem__"):
+            controls = [controls]
+        self.controls = controls
+
+        self._compute_functional_mem = MemoizeMutable(self._compute_functional)
+        self._compute_gradient_mem = MemoizeMutable(self._compute_gradient)
+
+    def _init_outputs(self):
+        """ Creates the output files and the output writer of the solver. """
+        solver = self.solver
         if self.solver.parameters.dump_period > 0:
             turbine_filename = os.path.join(solver.parameters.output_dir, "turbines.pvd")
             self.turbine_file = File(turbine_filename, "compressed")
@@ -93,7 +178,8 @@ class ReducedFunctional(ReducedFunctionalPrototype):
                 self.power_file = File(power_filename, "compressed")
 
             # Just to clean any 'j.txt' files from previous simulations.
-            if self._solver_params.output_j:
+            if (self._solver_params.output_j and
+                self._get_run_log() is None):
                 dir = os.path.join(self.solver.parameters.output_dir,
                                    "iter_{}".format(self.solver.optimisation_iteration))
                 if not os.path.exists(dir):
@@ -102,22 +188,6 @@ class ReducedFunctional(ReducedFunctionalPrototype):
                 j_file = open(filename, 'w')
                 j_file.close()
 
-        # dolfin-adjoint requires the ReducedFunctional to have a member
-        # variable `parameter` which must be a list comprising an instance of a
-        # class (here, TurbineFarmControl) which has a method named `data`
-        # which returns a numpy.ndarray of the parameters used for optimisation,
-        # e.g. the turbine frictions and positions.
-        if not hasattr(controls, "__getitem__"):
-            controls = [controls]
-        self.controls = controls
-
-        self._compute_functional_mem = MemoizeMutable(self._compute_functional)
-        self._compute_gradient_mem = MemoizeMutable(self._compute_gradient)
-
-        # Load checkpoints from file
-        if self.parameters.load_checkpoints:
-            self._load_checkpoint()
-
         if (self._solver_params.print_individual_turbine_power
             or ((self.solver.parameters.dump_period > 0)
             and self._solver_params.output_turbine_power)):
@@ -140,7 +210,9 @@ class ReducedFunctional(ReducedFunctionalPrototype):
 
         # If any of the parameters changed, the forward model needs to be re-run
         if self.last_m is None or numpy.any(m != self.last_m):
-            self._compute_functional(m, annotate=True)
+            j = self._compute_functional(m, annotate=True)
+            # Keep the functional value, so that it is not recomputed
+            self._compute_functional_mem.insert(j, m, annotate=True)
 
         J = self.time_integrator.dolfin_adjoint_functional(self.solver.state)
 
@@ -163,8 +235,24 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         else:
             parameters = FunctionControl("turbine_friction_cache")
 
-        djdtf = dolfin_adjoint.compute_gradient(J, parameters, forget=forget)
-        dolfin.parameters["adjoint"]["stop_annotating"] = False
+        if (self.solver.steady_adjoint_available() and
+            not farm.turbine_specification.controls.dynamic_friction):
+            # Steady fast path: one transpose solve with the factorisation of
+            # the forward Newton solve
+            with profiler.phase("adjoint_solve"):
+                djdtf = self.solver.steady_adjoint_friction_gradient(
+                    self.functional)
+            if forget:
+                adj_reset()
+        else:
+            with profiler.phase("adjoint_solve"), \
+                 self._snapshot_directory():
+                djdtf = dolfin_adjoint.compute_gradient(J, parameters,
+                                                        forget=forget)
+            dolfin.parameters["adjoint"]["stop_annotating"] = False
+        self._djdtf = djdtf
+        if forget:
+            self._tape_m = None
 
         # Decide if we need to apply the chain rule to get the gradient of
         # interest.
@@ -225,24 +313,31 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         """ Compute the functional of interest for the turbine positions/frictions array """
 
         self.last_m = m
+        self._tape_m = numpy.copy(m) if annotate else None
+        self._djdtf = None
+        self._second_derivative_terms = None
         self._update_turbine_farm(m)
         farm = self.solver.problem.parameters.tidal_farm
 
         # Configure dolfin-adjoint
         adj_reset()
-        dolfin.parameters["adjoint"]["record_all"] = True
-        self._set_revolve_parameters()
+        checkpointing = self._set_revolve_parameters()
+        dolfin.parameters["adjoint"]["record_all"] = not checkpointing
 
         # Solve the shallow water system and integrate the functional of
         # interest.
+        timer = dolfin.Timer("forward evaluation")
         final_only = (not self.solver.problem._is_transient or
                       self._problem_params.functional_final_time_only)
         self.time_integrator = TimeIntegrator(self.solver.problem, self.functional,
-                                              final_only)
+                                              final_only,
+                                              self.auxiliary_functionals)
 
-        for sol in self.solver.solve(annotate=annotate):
-            self.time_integrator.add(sol["time"], sol["state"], sol["tf"],
-                                     sol["is_final"])
+        with profiler.phase("forward_solve"), \
+             self._snapshot_directory():
+            for sol in self.solver.solve(annotate=annotate):
+                self.time_integrator.add(sol["time"], sol["state"], sol["tf"],
+                                         sol["is_final"])
 
         log(INFO, "Temporal breakdown of functional evaluation")
         log(INFO, "----------------------------------")
@@ -250,15 +345,37 @@ class ReducedFunctional(ReducedFunctionalPrototype):
             log(INFO, "Time: {} s\t Value: {}.".format(float(time), val))
         log(INFO, "----------------------------------")
 
-        if ((self.solver.parameters.dump_period > 0)
-            and self._solver_params.output_temporal_breakdown_of_j):
+        j = float(self.time_integrator.integrate())
+        self.auxiliary_values = self.time_integrator.integrate_auxiliary()
+        for name, value in sorted(self.auxiliary_values.iteritems()):
+            log(INFO, "Auxiliary functional {}: {}.".format(name, value))
+        runtime = timer.stop()
+
+        run_log = self._get_run_log()
+        if run_log is not None:
+            record = {"optimisation_iteration":
+                          self.solver.optimisation_iteration,
+                      "search_iteration": self.solver.search_iteration,
+                      "runtime": runtime}
+            if self._solver_params.output_j:
+                record["j"] = j
+            if self._solver_params.output_temporal_breakdown_of_j:
+                record["times"] = self.time_integrator.times
+                record["temporal_breakdown"] = self.time_integrator.vals
+            if self._solver_params.output_control_array:
+                record["m"] = numpy.array(m)
+            if self.auxiliary_values:
+                record["auxiliary"] = self.auxiliary_values
+            run_log.write("forward", **record)
+
+        elif ((self.solver.parameters.dump_period > 0)
+              and self._solver_params.output_temporal_breakdown_of_j):
             dir = self.solver.get_optimisation_and_search_directory()
             filename = os.path.join(dir, "temporal_breakdown_of_j.txt")
             numpy.savetxt(filename, self.time_integrator.vals)
 
-        j = float(self.time_integrator.integrate())
         if ((self.solver.parameters.dump_period > 0)
-            and self._solver_params.output_j):
+            and self._solver_params.output_j and run_log is None):
             dir = os.path.join(self.solver.parameters.output_dir,
                   "iter_{}".format(self.solver.optimisation_iteration))
             if not os.path.exists(dir):
@@ -272,20 +389,101 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         return j
 
 
-    def _set_revolve_parameters(self):
-        if (hasattr(self._solver_params, "revolve_parameters")
-            and self._solver_params.revolve_parameters is not None):
-          (strategy,
-           snaps_on_disk,
-           snaps_in_ram,
-           verbose) = self._farm.params['revolve_parameters']
-          adj_checkpointing(
-              strategy,
-              self._problem_params.finish_time/self._problem_params.dt,
-              snaps_on_disk=snaps_on_disk,
-              snaps_in_ram=snaps_in_ram,
-              verbose=verbose)
+    def _n_timesteps(self):
+        """ Returns the number of timesteps of the forward run. """
+        if hasattr(self._problem_params, "n_time_steps"):
+            return self._problem_params.n_time_steps
+        n = int(round(float(self._problem_params.finish_time -
+                            self._problem_params.start_time) /
+                      float(self._problem_params.dt)))
+        # The multi steady-state problem is also solved at the start time
+        if type(self.solver.problem) == MultiSteadySWProblem:
+            n += 1
+        return n
+
+    def _snapshot_size(self):
+        """ Returns an estimate of the memory of one checkpointing snapshot in
+        bytes: the state at two time levels and the turbine friction. """
+        if hasattr(self.solver, "function_space"):
+            state_spaces = [self.solver.function_space]
+        else:
+            state_spaces = [self.solver.V, self.solver.Q]
+
+        def local_size(V):
+            first, last = V.dofmap().ownership_range()
+            return last - first
+
+        size = 2 * sum(local_size(V) for V in state_spaces)
+        farm = self._problem_params.tidal_farm
+        if farm is not None:
+            size += local_size(farm._turbine_function_space)
+
+        return 8 * size
+
+    def _snapshot_directory(self):
+        """ Returns a context manager that changes into the snapshot directory
+        while libadjoint may write disk snapshots, i.e. only if the adjoint
+        checkpointing stores snapshots on disk. """
+        if self._revolve_parameters and self._revolve_parameters[1] > 0:
+            path = self._snapshot_dir
+        else:
+            path = None
+        return helpers.snapshot_directory(path, self._solver_params)
 
+    def _set_revolve_parameters(self):
+        """ Configures the checkpointing of the adjoint tape. Returns True if
+        the adjoint is computed with checkpointing. """
+        if self._revolve_parameters is None:
+            revolve_parameters = getattr(self._solver_params,
+                                         "revolve_parameters", None)
+            ram_budget = getattr(self._solver_params, "adjoint_ram_budget",
+                                 None)
+            if (revolve_parameters is None and ram_budget is not None and
+                self.solver.problem._is_transient):
+                revolve_parameters = helpers.revolve_parameters(
+                    self._n_timesteps(), self._snapshot_size(),
+                    ram_budget * 1024**2,
+                    use_disk=self._snapshot_dir is not None)
+
+                if revolve_parameters is None:
+                    log(INFO, "All timesteps fit into the adjoint RAM budget.")
+                else:
+                    strategy, snaps_on_disk, snaps_in_ram, _ = \
+                        revolve_parameters
+                    log(INFO, "Adjoint checkpointing with %i snapshots in "
+                        "RAM and %i on disk. Each timestep is recomputed at "
+                        "most %i times." % (snaps_in_ram, snaps_on_disk,
+                        helpers.revolve_repetitions(self._n_timesteps(),
+                            snaps_in_ram + snaps_on_disk)))
+
+            # False marks that no checkpointing is used
+            self._revolve_parameters = revolve_parameters or False
+
+        if not self._revolve_parameters:
+            return False
+
+        (strategy,
+         snaps_on_disk,
+         snaps_in_ram,
+         verbose) = self._revolve_parameters
+        adj_checkpointing(
+            strategy,
+            self._n_timesteps(),
+            snaps_on_disk=snaps_on_disk,
+            snaps_in_ram=snaps_in_ram,
+            verbose=verbose)
+        return True
+
+
+    def _get_run_log(self):
+        """ Returns the run log if the outputs are routed into it, otherwise
+        None. """
+        if (self.solver.parameters.dump_period > 0 and
+            hasattr(self._solver_params, "output_run_log") and
+            self._solver_params.output_run_log):
+            return self.solver.get_run_log()
+
+        return None
 
     def _update_turbine_farm(self, m):
         """ Update the turbine farm from the flattened parameter array m. """
@@ -315,6 +513,7 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         farm.update()
 
 
+    @profiled("checkpoint_io")
     def _save_checkpoint(self):
         """ Checkpoint the reduced functional from which can be used to restart
         the turbine optimisation. """
@@ -346,7 +545,8 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         self.last_j = j
 
         if ((self.solver.parameters.dump_period > 0)
-           and self.solver.parameters.output_control_array):
+           and self.solver.parameters.output_control_array
+           and self._get_run_log() is None):
             dir = self.solver.get_optimisation_and_search_directory()
             filename = os.path.join(dir, "control_array.txt")
             numpy.savetxt(filename, m)
@@ -367,6 +567,14 @@ class ReducedFunctional(ReducedFunctionalPrototype):
         timer = dolfin.Timer("dj evaluation")
         dj = self._compute_gradient_mem(m, forget)
 
+        run_log = self._get_run_log()
+        if run_log is not None:
+            run_log.write("adjoint",
+                          optimisation_iteration=
+                              self.solver.optimisation_iteration,
+                          dj_norm=numpy.linalg.norm(dj),
+                          runtime=timer.elapsed()[0])
+
         # We assume that the gradient is computed at and only at the beginning
         # of each new optimisation iteration. Hence, this is the right moment
         # to store the turbine friction field and to increment the optimisation
@@ -384,16 +592,19 @@ class ReducedFunctional(ReducedFunctionalPrototype):
                     dir = self.solver.get_optimisation_and_search_directory()
                     filename = os.path.join(dir, "turbine_friction.pvd")
                     friction_file = File(filename)
-                    for timestep in range(0,len(farm.friction_function)):
-                        self._friction_plot_function.assign(
-                            farm.friction_function[timestep])
-                        friction_file << self._friction_plot_function
+                    with profiler.phase("output"):
+                        for timestep in range(0,len(farm.friction_function)):
+                            self._friction_plot_function.assign(
+                                farm.friction_function[timestep])
+                            friction_file << self._friction_plot_function
                 else:
-                    self.turbine_file << farm.turbine_cache["turbine_field"]
+                    with profiler.phase("output"):
+                        self.turbine_file << farm.turbine_cache["turbine_field"]
                     # Compute the total amount of friction due to turbines
                     if farm.turbine_specification.smeared:
                         log(INFO, "Total amount of friction: %f" %
                             assemble(farm.turbine_cache["turbine_field"]*dx))
+            profiler.end_iteration(self.solver.optimisation_iteration)
             self.solver.optimisation_iteration += 1
             self.solver.search_iteration = 0
 
@@ -446,25 +657,281 @@ class ReducedFunctional(ReducedFunctionalPrototype):
 
         return self._dj(m_array, forget)
 
-    def derivative_with_check(self, m, seed=0.1, tol=1.8, forget=True):
+    def value_and_derivative(self, m, forget=True):
+        """ Computes the functional value and its first derivative with one
+        annotated forward run and one adjoint run.
+
+        Both results are stored in the memoisation caches of :meth:`evaluate`
+        and :meth:`derivative`, so that later calls of either method with the
+        same parameters do not solve again.
+
+        :param m: The control values.
+        :type m: numpy.ndarray
+        :param forget: Delete the adjoint tape after the adjoint run.
+            Default: True
+        :returns: (float, numpy.ndarray) -- the (scaled) functional value and
+            its derivative.
+        """
+        m = numpy.asarray(m)
+
+        # The forward run is annotated, so that the adjoint run can reuse its
+        # tape.
+        j = self.evaluate(m, annotate=True)
+        self._share_gradient_cache(m, forget)
+        dj = self._dj(m, forget)
+
+        return j, dj
+
+    def evaluate_batch(self, ms, gradient=False, processes=None):
+        """ Evaluates the functional, and optionally its derivative, for a
+        batch of control arrays on a pool of worker processes.
+
+        This creates a new :class:`EvaluationPool` for each call. Use an
+        :class:`EvaluationPool` directly to evaluate several batches with
+        the same workers.
+
+        :param ms: The control arrays.
+        :type ms: list of numpy.ndarray
+        :param gradient: Also compute the derivatives. Default: False
+        :param processes: The number of worker processes. Defaults to the
+            number of CPUs.
+        :returns: list -- The functional values, or (value, derivative)
+            pairs if gradient is True.
+        """
+        with EvaluationPool(self, processes) as pool:
+            return pool.evaluate_batch(ms, gradient)
+
+    def _share_gradient_cache(self, m, forget):
+        """ The gradient does not depend on forget, so a gradient that was
+        computed with the other value of forget (e.g. for the automatic
+        scaling) is reused. """
+        mem = self._compute_gradient_mem
+        if not mem.has_cache(m, forget) and mem.has_cache(m, not forget):
+            mem.insert(mem(m, not forget), m, forget)
+
+    def derivative_with_check(self, m, seed=0.1, tol=1.8, forget=True,
+                              mode="taylor", processes=None, rtol=1e-6):
         ''' This function checks the correctness and returns the gradient of
-        the functional for the parameter choice m. '''
+        the functional for the parameter choice m.
+
+        :param mode: "taylor" runs the Taylor remainder convergence test,
+            which needs six forward runs. In serial, the perturbed forward
+            runs are computed concurrently on an :class:`EvaluationPool`.
+            "tlm" compares the adjoint gradient with one directional
+            derivative computed by the tangent linear model, which costs one
+            forward, one tangent linear and one adjoint run.
+        :param tol: The minimum convergence order of the Taylor test.
+        :param processes: The number of worker processes for the Taylor test.
+            Defaults to the number of CPUs. Set to 1 to run the perturbed
+            forward runs one after another.
+        :param rtol: The maximum relative difference between the adjoint and
+            the tangent linear directional derivatives.
+        '''
 
         log(INFO, "Checking derivative at m = " + str(m))
         p = numpy.random.rand(len(m))
-        minconv = helpers.test_gradient_array(self.evaluate,
-                                              self._dj,
-                                              m,
-                                              seed=seed,
-                                              perturbation_direction=p)
-        if minconv < tol:
-            log(INFO, "The gradient taylor remainder test failed.")
+
+        if mode == "tlm":
+            # The tangent linear model needs the annotation of the forward
+            # run, hence the adjoint run must not forget it.
+            j = self._compute_functional(m, annotate=True)
+            self._compute_functional_mem.insert(j, m, annotate=True)
+            dj = self._compute_gradient(m, forget=False)
+            self._compute_gradient_mem.insert(dj, m, False)
+            adjoint_dj_p = numpy.dot(dj, p)
+            tlm_dj_p = self._directional_derivative(m, p)
+            error = abs(adjoint_dj_p - tlm_dj_p)
+            log(INFO, "Directional derivative with adjoint: %e, with tangent "
+                "linear model: %e." % (adjoint_dj_p, tlm_dj_p))
+            passed = error <= rtol * abs(tlm_dj_p)
+
+        elif mode == "taylor":
+            if (processes != 1 and
+                dolfin.MPI.size(dolfin.mpi_comm_world()) == 1):
+                with EvaluationPool(self, processes) as pool:
+                    minconv = helpers.test_gradient_array(self.evaluate,
+                        self._dj, m, seed=seed, perturbation_direction=p,
+                        J_batch=pool.evaluate_batch)
+            else:
+                minconv = helpers.test_gradient_array(self.evaluate,
+                                                      self._dj,
+                                                      m,
+                                                      seed=seed,
+                                                      perturbation_direction=p)
+            passed = minconv >= tol
+
+        else:
+            raise ValueError("Unknown gradient check mode '%s'." % mode)
+
+        if not passed:
+            log(INFO, "The gradient %s test failed." % mode)
             sys.exit(1)
         else:
-            log(INFO, "The gradient taylor remainder test passed.")
+            log(INFO, "The gradient %s test passed." % mode)
 
         return self._dj(m, forget)
 
+    def _directional_derivative(self, m, p):
+        """ Computes the (unscaled) derivative of the functional in the
+        direction p with the tangent linear model. The last forward run must
+        have been annotated at m and its annotation must not be forgotten.
+        """
+        farm = self.solver.problem.parameters.tidal_farm
+        controls = farm.turbine_specification.controls
+
+        if controls.dynamic_friction:
+            raise NotImplementedError("The tangent linear check does not "
+                                      "support dynamic friction controls.")
+        if self._revolve_parameters:
+            raise NotImplementedError("The tangent linear check does not "
+                                      "support adjoint checkpointing.")
+
+        dtf = self._friction_direction(p)
+        J = self.time_integrator.dolfin_adjoint_functional(self.solver.state)
+        control = FunctionControl("turbine_friction_cache", perturbation=dtf)
+        with self._snapshot_directory():
+            dj_p = dolfin_adjoint.compute_gradient_tlm(J, control,
+                                                       forget=False)
+        dolfin.parameters["adjoint"]["stop_annotating"] = False
+
+        return float(dj_p)
+
+    def _control_basis(self):
+        """ Returns the derivatives of the turbine friction field with respect
+        to each control, in the order of the control array. """
+        farm = self.solver.problem.parameters.tidal_farm
+        controls = farm.turbine_specification.controls
+
+        farm.update()
+        basis = []
+        if controls.friction:
+            basis += farm.turbine_cache["turbine_derivative_friction"]
+        if controls.position:
+            for d in farm.turbine_cache["turbine_derivative_pos"]:
+                basis += [d["turbine_pos_x"], d["turbine_pos_y"]]
+        return basis
+
+    def _friction_direction(self, p):
+        """ Returns the change of the turbine friction field in the direction
+        p of the controls. """
+        farm = self.solver.problem.parameters.tidal_farm
+        dtf = Function(farm._turbine_function_space)
+        if farm.turbine_specification.smeared:
+            dolfin_adjoint.optimization.set_local(dtf, p)
+        else:
+            for p_i, tfd in zip(p, self._control_basis()):
+                dtf.vector().axpy(p_i, tfd.vector())
+        return dtf
+
+    def _second_derivative_matrix(self):
+        """ Returns the matrix of the derivative of the functional with
+        respect to the turbine friction field applied to the second
+        derivatives of the turbine friction field with respect to the
+        controls. The matrix is block diagonal, since each turbine only
+        depends on its own controls. """
+        if self._second_derivative_terms is not None:
+            return self._second_derivative_terms
+
+        farm = self.solver.problem.parameters.tidal_farm
+        controls = farm.turbine_specification.controls
+        n_turbines = farm.number_of_turbines
+
+        # The indices of the controls of each turbine in the control array
+        indices = [{} for i in xrange(n_turbines)]
+        shift = 0
+        if controls.friction:
+            for i in xrange(n_turbines):
+                indices[i]["turbine_friction"] = i
+            shift = n_turbines
+        if controls.position:
+            for i in xrange(n_turbines):
+                indices[i]["turbine_pos_x"] = shift + 2*i
+                indices[i]["turbine_pos_y"] = shift + 2*i + 1
+
+        n = sum(len(idx) for idx in indices)
+        S = numpy.zeros((n, n))
+        farm.update()
+        for i, idx in enumerate(indices):
+            variables = sorted(idx.keys())
+            for a, var1 in enumerate(variables):
+                for var2 in variables[a:]:
+                    d2tf = farm.turbine_cache.second_derivative(i, var1, var2)
+                    value = self._djdtf.vector().inner(d2tf.vector())
+                    S[idx[var1], idx[var2]] = value
+                    S[idx[var2], idx[var1]] = value
+
+        self._second_derivative_terms = S
+        return S
+
+    def hessian(self, m, m_dot):
+        """ Computes the action of the Hessian of the (scaled) functional in
+        the direction m_dot.
+
+        The Hessian action with respect to the turbine friction field is
+        computed with the second order adjoint of dolfin-adjoint, i.e. one
+        tangent linear and one second order adjoint run. It is combined with
+        the analytic first and second derivatives of the turbine friction
+        field with respect to the controls.
+
+        The Hessian action requires the annotation of the forward run at m.
+        Compute the derivative with forget=False (as :func:`minimize` does for
+        the Newton-CG method) to keep it, otherwise the forward model is
+        re-run.
+
+        :param m: The control values.
+        :type m: numpy.ndarray
+        :param m_dot: The direction.
+        :type m_dot: numpy.ndarray
+        :returns: numpy.ndarray -- the Hessian action.
+        """
+        m = numpy.asarray(m, dtype=float)
+        m_dot = numpy.asarray(m_dot, dtype=float)
+        farm = self.solver.problem.parameters.tidal_farm
+
+        if farm.turbine_specification.controls.dynamic_friction:
+            raise NotImplementedError("The Hessian is not implemented for "
+                                      "dynamic friction controls.")
+
+        if (self.parameters.automatic_scaling and
+            self._automatic_scaling_factor is None):
+            self._dj(m, forget=False, new_optimisation_iteration=False)
+
+        if self._revolve_parameters:
+            raise NotImplementedError("The Hessian does not support adjoint "
+                                      "checkpointing.")
+
+        if self._tape_m is None or numpy.any(m != self._tape_m):
+            # Re-run the forward model to annotate it
+            self.last_m = None
+        if self.last_m is None or self._djdtf is None:
+            dj = self._compute_gradient(m, forget=False)
+            self._compute_gradient_mem.insert(dj, m, False)
+
+        log(INFO, 'Start evaluation of the Hessian action')
+        timer = dolfin.Timer("hessian evaluation")
+
+        dtf = self._friction_direction(m_dot)
+        J = self.time_integrator.dolfin_adjoint_functional(self.solver.state)
+        H = dolfin_adjoint.hessian(J, FunctionControl("turbine_friction_cache"))
+        with profiler.phase("hessian_solve"), \
+             self._snapshot_directory():
+            H_dtf = H(dtf)
+        dolfin.parameters["adjoint"]["stop_annotating"] = False
+
+        if farm.turbine_specification.smeared:
+            hess = dolfin_adjoint.optimization.get_global(H_dtf)
+        else:
+            hess = numpy.array([H_dtf.vector().inner(tfd.vector())
+                                for tfd in self._control_basis()])
+            hess += numpy.dot(self._second_derivative_matrix(), m_dot)
+
+        log(INFO, "Runtime: " + str(timer.stop()) + " s")
+
+        if self.parameters.automatic_scaling:
+            return hess*self.scale*self._automatic_scaling_factor
+        else:
+            return hess*self.scale
+
     def mpi_comm(self):
         return mpi_comm_world()
 
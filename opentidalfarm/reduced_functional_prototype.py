@@ -50,6 +50,16 @@ class ReducedFunctionalPrototype(ReducedFunctionalNumPy):
         raise NotImplementedError('ReducedFunctionalPrototype.derivative needs \
                 to be overloaded')
 
+    def value_and_derivative(self, m, **kwargs):
+        """ Returns the functional value and its derivative for the control
+        choice. Overload this method if both can be computed together more
+        cheaply than separately.
+
+        :param m: The control values
+        :type m: numpy array.
+        """
+        return self(m), self.derivative(m, **kwargs)
+
     def __add__(self, other):
         """ Method to add reduced functionals together"""
         assert self.controls == other.controls
@@ -72,9 +82,67 @@ class ReducedFunctionalPrototype(ReducedFunctionalNumPy):
         return -1 * self
 
 
+def _flatten(reducedfunctional, weight=1.):
+    """ Returns the list of (weight, reduced functional) pairs whose weighted
+    sum is the given (combined or scaled) reduced functional. """
+    if isinstance(reducedfunctional, CombinedReducedFunctional):
+        return [(weight * w, rf) for w, rf in reducedfunctional.terms]
+    if isinstance(reducedfunctional, ScaledReducedFunctional):
+        return _flatten(reducedfunctional.reducedfunctional,
+                        weight * reducedfunctional.scaling_factor)
+    return [(weight, reducedfunctional)]
+
+
+def _share_forward_runs(terms):
+    """ Replaces the :class:`ReducedFunctional` terms that share the same
+    solver and controls by one :class:`ReducedFunctional` of the combined
+    functional, so that they need only one forward and one adjoint run.
+
+    Terms with automatic scaling are not merged, since their scaling factor
+    depends on their individual gradients. """
+    from reduced_functional import ReducedFunctional
+    from functionals.prototype_functional import CombinedFunctional, \
+                                                 ScaledFunctional
+
+    groups = []
+    components = []
+    for weight, rf in terms:
+        if (type(rf) is not ReducedFunctional or
+            rf.parameters.automatic_scaling):
+            components.append((weight, rf))
+            continue
+
+        key = (id(rf.solver), tuple(id(c) for c in rf.controls))
+        for group_key, group in groups:
+            if group_key == key:
+                group.append((weight, rf))
+                break
+        else:
+            groups.append((key, [(weight, rf)]))
+
+    for key, group in groups:
+        if len(group) == 1:
+            components += group
+            continue
+
+        functional = CombinedFunctional(
+            [ScaledFunctional(rf.functional, float(weight * rf.scale))
+             for weight, rf in group])
+        components.append((1., ReducedFunctional._for_functional(
+            group[0][1], functional)))
+
+    return components
+
+
 class CombinedReducedFunctional(ReducedFunctionalPrototype):
     """ Constructs a single combined functional by adding one functional to
     another.
+
+    Nested combinations and scalings are flattened into a weighted sum.
+    :class:`ReducedFunctional` terms that share the same solver and controls
+    are evaluated together: the forward model runs once, all their
+    functionals are integrated from the same states and the gradient is
+    computed with one adjoint run of the combined functional.
     """
 
     def __init__(self, reduced_functional_list):
@@ -82,23 +150,43 @@ class CombinedReducedFunctional(ReducedFunctionalPrototype):
             assert isinstance(reducedfunctional, ReducedFunctionalNumPy)
         self.reduced_functional_list = reduced_functional_list
 
+        # The list of (weight, reduced functional) pairs
+        self.terms = []
+        for reducedfunctional in reduced_functional_list:
+            self.terms += _flatten(reducedfunctional)
+        # The terms after merging those that share a forward run
+        self.components = _share_forward_runs(self.terms)
+
 		# We know that all controls are the same, so just pick the first one
         self.controls = reduced_functional_list[0].controls
 
     def __call__(self, m):
         """Return the functional value for the controls choice"""
-        combined_reduced_functional = sum([reducedfunctional.__call__(m) for \
-                reducedfunctional in self.reduced_functional_list])
+        combined_reduced_functional = sum([weight * reducedfunctional(m) for \
+                weight, reducedfunctional in self.components])
         return combined_reduced_functional
 
     def derivative(self, m, **kwargs):
         """ Return the derivative of the functional value with respect to
         the control choice"""
         combined_reduced_functional_derivative = \
-                sum([reducedfunctional.derivative(m, **kwargs) for \
-                reducedfunctional in self.reduced_functional_list])
+                sum([weight * reducedfunctional.derivative(m, **kwargs) for \
+                weight, reducedfunctional in self.components])
         return combined_reduced_functional_derivative
 
+    def value_and_derivative(self, m, **kwargs):
+        """ Return the functional value and its derivative for the control
+        choice"""
+        results = [(weight, reducedfunctional.value_and_derivative(m, **kwargs))
+                   for weight, reducedfunctional in self.components]
+        return (sum([weight * j for weight, (j, dj) in results]),
+                sum([weight * dj for weight, (j, dj) in results]))
+
+    def hessian(self, m, m_dot):
+        """ Return the action of the Hessian in the direction m_dot"""
+        return sum([weight * reducedfunctional.hessian(m, m_dot) for \
+                weight, reducedfunctional in self.components])
+
 
 class ScaledReducedFunctional(ReducedFunctionalPrototype):
     """Scales the functional
@@ -124,6 +212,17 @@ class ScaledReducedFunctional(ReducedFunctionalPrototype):
                 self.reducedfunctional.derivative(m, **kwargs)
         return scaled_reduced_functional_derivative
 
+    def value_and_derivative(self, m, **kwargs):
+        """ Return the scaled functional value and its derivative for the
+        control choice"""
+        j, dj = self.reducedfunctional.value_and_derivative(m, **kwargs)
+        return self.scaling_factor * j, self.scaling_factor * dj
+
+    def hessian(self, m, m_dot):
+        """ Return the action of the scaled Hessian in the direction
+        m_dot"""
+        return self.scaling_factor * self.reducedfunctional.hessian(m, m_dot)
+
 
 #############################################################################
 ################################## T E S T ##################################
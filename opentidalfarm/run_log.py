@@ -0,0 +1,106 @@
+"""
+.. module:: Run log
+   :synopsis: This module provides a binary log that stores one record per
+       forward or adjoint evaluation of a reduced functional in a single file.
+"""
+
+import os.path
+import cPickle
+import numpy
+from helpers import cpu0only
+
+__all__ = ["RunLog", "RunLogRecords", "load_run_log"]
+
+
+class RunLog(object):
+    """ An append-only binary log of an optimisation run.
+
+    Each call to :meth:`write` appends one record (a dictionary) to the file.
+    In contrast to writing numpy text files into a new `iter_N/search_M`
+    directory for every evaluation, the whole run ends up in a single file.
+
+    :param filename: The filename of the log.
+    :type filename: str
+    :param append: If False, an existing log with the same name is truncated.
+        Default: False
+    :type append: bool
+    """
+
+    def __init__(self, filename, append=False):
+        self.filename = filename
+
+        if not append:
+            self._truncate()
+
+    @cpu0only
+    def _truncate(self):
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        open(self.filename, "wb").close()
+
+    @cpu0only
+    def write(self, kind, **data):
+        """ Appends a record to the log.
+
+        :param kind: The type of the record, e.g. "forward" or "adjoint".
+        :type kind: str
+        :param data: The values to be stored. Lists are stored as
+            numpy.ndarray.
+        """
+        record = {"kind": kind}
+        for key, value in data.iteritems():
+            if isinstance(value, (list, tuple)):
+                value = numpy.asarray(value)
+            record[key] = value
+
+        f = open(self.filename, "ab")
+        cPickle.dump(record, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+
+    def load(self, kind=None):
+        """ Loads the records of this log. See :func:`load_run_log`. """
+        return load_run_log(self.filename, kind)
+
+
+class RunLogRecords(list):
+    """ Stores a list of run log records. """
+
+    def filter(self, kind):
+        """ Return the records of the given kind. """
+        return RunLogRecords([r for r in self if r["kind"] == kind])
+
+    def field(self, key):
+        """ Returns the values of a field of all records that contain it.
+
+        :param key: The field name, e.g. "j" or "temporal_breakdown".
+        :type key: str
+        :returns: numpy.ndarray -- the values stacked along the first axis.
+        """
+        return numpy.array([r[key] for r in self if key in r])
+
+
+def load_run_log(filename, kind=None):
+    """ Loads a run log that was written with :class:`RunLog`.
+
+    :param filename: The filename of the log.
+    :type filename: str
+    :param kind: If not None, only records of this kind are returned.
+    :type kind: str
+    :returns: :class:`RunLogRecords` -- the records in the order they were
+        written.
+    """
+    records = RunLogRecords()
+
+    f = open(filename, "rb")
+    while True:
+        try:
+            record = cPickle.load(f)
+        except EOFError:
+            break
+        records.append(record)
+    f.close()
+
+    if kind is not None:
+        records = records.filter(kind)
+    return records
@@ -1,5 +1,8 @@
 import os.path
+import copy
 
+import ufl
+import dolfin
 from dolfin import *
 from dolfin_adjoint import *
 
@@ -7,7 +10,9 @@ from solver import Solver
 from ..problems import SWProblem
 from ..problems import SteadySWProblem
 from ..problems import MultiSteadySWProblem
-from ..helpers import StateWriter, FrozenClass
+from ..helpers import StateWriter, FrozenClass, transfer_function
+from ..run_log import RunLog
+from ..profiling import profiler
 
 
 class CoupledSWSolverParameters(FrozenClass):
@@ -39,6 +44,33 @@ class CoupledSWSolverParameters(FrozenClass):
         Default: ["-O3", "-ffast-math", "-march=native"]
     :ivar revolve_parameters: The adjoint checkpointing settings as a set of the
         form (strategy, snaps_on_disk, snaps_in_ram, verbose). Default: None
+    :ivar adjoint_ram_budget: The memory in megabytes (per process) that the
+        adjoint tape of a transient problem may use for the forward states. If
+        the states of all timesteps do not fit, the adjoint is computed with
+        revolve checkpointing and the number of snapshots is chosen
+        automatically (see :func:`opentidalfarm.helpers.revolve_parameters`).
+        Ignored if `revolve_parameters` is set. Default: None (all states are
+        kept in memory)
+    :ivar adjoint_snapshot_dir: If set, the checkpointing also stores snapshots
+        on disk in this directory, so that fewer timesteps are recomputed.
+        Only used together with `adjoint_ram_budget`. Default: None
+    :ivar reuse_forward_factorisation: For steady problems, solve the Newton
+        iterations with an LU solver whose factorisation of the last Newton
+        Jacobian is kept. The reduced functionals then solve the adjoint
+        equation with one transpose solve on this factorisation, instead of
+        assembling and factorising the adjoint operator. The last Newton
+        Jacobian is evaluated at the iterate before the final Newton update,
+        so the gradient has an error of the order of the Newton tolerance.
+        Default: False
+    :ivar nested_iteration: For steady and multi steady-state problems, first
+        solve the problem without annotation on a coarsened mesh (see
+        :meth:`opentidalfarm.domains.domain.Domain.coarsen`) and use its
+        solution as the initial guess of the Newton solver. This is only done
+        if no cached state (see `cache_forward_state`) is available. The
+        coarse problem is created once and reused in later solves. If the
+        domain cannot be coarsened (e.g. a :class:`FileDomain` that was not
+        created with `refine`), a warning is logged and the initial condition
+        is used as the initial guess. Only works in serial. Default: False
     :ivar output_dir: The base directory in which to store the file ouputs.
         Default: `os.curdir`
     :ivar output_turbine_power: Output the power generation of the individual
@@ -55,6 +87,13 @@ class CoupledSWSolverParameters(FrozenClass):
         velocity at each turbine position. Default: False
     :ivar output_control_array: Output a numpy textfile containing the
         control array from each optimisation and search iteration. Default: False
+    :ivar output_run_log: Route the outputs enabled by `output_j`,
+        `output_temporal_breakdown_of_j`, `output_control_array` and
+        `output_abs_u_at_turbine_positions` into a single binary run log
+        `run_log.dat` in `output_dir`, instead of writing numpy textfiles into
+        the `iter_N/search_M` directories. The log also contains the gradient
+        norms and runtimes of each evaluation and can be read with
+        :func:`opentidalfarm.run_log.load_run_log`. Default: False
     :ivar callback: A callback function that is executed for every time-level.
         The callback function must take a single parameter which contains the
         dictionary with the solution variables.
@@ -75,6 +114,7 @@ class CoupledSWSolverParameters(FrozenClass):
     output_temporal_breakdown_of_j = False
     output_control_array = False
     output_abs_u_at_turbine_positions = False
+    output_run_log = False
 
     # Performance settings
     cache_forward_state = True
@@ -84,6 +124,10 @@ class CoupledSWSolverParameters(FrozenClass):
                                # snaps_on_disk,
                                # snaps_in_ram,
                                # verbose)
+    adjoint_ram_budget = None
+    adjoint_snapshot_dir = None
+    reuse_forward_factorisation = False
+    nested_iteration = False
 
     # Callback function
     callback = lambda self, sol: None
@@ -98,6 +142,55 @@ class CoupledSWSolverParameters(FrozenClass):
         self.dolfin_solver["newton_solver"]["maximum_iterations"] = 20
         self.dolfin_solver["newton_solver"]["convergence_criterion"] = "incremental"
 
+class _CoarseFarm(object):
+    """ The turbine farm of the nested iteration problem. Its friction
+    function is the friction function of the fine farm, interpolated onto the
+    coarse mesh. """
+
+    def __init__(self, farm, domain):
+        self._farm = farm
+        self.turbine_specification = farm.turbine_specification
+        self.site_dx = domain.dx(farm.site_ids)
+
+        fine = farm.friction_function
+        fine_functions = fine if type(fine) == list else [fine]
+        space = FunctionSpace(domain.mesh, fine_functions[0].ufl_element())
+        functions = [dolfin.Function(space) for f in fine_functions]
+        self.friction_function = functions if type(fine) == list \
+                                 else functions[0]
+
+    def update(self):
+        """ Interpolates the current friction function of the fine farm. """
+        fine = self._farm.friction_function
+        fine_functions = fine if type(fine) == list else [fine]
+        functions = self.friction_function
+        if type(functions) != list:
+            functions = [functions]
+        for f, fine_f in zip(functions, fine_functions):
+            f.assign(transfer_function(fine_f, f.function_space()))
+
+
+class _SteadyNonlinearProblem(NonlinearProblem):
+    """ The nonlinear problem F(u) = 0 with strong Dirichlet conditions for
+    dolfin's NewtonSolver. """
+
+    def __init__(self, F, J, bcs):
+        NonlinearProblem.__init__(self)
+        self.residual = F
+        self.jacobian = J
+        self.bcs = bcs
+
+    def F(self, b, x):
+        assemble(self.residual, tensor=b)
+        for bc in self.bcs:
+            bc.apply(b, x)
+
+    def J(self, A, x):
+        assemble(self.jacobian, tensor=A)
+        for bc in self.bcs:
+            bc.apply(A)
+
+
 class CoupledSWSolver(Solver):
     r""" The coupled solver solves the shallow water equations as a fully coupled
     system with a :math:`\theta`-timestepping discretization.
@@ -175,10 +268,21 @@ class CoupledSWSolver(Solver):
 
         self.state = None
 
+        # The run log is created on first use
+        self._run_log = None
+
         self.mesh = problem.parameters.domain.mesh
         elements = self.problem.parameters.finite_element()
         self.function_space = FunctionSpace(self.mesh, MixedElement(elements))
 
+        # The LU factorisation of the last Newton Jacobian of the last steady
+        # solve, see reuse_forward_factorisation.
+        self._newton_factorisation = None
+
+        # The solver on the coarsened mesh, see nested_iteration. False if
+        # the domain cannot be coarsened.
+        self._coarse_solver = None
+
     @staticmethod
     def default_parameters():
         """ Return the default parameters for the :class:`CoupledSWSolver`.
@@ -216,6 +320,15 @@ class CoupledSWSolver(Solver):
 
         return dir
 
+    def get_run_log(self):
+        """ Returns the :class:`opentidalfarm.run_log.RunLog` into which the
+        outputs are written if `output_run_log` is enabled. """
+        if self._run_log is None:
+            filename = os.path.join(self.parameters.output_dir, "run_log.dat")
+            self._run_log = RunLog(filename)
+
+        return self._run_log
+
     # For dynamic friction the problem parameters need to use the same
     # finished funciton as in the solver to avoid machine precision error.
     def _finished(self, current_time, finish_time):
@@ -224,6 +337,156 @@ class CoupledSWSolver(Solver):
         else:
             return float(current_time - finish_time) >= - 1e3*DOLFIN_EPS
 
+    def _solve_with_factorisation(self, F, J, u, tf, bcs, annotate):
+        """ Solves F(u) = 0 with dolfin's Newton solver and an LU solver whose
+        factorisation is kept for :meth:`steady_adjoint_friction_gradient`.
+        The Newton parameters of `dolfin_solver` are used, except for the
+        linear solver settings, and the solve is annotated by dolfin-adjoint's
+        NewtonSolver. """
+        newton_params = self.parameters.dolfin_solver["newton_solver"]
+
+        method = newton_params.get("linear_solver", "default")
+        if method not in lu_solver_methods():
+            method = "default"
+        lu = PETScLUSolver(method)
+
+        newton_solver = NewtonSolver(self.mesh.mpi_comm(), lu,
+                                     PETScFactory.instance())
+        # The linear solver settings do not apply to the given LU solver
+        for key, value in newton_params.iteritems():
+            if key not in ("linear_solver", "preconditioner", "krylov_solver",
+                           "lu_solver"):
+                newton_solver.parameters[key] = value
+
+        newton_solver.solve(_SteadyNonlinearProblem(F, J, bcs), u.vector(),
+                            annotate=annotate)
+
+        homogeneous_bcs = [dolfin.DirichletBC(bc) for bc in bcs]
+        for bc in homogeneous_bcs:
+            bc.homogenize()
+        self._newton_factorisation = {"lu": lu, "bcs": homogeneous_bcs,
+                                      "state": u, "tf": tf, "residual": F}
+
+    def steady_adjoint_available(self):
+        """ Returns True if the last forward solve kept the factorisation for
+        :meth:`steady_adjoint_friction_gradient`. """
+        return self._newton_factorisation is not None
+
+    def steady_adjoint_friction_gradient(self, functional):
+        """ Computes the derivative of a functional with respect to the
+        turbine friction field at the solution of the last steady solve.
+
+        The adjoint equation is solved with the transpose of the kept LU
+        factorisation of the last Newton Jacobian, so no adjoint operator is
+        assembled or factorised. This Jacobian lags one Newton iteration
+        behind the converged state, see `reuse_forward_factorisation`. This
+        requires the parameter `reuse_forward_factorisation`.
+
+        :param functional: The :class:`PrototypeFunctional`.
+        :returns: A Function that contains the derivative (not its Riesz
+            representer), like dolfin_adjoint.compute_gradient.
+        """
+        if not self.steady_adjoint_available():
+            raise ValueError("No factorisation of a steady forward solve is "
+                             "available. Set reuse_forward_factorisation.")
+
+        factorisation = self._newton_factorisation
+        u = factorisation["state"]
+        tf = factorisation["tf"]
+        F = factorisation["residual"]
+        form = functional.Jt(u, tf)
+
+        def assemble_derivative(form, coefficient):
+            d = ufl.algorithms.expand_derivatives(derivative(form,
+                                                             coefficient))
+            if d.empty():
+                return None
+            return dolfin.assemble(d)
+
+        # The adjoint solution is zero at the strong Dirichlet boundaries
+        adj = dolfin.Function(self.function_space)
+        rhs = assemble_derivative(form, u)
+        if rhs is not None:
+            factorisation["lu"].solve_transpose(adj.vector(), rhs)
+            for bc in factorisation["bcs"]:
+                bc.apply(adj.vector())
+
+        dj = dolfin.Function(tf.function_space())
+        partial = assemble_derivative(form, tf)
+        if partial is not None:
+            dj.vector().axpy(1., partial)
+        dj.vector().axpy(-1., dolfin.assemble(
+            action(adjoint(derivative(F, tf)), adj)))
+
+        return dj
+
+    def _create_coarse_solver(self, domain):
+        """ Creates the solver for the nested iteration, which solves the
+        same problem on the coarsened domain. """
+        problem_params = self.problem.parameters
+        farm = problem_params.tidal_farm
+        log(INFO, "Create the nested iteration problem on the coarse mesh. "
+                  "%s" % domain)
+
+        coarse_params = copy.copy(problem_params)
+        coarse_params.domain = domain
+        # Transfer the coefficients that live on the fine mesh
+        for name in ["depth", "friction", "viscosity", "f_u",
+                     "initial_condition"]:
+            value = getattr(problem_params, name)
+            if isinstance(value, dolfin.Function):
+                space = FunctionSpace(domain.mesh, value.ufl_element())
+                setattr(coarse_params, name,
+                        transfer_function(value, space))
+        if farm:
+            coarse_params.tidal_farm = _CoarseFarm(farm, domain)
+
+        solver_params = copy.copy(self.parameters)
+        solver_params.dump_period = -1
+        solver_params.cache_forward_state = True
+        solver_params.nested_iteration = False
+        solver_params.reuse_forward_factorisation = False
+        solver_params.print_individual_turbine_power = False
+        solver_params.output_turbine_power = False
+        solver_params.callback = lambda sol: None
+
+        problem = type(self.problem)(coarse_params)
+        return CoupledSWSolver(problem, solver_params)
+
+    def _nested_iteration_states(self):
+        """ Solves the problem on the coarse mesh without annotation.
+
+        :returns: dict -- the coarse solutions for each time level, or None
+            if the domain cannot be coarsened. """
+        if self._coarse_solver is None:
+            try:
+                domain = self.problem.parameters.domain.coarsen()
+            except NotImplementedError as e:
+                log(WARNING, "Nested iteration is not possible: %s The "
+                             "initial condition is used as the initial "
+                             "guess instead." % e)
+                self._coarse_solver = False
+            else:
+                self._coarse_solver = self._create_coarse_solver(domain)
+        coarse_solver = self._coarse_solver
+        if not coarse_solver:
+            return None
+
+        farm = coarse_solver.problem.parameters.tidal_farm
+        if farm:
+            farm.update()
+
+        log(INFO, "Solve the nested iteration problem on the coarse mesh.")
+        stop_annotating = parameters["adjoint"]["stop_annotating"]
+        parameters["adjoint"]["stop_annotating"] = True
+        try:
+            for _ in coarse_solver.solve(annotate=False):
+                pass
+        finally:
+            parameters["adjoint"]["stop_annotating"] = stop_annotating
+
+        return coarse_solver.state_cache
+
     def solve(self, annotate=True):
         ''' Returns an iterator for solving the shallow water equations. '''
 
@@ -459,6 +722,23 @@ class CoupledSWSolver(Solver):
         # Generate the scheme specific strong boundary conditions
         strong_bcs = self._generate_strong_bcs()
 
+        # The Jacobian of the Newton iteration
+        J = derivative(F, state_new)
+        self.forms = {"residual": F, "jacobian": J}
+
+        # Keep the factorisation of the final Newton Jacobian for the adjoint
+        reuse_factorisation = (solver_params.reuse_forward_factorisation and
+                               not self.problem._is_transient and
+                               isinstance(tf, dolfin.Function))
+        self._newton_factorisation = None
+
+        # Solve the problem on the coarse mesh for the initial guesses
+        coarse_states = None
+        if (solver_params.nested_iteration and not include_time_term and
+            not (cache_forward_state and self.state_cache)):
+            with profiler.phase("nested_iteration"):
+                coarse_states = self._nested_iteration_states()
+
         ############################### Perform the simulation ###########################
 
         if solver_params.dump_period > 0:
@@ -507,6 +787,13 @@ class CoupledSWSolver(Solver):
                 # Load initial guess for solver from cache
                 state_new.assign(self.state_cache[float(t)], annotate=False)
 
+            elif coarse_states and coarse_states.has_key(float(t)):
+                log(INFO, "Set the initial guess for the nonlinear solver to "
+                          "the coarse mesh solution.")
+                state_new.assign(transfer_function(coarse_states[float(t)],
+                                                   self.function_space),
+                                 annotate=False)
+
             elif not include_time_term:
                 log(INFO, "Set the initial guess for the nonlinear solver to the initial condition.")
                 # Reset the initial guess after each timestep
@@ -519,10 +806,15 @@ class CoupledSWSolver(Solver):
             else:
                 log(INFO, "Solve shallow water equations.")
 
-            solve(F == 0, state_new, bcs=strong_bcs,
-                  solver_parameters=solver_params.dolfin_solver,
-                  annotate=annotate,
-                  J=derivative(F, state_new))
+            with profiler.phase("newton_solve"):
+                if reuse_factorisation:
+                    self._solve_with_factorisation(F, J, state_new, tf,
+                                                   strong_bcs, annotate)
+                else:
+                    solve(F == 0, state_new, bcs=strong_bcs,
+                          solver_parameters=solver_params.dolfin_solver,
+                          annotate=annotate,
+                          J=J)
 
             # After the timestep solve, update state
             state.assign(state_new)
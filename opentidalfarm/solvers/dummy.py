@@ -34,6 +34,7 @@ class DummySolver(Solver):
         self.A += inner(q, h) * dx
 
         self.tf = turbine_field.copy(deepcopy=True, name="turbine_friction", annotate=annotate)
+        self.forms = {"mass": self.M, "system": self.A}
 
         self.annotate = annotate
 
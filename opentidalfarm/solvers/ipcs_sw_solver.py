@@ -7,6 +7,7 @@ from .. import finite_elements
 from ..problems import SWProblem
 from ..problems import SteadySWProblem
 from ..helpers import FrozenClass
+from ..profiling import profiler
 from solver import Solver
 from les import LES
 
@@ -366,6 +367,13 @@ IPCSSWSolverParameters."
         a_u_corr = inner(v, u)*dx()
         L_u_corr = inner(v, ut)*dx() - dt*g*theta*inner(v, grad(eta_diff))*dx()
 
+        self.forms = {"tentative_velocity_lhs": a_u_tent,
+                      "tentative_velocity_rhs": L_u_tent,
+                      "pressure_correction_lhs": a_p_corr,
+                      "pressure_correction_rhs": L_p_corr,
+                      "velocity_correction_lhs": a_u_corr,
+                      "velocity_correction_rhs": L_u_corr}
+
         bcu, bceta = self._generate_strong_bcs(dgu)
 
         # Assemble matrices
@@ -410,34 +418,43 @@ IPCSSWSolverParameters."
 
             if include_les:
                 log(PROGRESS, "Compute eddy viscosity.")
-                les.solve()
+                with profiler.phase("les_solve"):
+                    les.solve()
 
             # Compute tentative velocity step
             log(PROGRESS, "Solve for tentative velocity.")
-            A_u_tent = assemble(a_u_tent)
-            b = assemble(L_u_tent)
-            for bc in bcu: bc.apply(A_u_tent, b)
+            with profiler.phase("assembly"):
+                A_u_tent = assemble(a_u_tent)
+                b = assemble(L_u_tent)
+                for bc in bcu: bc.apply(A_u_tent, b)
 
-            solve(A_u_tent, ut.vector(), b)
+            with profiler.phase("linear_solve"):
+                solve(A_u_tent, ut.vector(), b)
 
             # Pressure correction
             log(PROGRESS, "Solve for pressure correction.")
-            b = assemble(L_p_corr)
-            for bc in bceta: bc.apply(b)
+            with profiler.phase("assembly"):
+                b = assemble(L_p_corr)
+                for bc in bceta: bc.apply(b)
 
             if linear_divergence:
-                a_p_corr_solver.solve(eta1.vector(), b)
+                with profiler.phase("linear_solve"):
+                    a_p_corr_solver.solve(eta1.vector(), b)
             else:
-                A_p_corr = assemble(a_p_corr)
-                for bc in bceta: bc.apply(A_p_corr)
-                solve(A_p_corr, eta1.vector(), b)
+                with profiler.phase("assembly"):
+                    A_p_corr = assemble(a_p_corr)
+                    for bc in bceta: bc.apply(A_p_corr)
+                with profiler.phase("linear_solve"):
+                    solve(A_p_corr, eta1.vector(), b)
 
             # Velocity correction
             log(PROGRESS, "Solve for velocity update.")
-            b = assemble(L_u_corr)
-            for bc in bcu: bc.apply(b)
+            with profiler.phase("assembly"):
+                b = assemble(L_u_corr)
+                for bc in bcu: bc.apply(b)
 
-            a_u_corr_solver.solve(u1.vector(), b)
+            with profiler.phase("linear_solve"):
+                a_u_corr_solver.solve(u1.vector(), b)
 
             # Rotate functions for next timestep
             u00.assign(u0)
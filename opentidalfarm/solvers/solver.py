@@ -5,12 +5,22 @@ class Solver(object):
         """ Initialises the solver. """
         self.optimisation_iteration = 0
         self.search_iteration = 0
+        # The forms that are built by solve, by name. They are used to
+        # compile the forms ahead of time, see
+        # :func:`opentidalfarm.precompile_forms`.
+        self.forms = {}
 
     @classmethod
     def default_parameters(cls):
         """ Returns a dictionary with the default parameters. """
         return {}
 
+    def steady_adjoint_available(self):
+        """ Returns True if the solver can compute the adjoint of its last
+        (steady) solve without dolfin-adjoint, see
+        :meth:`CoupledSWSolver.steady_adjoint_friction_gradient`. """
+        return False
+
     def solve(self, state, turbine_field, functional=None, annotate=True,
               linear_solver="default", preconditioner="default",
               u_source=None):
@@ -2,16 +2,112 @@ from dolfin import Expression  # Keep readthedocs happy
 
 from dolfin import *
 from dolfin_adjoint import *
-# this imports NetCDFFile from netCDF4, Scientific.IO.NetCDF or scipy.io.netcdf (whichever is available)
-from uptide.netcdf_reader import NetCDFFile
-import utm
-import uptide
-import uptide.tidal_netcdf
-import datetime
-import scipy.interpolate
+import os.path
+import hashlib
+import dolfin
 import numpy
+from boundary_forcing import BoundaryForcing
+
+__all__ = ["TidalForcing", "BoundaryTidalForcing", "BathymetryDepthExpression",
+           "VelocityTimeSeries"]
+
+# uptide, utm, the NetCDF readers and scipy.interpolate are slow to import
+# and only needed for tidal data. They are imported by _import_dependencies
+# when the first tidal forcing or bathymetry is created, so that importing
+# opentidalfarm stays fast on every MPI rank.
+uptide = None
+utm = None
+
+
+def _import_dependencies():
+    global uptide, utm
+    if uptide is None:
+        import uptide
+        import uptide.tidal_netcdf
+        import uptide.netcdf_reader
+        import utm
+
+
+def _utm_to_latlon(easting, northing, zone_number, zone_letter):
+    """ A vectorised version of :func:`utm.to_latlon` for arrays of
+    coordinates in the same UTM zone. Returns the latitudes and longitudes in
+    degrees.
+
+    The series are those of utm 0.6 and later. Older utm versions use a
+    slightly different :math:`C_1` term, which changes the result by less
+    than :math:`10^{-9}` degrees within a few kilometres of the central
+    meridian. """
+    K0 = 0.9996
+
+    E = 0.00669438
+    E2 = E * E
+    E3 = E2 * E
+    E_P2 = E / (1.0 - E)
+
+    SQRT_E = numpy.sqrt(1 - E)
+    _E = (1 - SQRT_E) / (1 + SQRT_E)
+    _E2 = _E * _E
+    _E3 = _E2 * _E
+    _E4 = _E3 * _E
+    _E5 = _E4 * _E
+
+    M1 = (1 - E / 4 - 3 * E2 / 64 - 5 * E3 / 256)
+    P2 = (3. / 2 * _E - 27. / 32 * _E3 + 269. / 512 * _E5)
+    P3 = (21. / 16 * _E2 - 55. / 32 * _E4)
+    P4 = (151. / 96 * _E3 - 417. / 128 * _E5)
+    P5 = (1097. / 512 * _E4)
+
+    R = 6378137
+
+    x = numpy.asarray(easting, dtype=float) - 500000
+    y = numpy.array(northing, dtype=float)
+
+    if zone_letter.upper() < 'N':
+        y -= 10000000
+
+    m = y / K0
+    mu = m / (R * M1)
+
+    p_rad = (mu + P2 * numpy.sin(2 * mu) + P3 * numpy.sin(4 * mu) +
+             P4 * numpy.sin(6 * mu) + P5 * numpy.sin(8 * mu))
+
+    p_sin = numpy.sin(p_rad)
+    p_sin2 = p_sin * p_sin
+    p_cos = numpy.cos(p_rad)
+
+    p_tan = p_sin / p_cos
+    p_tan2 = p_tan * p_tan
+    p_tan4 = p_tan2 * p_tan2
+
+    ep_sin = 1 - E * p_sin2
+    ep_sin_sqrt = numpy.sqrt(1 - E * p_sin2)
+
+    n = R / ep_sin_sqrt
+    r = (1 - E) / ep_sin
+
+    c = E_P2 * p_cos**2
+    c2 = c * c
+
+    d = x / (n * K0)
+    d2 = d * d
+    d3 = d2 * d
+    d4 = d3 * d
+    d5 = d4 * d
+    d6 = d5 * d
+
+    latitude = p_rad - (p_tan / r) * (
+                 d2 / 2 -
+                 d4 / 24 * (5 + 3 * p_tan2 + 10 * c - 4 * c2 - 9 * E_P2) +
+                 d6 / 720 * (61 + 90 * p_tan2 + 298 * c + 45 * p_tan4 - 252 * E_P2 - 3 * c2))
+
+    longitude = (d -
+                 d3 / 6 * (1 + 2 * p_tan2 + c) +
+                 d5 / 120 * (5 - 2 * c + 28 * p_tan2 - 3 * c2 + 8 * E_P2 + 24 * p_tan4)) / p_cos
+
+    central_longitude = (zone_number - 1) * 6 - 180 + 3
+    return (numpy.degrees(latitude),
+            numpy.degrees(longitude) + central_longitude)
 
-__all__ = ["TidalForcing", "BathymetryDepthExpression"]
 
 # We need to store tnci_time as a non-class variable, otherwise
 # dolfin-adjoint tries to be clever and restores its values during the
@@ -36,6 +132,7 @@ class TidalForcing(Expression):
         """
 
     def __init__(self, **kwargs):
+        _import_dependencies()
         self.t = 0
         self.utm_zone = kwargs["utm_zone"]
         self.utm_band = kwargs["utm_band"]
@@ -66,6 +163,93 @@ class TidalForcing(Expression):
           values[0] = numpy.NaN
 
 
+class BoundaryTidalForcing(BoundaryForcing):
+    """Create a tidal boundary forcing from OTPSnc NetCDF files that is
+       evaluated for all boundary degrees of freedom at once.
+
+       It takes the same parameters as :class:`TidalForcing` and in addition
+       the function space V of the free-surface, the facet markers and the
+       ids of the forced boundaries. It can be used instead of
+       :class:`TidalForcing` in a :class:`BoundaryConditionSet`, e.g.::
+
+         eta_expr = BoundaryTidalForcing(V, domain.facet_ids, [1, 2], ...)
+         bcs.add_bc("eta", eta_expr, facet_id=1)
+         bcs.add_bc("eta", eta_expr, facet_id=2)
+
+       The boundary coordinates are converted to lat/lon once, and the real
+       and imaginary parts (hRe and hIm) of each constituent are interpolated
+       onto the boundary degrees of freedom once. Each time update is then
+       the harmonic sum of uptide with the nodal corrections f, u and the
+       equilibrium phases V0 of the initial time, which is a single
+       matrix-vector product. Since the interpolation is linear, this gives
+       the same values as interpolating the tidal signal of each time.
+       Degrees of freedom that lie in the land mask of the tidal data get
+       the value NaN.
+        """
+
+    def __init__(self, V, facet_ids, boundary_ids, **kwargs):
+        _import_dependencies()
+        BoundaryForcing.__init__(self, V, facet_ids, boundary_ids)
+        self._parameters = kwargs
+
+        tide = uptide.Tides(kwargs["constituents"])
+        tide.set_initial_time(kwargs["initial_time"])
+        tnci = uptide.tidal_netcdf.OTPSncTidalInterpolator(tide,
+                    kwargs["grid_file_name"], kwargs["data_file_name"], kwargs["ranges"])
+
+        # OTPS has lon, lat coordinates!
+        lat, lon = _utm_to_latlon(self.coordinates[:, 0],
+                                  self.coordinates[:, 1],
+                                  kwargs["utm_zone"], kwargs["utm_band"])
+        lonlat = zip(lon, lat)
+
+        # The harmonic sum of uptide.Tides.from_complex_components
+        self.omega = numpy.array(tide.omega, dtype=float)
+        self.phase = numpy.array(tide.phi, dtype=float) + numpy.array(tide.u)
+        self.f = numpy.array(tide.f, dtype=float)
+        self.table = self._interpolate_table(tnci, lonlat)
+
+    def cache_key(self):
+        return repr(sorted(self._parameters.items()))
+
+    def _basis(self, t):
+        """ Returns the harmonic basis of the real and imaginary parts,
+        (f cos(omega t + V0 + u), -f sin(omega t + V0 + u)). """
+        t = numpy.atleast_1d(t)[:, numpy.newaxis]
+        arg = self.omega * t + self.phase
+        return numpy.hstack((self.f * numpy.cos(arg),
+                             -self.f * numpy.sin(arg)))
+
+    def _interpolate_table(self, tnci, lonlat):
+        """ Interpolates the real and imaginary parts of all constituents onto
+        the boundary degrees of freedom. Returns one row per degree of
+        freedom. """
+        log(INFO, "Interpolating the tidal constituents onto %i boundary "
+                  "degrees of freedom." % len(lonlat))
+
+        nci = tnci.nci
+        grids = list(tnci.real_part) + list(tnci.imag_part)
+        interpolators = [uptide.netcdf_reader.Interpolator(
+                             nci.origin, nci.delta, grid, nci.mask)
+                         for grid in grids]
+
+        table = numpy.empty((len(lonlat), len(grids)))
+        for i, point in enumerate(lonlat):
+            try:
+                table[i] = [interpolator.get_val(point,
+                                                 allow_extrapolation=True)
+                            for interpolator in interpolators]
+            except uptide.netcdf_reader.CoordinateError:
+                table[i] = numpy.NaN
+
+        return table
+
+    def evaluate(self, t):
+        """ Evaluates the tidal forcing at the boundary degrees of freedom. """
+        log(INFO, "Setting tidal forcing time to %f " % t)
+        return numpy.dot(self.table, self._basis(t)[0])
+
+
 class BathymetryDepthExpression(Expression):
     """Create a bathymetry depth Expression from a lat/lon NetCDF file, where
        the depth values stored as "z" field. 
@@ -76,12 +260,27 @@ class BathymetryDepthExpression(Expression):
         utm_band
         maxval. Default value is 10
         domain. Default value is None
+
+       Evaluating the Expression point by point is slow on fine meshes. Use
+       :meth:`to_function` to interpolate the depth onto all degrees of
+       freedom of a function space at once, e.g.::
+
+         V = FunctionSpace(domain.mesh, "CG", 1)
+         prob_params.depth = bathy_expr.to_function(V, cache_file="depth.h5")
        
        """
     def __init__(self, *args, **kwargs):
+        _import_dependencies()
+        # this imports NetCDFFile from netCDF4, Scientific.IO.NetCDF or scipy.io.netcdf (whichever is available)
+        from uptide.netcdf_reader import NetCDFFile
+        import scipy.interpolate
 
         self._domain = kwargs.get("domain", None)
-        nc = NetCDFFile(kwargs["filename"], 'r')
+        if "filename" in kwargs:
+            self.filename = kwargs["filename"]
+        else:
+            self.filename = args[0]
+        nc = NetCDFFile(self.filename, 'r')
 
         lat = nc.variables['lat']
         lon = nc.variables['lon']
@@ -101,3 +300,147 @@ class BathymetryDepthExpression(Expression):
 	" Evaluates the bathymetry at a point. """
         lat, lon = utm.to_latlon(x[0], x[1], self.utm_zone, self.utm_band)
         values[0] = max(self.maxval, -self.interpolator(lat, lon))
+
+    def _cache_key(self, V):
+        """ Returns the name of the depth dataset in the cache file. The name
+        depends on the NetCDF file, the parameters and the (global) mesh. """
+        mesh = V.mesh()
+        comm = mesh.mpi_comm()
+        coordinates = mesh.coordinates()
+        mesh_key = "%i %i %.8e %.8e" % (
+            MPI.sum(comm, mesh.num_cells()),
+            MPI.sum(comm, len(coordinates)),
+            MPI.sum(comm, float(coordinates[:, 0].sum())),
+            MPI.sum(comm, float(coordinates[:, 1].sum())))
+
+        sha = hashlib.sha1()
+        sha.update(os.path.abspath(self.filename))
+        sha.update(repr(os.path.getmtime(self.filename)))
+        sha.update(repr((self.utm_zone, self.utm_band, self.maxval)))
+        sha.update(str(V.ufl_element()))
+        sha.update(mesh_key)
+        return "/depth_" + sha.hexdigest()
+
+    def to_function(self, V, cache_file=None):
+        """ Interpolates the bathymetry onto the degrees of freedom of a
+        function space.
+
+        All degree of freedom coordinates are converted to lat/lon at once and
+        the spline is evaluated in a single call.
+
+        :param V: A scalar function space.
+        :param cache_file: If not None, the depth is stored in this HDF5 file
+            and loaded from it if the same NetCDF file, parameters and mesh
+            were used before.
+        :type cache_file: str
+        :returns: A :class:`dolfin.Function` -- the depth.
+        """
+        depth = Function(V, name="depth")
+
+        if cache_file is not None:
+            key = self._cache_key(V)
+            if os.path.exists(cache_file):
+                f = HDF5File(V.mesh().mpi_comm(), cache_file, "r")
+                cached = f.has_dataset(key)
+                if cached:
+                    log(INFO, "Loading bathymetry from %s." % cache_file)
+                    f.read(depth, key)
+                f.close()
+                if cached:
+                    return depth
+
+        # Coordinates of the degrees of freedom owned by this process
+        n = depth.vector().local_size()
+        x = V.tabulate_dof_coordinates().reshape(-1, 2)[:n]
+
+        lat, lon = _utm_to_latlon(x[:, 0], x[:, 1], self.utm_zone, self.utm_band)
+        values = numpy.maximum(self.maxval, -self.interpolator.ev(lat, lon))
+        depth.vector().set_local(values)
+        depth.vector().apply("insert")
+
+        if cache_file is not None:
+            mode = "a" if os.path.exists(cache_file) else "w"
+            f = HDF5File(V.mesh().mpi_comm(), cache_file, mode)
+            f.write(depth, key)
+            f.close()
+
+        return depth
+
+
+class VelocityTimeSeries(Function):
+    """A DG0 velocity Function that is read from a HDF5 time series, e.g. as
+       written by `scripts/fvcom_to_otf.py`. The file contains the datasets
+       "velocity/times" (in seconds) and "velocity/u" (time levels x cells x 2)
+       with the cells in the order of the mesh in the same file.
+
+       Setting the attribute t linearly interpolates between the time levels,
+       so that the Function can be used in a :class:`BoundaryConditionSet`.
+       Only the two time levels around t are held in memory.
+
+       Parameters are:
+        V. A vector DG0 function space on the mesh of the file
+        filename. The HDF5 filename
+        """
+
+    def __init__(self, V, filename):
+        import h5py
+
+        Function.__init__(self, V)
+        self._file = h5py.File(filename, "r")
+        self.times = self._file["velocity/times"][:]
+        self._u = self._file["velocity/u"]
+        self._levels = {}
+
+        mesh = V.mesh()
+        dim = mesh.topology().dim()
+        global_cells = numpy.array(mesh.topology().global_indices(dim),
+                                   dtype=int)
+        if len(global_cells) == 0:
+            global_cells = numpy.arange(mesh.num_cells())
+
+        # The (owned) dofs of the two velocity components in each cell
+        cell_dofs = numpy.array([V.dofmap().cell_dofs(c)
+                                 for c in range(mesh.num_cells())])
+        owned = (cell_dofs < self.vector().local_size()).all(axis=1)
+        self._cells = global_cells[owned]
+        self._dofs = cell_dofs[owned]
+
+        self._values = dolfin.Function(V)
+        self._t = None
+
+    def _level(self, i):
+        """ Returns the velocities of time level i in the local cells. """
+        if i not in self._levels:
+            # Keep at most two time levels
+            if len(self._levels) >= 2:
+                self._levels.pop(max(self._levels, key=lambda j: abs(j - i)))
+            self._levels[i] = self._u[i][self._cells]
+        return self._levels[i]
+
+    def _get_t(self):
+        return self._t
+
+    def _set_t(self, t):
+        t = float(t)
+        if t == self._t:
+            return
+        self._t = t
+
+        # Linear interpolation between the time levels, constant outside
+        i = numpy.searchsorted(self.times, t) - 1
+        i = min(max(i, 0), len(self.times) - 2)
+        if len(self.times) == 1:
+            u = self._level(0)
+        else:
+            w = (t - self.times[i]) / (self.times[i + 1] - self.times[i])
+            w = min(max(w, 0.), 1.)
+            u = (1 - w) * self._level(i) + w * self._level(i + 1)
+
+        values = self._values.vector().get_local()
+        values[self._dofs] = u
+        self._values.vector().set_local(values)
+        self._values.vector().apply("insert")
+        self.assign(self._values)
+
+    t = property(_get_t, _set_t, doc="The current time in seconds. Setting "
+                                     "it updates the velocity.")
@@ -3,6 +3,7 @@ import numpy
 from dolfin import *
 from dolfin_adjoint import *
 from turbine_function import TurbineFunction
+from profiling import profiled
 
 class TurbineCache(dict):
     def __init__(self, *args, **kw):
@@ -37,6 +38,22 @@ class TurbineCache(dict):
         self._controlled_by = specification.controls
 
 
+    def second_derivative(self, n, var1, var2):
+        """ Returns the second derivative of the turbine field with respect
+        to two parameters ("turbine_friction", "turbine_pos_x" or
+        "turbine_pos_y") of turbine n.
+
+        The second derivatives are not cached, since the Hessian of the
+        turbine field is only needed for Newton-type optimisation methods. """
+        if self._specification.smeared or self._controlled_by.dynamic_friction:
+            raise NotImplementedError("Second derivatives are only "
+                                      "implemented for discrete turbines "
+                                      "with static controls.")
+        return self._turbines(derivative_index=n, derivative_var=var1,
+                              second_derivative_var=var2,
+                              name="turbine_friction_second_derivative")
+
+    @profiled("turbine_cache_update")
     def update(self, farm):
         """Creates a list of all turbine function/derivative interpolations.
         This list is used as a cache to avoid the recomputation of the expensive
@@ -84,6 +101,7 @@ class TurbineCache(dict):
         # Precompute the interpolation of the friction function of all turbines.
         turbines = TurbineFunction(self, self._function_space,
                                    self._specification)
+        self._turbines = turbines
 
         # If the turbine friction is controlled dynamically, we need to cache
         # the turbine field for every timestep.
@@ -5,6 +5,41 @@ from dolfin_adjoint import *
 
 __all__ = ["TurbineFunction"]
 
+
+def _bump_second_derivative(exp, x_unit, y_unit, fric, radius, var1, var2):
+    """ Returns the second derivative of one bump turbine exp*fric with
+    respect to two of its parameters (turbine_friction, turbine_pos_x or
+    turbine_pos_y). """
+    variables = ("turbine_friction", "turbine_pos_x", "turbine_pos_y")
+    if var1 not in variables or var2 not in variables:
+        raise ValueError("Unknown derivative variable.")
+
+    # First and second derivatives of the exponent -1/(1-u^2) with respect to
+    # the unit coordinate u. The unit coordinate decreases with the turbine
+    # position with the rate 1/radius.
+    dx = -2*x_unit/((1.0-x_unit**2)**2)
+    dy = -2*y_unit/((1.0-y_unit**2)**2)
+    ddx = -2/((1.0-x_unit**2)**2) - 8*x_unit**2/((1.0-x_unit**2)**3)
+    ddy = -2/((1.0-y_unit**2)**2) - 8*y_unit**2/((1.0-y_unit**2)**3)
+    first = {"turbine_pos_x": dx*(-1.0/radius),
+             "turbine_pos_y": dy*(-1.0/radius)}
+
+    if var1 == var2 == "turbine_friction":
+        return numpy.zeros(len(exp))
+
+    if "turbine_friction" in (var1, var2):
+        other = var2 if var1 == "turbine_friction" else var1
+        return exp*first[other]
+
+    if var1 == var2 == "turbine_pos_x":
+        return exp*(dx**2 + ddx)*fric/radius**2
+
+    if var1 == var2 == "turbine_pos_y":
+        return exp*(dy**2 + ddy)*fric/radius**2
+
+    return exp*dx*dy*fric/radius**2
+
+
 class TurbineFunction(object):
 
     def __init__(self, cache, V, turbine_specification):
@@ -20,10 +55,12 @@ class TurbineFunction(object):
 
 
     def __call__(self, name="", derivative_index=None, derivative_var=None,
-                 timestep=None):
+                 timestep=None, second_derivative_var=None):
         """If the derivative selector is i >= 0, the Expression will compute the
         derivative of the turbine with index i with respect to either the x or y
-        coorinate or its friction parameter. """
+        coorinate or its friction parameter. If second_derivative_var is also
+        given, the second derivative with respect to derivative_var and
+        second_derivative_var is computed. """
 
         params = self._parameters
 
@@ -63,13 +100,18 @@ class TurbineFunction(object):
             # friction.
             exp = numpy.exp(-1./(1-x_unit**2)-1./(1-y_unit**2)+2)
 
-            if derivative_index is None:
+            if second_derivative_var is not None:
+                ff += _bump_second_derivative(exp, x_unit, y_unit, fric,
+                                              radius, derivative_var,
+                                              second_derivative_var)
+
+            elif derivative_index is None:
                 ff += exp*fric
 
             elif derivative_var == "turbine_friction":
                 ff += exp
 
-            if derivative_var == "turbine_pos_x":
+            elif derivative_var == "turbine_pos_x":
                 ff += exp*(-2*x_unit/((1.0-x_unit**2)**2))*fric*(-1.0/radius)
 
             elif derivative_var == "turbine_pos_y":
@@ -1,52 +1,176 @@
-from pylab import *
-import matplotlib.tri as Tri
+''' Converts FVCOM meshes and velocity fields to OpenTidalFarm compatible
+files.
+
+The NetCDF file is read in chunks of time levels and the output is written in
+vectorised blocks, so that FVCOM outputs of several GB can be converted with
+a small memory footprint. The mesh and the velocities can optionally be
+restricted to a bounding box and a time window.
+
+Output formats (chosen by the file extension):
+
+* .h5: the mesh is stored in the dolfin HDF5 layout (dataset "/mesh") and can
+  be loaded with :class:`opentidalfarm.FileDomain`. The velocities are
+  stored as "/velocity/u" (time levels x cells x 2) and "/velocity/times"
+  (seconds since the first converted time level) and can be loaded with
+  :class:`opentidalfarm.VelocityTimeSeries`. A .xdmf file for visualisation is
+  written next to it.
+* .xml: the mesh and one DG0 function file per time level in dolfin XML.
+'''
+import os.path
+import numpy
 import netCDF4
-import datetime as dt
 
 
 class FVCOMReader(object):
 
-    def __init__(self, ncfile):
+    def __init__(self, ncfile, bbox=None, time_window=None):
+        """ Reads a FVCOM NetCDF file.
+
+            Parameters:
+
+            ncfile: The FVCOM filename (.nc)
+            bbox: If not None, only the triangles inside the box
+                  (xmin, xmax, ymin, ymax) are read.
+            time_window: If not None, only the time levels with
+                         start <= julianTime <= end for (start, end) are
+                         read. """
         self.nc = netCDF4.Dataset(ncfile).variables
 
-    @property
-    def triangles(self):
-        return self.nc["trinodes"]
+        # The node coordinates and triangles are needed in full
+        x = numpy.asarray(self.nc["x"][:], dtype=float)
+        y = numpy.asarray(self.nc["y"][:], dtype=float)
+        triangles = numpy.asarray(self.nc["trinodes"][:], dtype=numpy.int64)
 
-    @property
-    def nodes(self):
-        return zip(self.nc["x"], self.nc["y"])
+        # Select the triangles with all nodes inside the bounding box
+        if bbox is not None:
+            xmin, xmax, ymin, ymax = bbox
+            inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+            self.cells = numpy.where(inside[triangles].all(axis=1))[0]
+        else:
+            self.cells = numpy.arange(len(triangles))
+
+        # Renumber the nodes of the selected triangles
+        triangles = triangles[self.cells]
+        used_nodes, triangles = numpy.unique(triangles, return_inverse=True)
+        self.triangles = triangles.reshape(-1, 3)
+        self.nodes = numpy.column_stack((x[used_nodes], y[used_nodes]))
+
+        # Select the time levels
+        self.julian_time = numpy.asarray(self.nc["julianTime"][:], dtype=float)
+        if time_window is not None:
+            start, end = time_window
+            self.timelevels = numpy.where((self.julian_time >= start) &
+                                          (self.julian_time <= end))[0]
+        else:
+            self.timelevels = numpy.arange(len(self.julian_time))
 
     @property
-    def velocity_x(self):
-        for timelevel in range(len(self.nc["ua"])):
-            yield self.nc["ua"][timelevel]
+    def times(self):
+        """ The selected times in seconds since the first selected time
+            level. """
+        julian_time = self.julian_time[self.timelevels]
+        return (julian_time - julian_time[0]) * 24 * 60 * 60
+
+    def velocity_chunks(self, chunk_size=10):
+        """ Yields (first time level, velocity array) tuples, where the velocity
+            array has the shape (time levels, cells, 2) and contains at most
+            chunk_size time levels. """
+        for i in range(0, len(self.timelevels), chunk_size):
+            levels = self.timelevels[i:i + chunk_size]
+            # Read a contiguous block of time levels and select afterwards
+            block = slice(levels[0], levels[-1] + 1)
+            ua = numpy.asarray(self.nc["ua"][block])[levels - levels[0]][:, self.cells]
+            va = numpy.asarray(self.nc["va"][block])[levels - levels[0]][:, self.cells]
+            yield i, numpy.dstack((ua, va))
+
+
+class HDF5Writer(object):
+
+    def __init__(self, filename):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Writing .h5 files requires h5py. Install it "
+                              "(pip install h5py) or use .xml output files.")
+        self.filename = filename
+        self.f = h5py.File(filename, "w")
+
+    def write_mesh(self, nodes, triangles):
+        """ Writes the mesh in the layout that dolfin's HDF5File reads. """
+        group = self.f.create_group("mesh")
+        group.create_dataset("coordinates", data=nodes)
+        topology = group.create_dataset("topology", data=triangles)
+        topology.attrs["celltype"] = numpy.string_("triangle")
+        group.create_dataset("cell_indices",
+                             data=numpy.arange(len(triangles), dtype=numpy.int64))
+
+    def create_velocity(self, times, num_cells):
+        """ Creates the velocity datasets, which are filled with
+            write_velocity. """
+        group = self.f.create_group("velocity")
+        group.create_dataset("times", data=times)
+        return group.create_dataset("u", shape=(len(times), num_cells, 2),
+                                    dtype=float,
+                                    chunks=(1, min(num_cells, 65536), 2))
+
+    def write_velocity(self, first_timelevel, velocity):
+        self.f["velocity/u"][first_timelevel:first_timelevel + len(velocity)] = velocity
+
+    def write_xdmf(self, filename):
+        """ Writes a XDMF file that references the HDF5 datasets for
+            visualisation in ParaView. """
+        h5 = os.path.basename(self.filename)
+        num_nodes = self.f["mesh/coordinates"].shape[0]
+        num_cells = self.f["mesh/topology"].shape[0]
+
+        mesh = ('      <Topology TopologyType="Triangle" NumberOfElements="{nc}">\n'
+                '        <DataItem Dimensions="{nc} 3" NumberType="Int" Precision="8" Format="HDF">{h5}:/mesh/topology</DataItem>\n'
+                '      </Topology>\n'
+                '      <Geometry GeometryType="XY">\n'
+                '        <DataItem Dimensions="{nn} 2" Format="HDF">{h5}:/mesh/coordinates</DataItem>\n'
+                '      </Geometry>\n').format(nc=num_cells, nn=num_nodes, h5=h5)
 
-    @property
-    def velocity_y(self):
-        for timelevel in range(len(self.nc["va"])):
-            yield self.nc["va"][timelevel]
+        f = open(filename, "w")
+        f.write('<?xml version="1.0"?>\n')
+        f.write('<Xdmf Version="2.0">\n  <Domain>\n')
 
-    @property
-    def velocity(self):
-        for timelevel in range(len(self.nc["ua"])):
-            yield zip(self.nc["ua"][timelevel], self.nc["va"][timelevel])
+        if "velocity" not in self.f:
+            f.write('    <Grid Name="mesh" GridType="Uniform">\n')
+            f.write(mesh)
+            f.write('    </Grid>\n')
+        else:
+            times = self.f["velocity/times"][:]
+            f.write('    <Grid Name="velocity" GridType="Collection" CollectionType="Temporal">\n')
+            for i, t in enumerate(times):
+                f.write('    <Grid Name="mesh" GridType="Uniform">\n')
+                f.write('      <Time Value="{}" />\n'.format(t))
+                f.write(mesh)
+                f.write('      <Attribute Name="velocity" AttributeType="Vector" Center="Cell">\n'
+                        '        <DataItem ItemType="HyperSlab" Dimensions="{nc} 2">\n'
+                        '          <DataItem Dimensions="3 3" Format="XML">{i} 0 0 1 1 1 1 {nc} 2</DataItem>\n'
+                        '          <DataItem Dimensions="{nt} {nc} 2" Format="HDF">{h5}:/velocity/u</DataItem>\n'
+                        '        </DataItem>\n'
+                        '      </Attribute>\n'.format(i=i, nc=num_cells,
+                                                     nt=len(times), h5=h5))
+                f.write('    </Grid>\n')
+            f.write('    </Grid>\n')
+
+        f.write('  </Domain>\n</Xdmf>\n')
+        f.close()
 
-    @property
-    def julianTime(self):
-        return self.nc["julianTime"]
+    def close(self):
+        self.f.close()
 
 
-class FEniCSWriter(object):
+class XMLWriter(object):
 
     def write_mesh(self, nodes, triangles, filename):
         """ Writes a FEniCS compatible xml mesh.
 
             Parameters:
 
-            nodes: A list of (x, y) tuples with the node positions
-            triangles: A list of (n1, n2, n3) tuples with the node ids of each
-                       triangle
+            nodes: A (n, 2) array with the node positions
+            triangles: A (m, 3) array with the node ids of each triangle
             filename: The output file (.xml) """
 
         f = open(filename, "w")
@@ -58,16 +182,15 @@ class FEniCSWriter(object):
 
         # Write nodes
         f.write('    <vertices size="{}">\n'.format(len(nodes)))
-
-        for i, (x, y) in enumerate(nodes):
-            f.write('      <vertex index="{}" x="{}" y="{}" />\n'.format(i, x, y))
-        f.write('    </vertices>')
+        numpy.savetxt(f, numpy.column_stack((numpy.arange(len(nodes)), nodes)),
+                      fmt='      <vertex index="%d" x="%.17g" y="%.17g" />')
+        f.write('    </vertices>\n')
 
         # Write elements
         f.write('    <cells size="{}">\n'.format(len(triangles)))
-
-        for i, (n1, n2, n3) in enumerate(triangles):
-            f.write('      <triangle index="{}" v0="{}" v1="{}" v2="{}" />\n'.format(i, n1, n2, n3))
+        numpy.savetxt(f, numpy.column_stack((numpy.arange(len(triangles)),
+                                             triangles)),
+                      fmt='      <triangle index="%d" v0="%d" v1="%d" v2="%d" />')
         f.write('    </cells>\n')
 
         # Write footer
@@ -81,9 +204,11 @@ class FEniCSWriter(object):
 
             Parameters:
 
-            values: A list of float or tuple of floats with the function values
+            values: A (cells, dim) array with the function values
             filename: The output file (.xml) """
 
+        values = numpy.asarray(values).reshape(len(values), -1)
+        num_cells, dim = values.shape
 
         f = open(filename, "w")
 
@@ -91,72 +216,105 @@ class FEniCSWriter(object):
         f.write('<?xml version="1.0"?>\n')
         f.write('<dolfin xmlns:dolfin="http://fenicsproject.org">\n')
 
-        # Vector or scalar function?
-        if not hasattr(values[0], '__iter__'):
-            dim = 1
-        else:
-            dim = len(values[0])
-
         # Write function values
-        f.write('  <function_data size="{}">\n'.format(len(values)*dim))
-        idx = 0
-        for i, value in enumerate(values):
-            if dim == 1:
-                f.write('    <dof index="{}" value="{}" cell_index="{}" cell_dof_index="{}" />\n'.format(idx, value, i, 0))
-                idx += 1
-            else:
-                for d, v in enumerate(value):
-                    f.write('    <dof index="{}" value="{}" cell_index="{}" cell_dof_index="{}" />\n'.format(idx, value[d], i, d))
-                    idx += 1
+        f.write('  <function_data size="{}">\n'.format(values.size))
+        table = numpy.column_stack((numpy.arange(values.size),
+                                    values.flatten(),
+                                    numpy.repeat(numpy.arange(num_cells), dim),
+                                    numpy.tile(numpy.arange(dim), num_cells)))
+        numpy.savetxt(f, table, fmt='    <dof index="%d" value="%.17g" '
+                                    'cell_index="%d" cell_dof_index="%d" />')
         f.write('  </function_data>\n')
 
         # Write footer
         f.write('</dolfin>')
+        f.close()
+
 
-def plot(args):
-    from dolfin import plot, interactive, Mesh, Function, VectorFunctionSpace
+def plot(args, fvcom_reader):
+    from dolfin import plot, interactive, Function, VectorFunctionSpace
+    from opentidalfarm import FileDomain, VelocityTimeSeries
 
     # Plot the mesh
-    mesh = Mesh(args.xml)
+    mesh = FileDomain(args.mesh).mesh
     plot(mesh, title="Mesh")
     interactive()
 
     # Plot velocities
     if args.velocity is not None:
         G = VectorFunctionSpace(mesh, "DG", 0)
-        base_file = args.velocity[:-4] + "_{}.xml"
 
-        for i, u in enumerate(fvcom_reader.velocity):
-            g = Function(G, base_file.format(i))
-            plot(g, title="Velocity time={}".format(i))
-            interactive()
+        if args.velocity.endswith(".h5"):
+            g = VelocityTimeSeries(G, args.velocity)
+            for i, t in enumerate(g.times):
+                g.t = t
+                plot(g, title="Velocity time={}".format(i))
+                interactive()
+        else:
+            base_file = args.velocity[:-4] + "_{}.xml"
+            for i in range(len(fvcom_reader.timelevels)):
+                g = Function(G, base_file.format(i))
+                plot(g, title="Velocity time={}".format(i))
+                interactive()
 
 
 if __name__ == "__main__":
     import argparse
 
     # Read the command line arguments
-    parser = argparse.ArgumentParser(description="Converts FVCOM meshes and velocity fields to OpenTidalFarm compatible xml files")
+    parser = argparse.ArgumentParser(description="Converts FVCOM meshes and velocity fields to OpenTidalFarm compatible HDF5 or xml files")
     parser.add_argument('--nc', required=True, help='input FVCOM filename (.nc extension)')
-    parser.add_argument('--xml', required=True, help='output OpenTidalFarm mesh filename (.xml extension)')
-    parser.add_argument('--velocity', help='output OpenTidalFarm velocity filename (.xml extension)')
-    parser.add_argument('--plot', action='store_true', help='plot the results')
+    parser.add_argument('--mesh', '--xml', required=True, help='output OpenTidalFarm mesh filename (.h5 or .xml extension)')
+    parser.add_argument('--velocity', help='output OpenTidalFarm velocity filename (.h5 or .xml extension). If it is the same .h5 file as the mesh, both are stored in one file')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'XMAX', 'YMIN', 'YMAX'), help='only convert the triangles inside this box')
+    parser.add_argument('--time-window', type=float, nargs=2, metavar=('START', 'END'), help='only convert the time levels in this julianTime window')
+    parser.add_argument('--chunk-size', type=int, default=10, help='number of time levels that are read at once (default: 10)')
+    parser.add_argument('--plot', action='store_true', help='plot the mesh and the velocities')
     args = parser.parse_args()
 
-    fvcom_reader = FVCOMReader(args.nc)
+    fvcom_reader = FVCOMReader(args.nc, bbox=args.bbox,
+                               time_window=args.time_window)
+    nodes, triangles = fvcom_reader.nodes, fvcom_reader.triangles
 
-    fenics_writer = FEniCSWriter()
-    fenics_writer.write_mesh(fvcom_reader.nodes, fvcom_reader.triangles, args.xml)
-    print "Wrote {}".format(args.xml)
+    if args.mesh.endswith(".h5"):
+        mesh_writer = HDF5Writer(args.mesh)
+        mesh_writer.write_mesh(nodes, triangles)
+    else:
+        mesh_writer = None
+        XMLWriter().write_mesh(nodes, triangles, args.mesh)
+    print "Wrote {} ({} nodes, {} triangles)".format(args.mesh, len(nodes),
+                                                      len(triangles))
 
     # Write velocity fields
     if args.velocity is not None:
-        base_file = args.velocity[:-4] + "_{}.xml"
-        for i, u in enumerate(fvcom_reader.velocity):
-            fenics_writer.write_dg0_function(u, base_file.format(i))
-            print "Wrote {}".format(base_file.format(i))
+        if args.velocity.endswith(".h5"):
+            if mesh_writer is not None and args.velocity == args.mesh:
+                writer = mesh_writer
+            else:
+                writer = HDF5Writer(args.velocity)
+                writer.write_mesh(nodes, triangles)
+            writer.create_velocity(fvcom_reader.times, len(triangles))
+
+            for i, u in fvcom_reader.velocity_chunks(args.chunk_size):
+                writer.write_velocity(i, u)
+                print "Wrote time levels {} to {}".format(i, i + len(u) - 1)
+
+            writer.write_xdmf(args.velocity[:-3] + ".xdmf")
+            if writer is not mesh_writer:
+                writer.close()
+        else:
+            base_file = args.velocity[:-4] + "_{}.xml"
+            for i, u in fvcom_reader.velocity_chunks(args.chunk_size):
+                for j in range(len(u)):
+                    XMLWriter().write_dg0_function(u[j], base_file.format(i + j))
+                    print "Wrote {}".format(base_file.format(i + j))
+
+    if mesh_writer is not None:
+        if args.velocity != args.mesh:
+            mesh_writer.write_xdmf(args.mesh[:-3] + ".xdmf")
+        mesh_writer.close()
 
     print "Conversion finished."
 
     if args.plot:
-        plot(args)
+        plot(args, fvcom_reader)
@@ -1,4 +1,11 @@
 #!/usr/bin/env python
+''' Interpolates a bathymetry NetCDF file onto a CG1 function space.
+
+Usage: generate_bathymetry.py bathymetry.nc utm_zone utm_band mesh.xml output
+
+If output ends with .h5, the depth is stored in a HDF5 file (as dataset
+"depth") that can be loaded with HDF5File.read, otherwise it is written with
+File. '''
 from dolfin import *
 from opentidalfarm import *
 
@@ -11,10 +18,16 @@ utm_band = sys.argv[3]
 meshfile = sys.argv[4]
 output = sys.argv[5]
 
-bathexpr = BathymetryDepthExpression(bathnc, utm_zone, utm_band)
+bathexpr = BathymetryDepthExpression(filename=bathnc, utm_zone=utm_zone,
+                                     utm_band=utm_band)
 mesh = Mesh(meshfile)
 
 V = FunctionSpace(mesh, "CG", 1)
-bath = interpolate(bathexpr, V)
+bath = bathexpr.to_function(V)
 
-File(output) << bath
+if output.endswith(".h5"):
+    f = HDF5File(mesh.mpi_comm(), output, "w")
+    f.write(bath, "depth")
+    f.close()
+else:
+    File(output) << bath
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+''' Reports the time it takes to import opentidalfarm, broken down by module.
+
+Usage: import_profile.py [-n NUMBER] [--all] [module]
+
+The import statement is wrapped so that the time spent in the first import of
+each module is recorded. The total time includes the imports of other modules
+triggered by that module, the self time excludes them. By default only the
+modules of the package and the top-level external packages are listed. '''
+
+import sys
+import time
+import __builtin__
+
+
+class ImportTimer(object):
+    """ Records the cumulative and self time of each module import. """
+
+    def __init__(self):
+        self.total = {}
+        self.self_time = {}
+        self.parents = {}
+        self._stack = []
+        self._import = __builtin__.__import__
+
+    def __enter__(self):
+        __builtin__.__import__ = self._timed_import
+        return self
+
+    def __exit__(self, *args):
+        __builtin__.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=None,
+                      level=-1):
+        modules_before = set(sys.modules)
+        self._stack.append(0.)
+        start = time.time()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+
+            # Only count imports that loaded a new module. Python 2 stores None
+            # for failed implicit relative imports, e.g. "opentidalfarm.numpy"
+            new_modules = set(m for m in set(sys.modules) - modules_before
+                              if sys.modules[m] is not None)
+            if new_modules:
+                # Attribute the time to the deepest new module that was
+                # requested, e.g. "opentidalfarm.tidal" for "tidal"
+                loaded = sorted((m for m in new_modules
+                                 if m == name or m.endswith("." + name)
+                                 or name.startswith(m + ".")), key=len)
+                module = loaded[-1] if loaded else name
+                if globals and level != 0 and "__name__" in globals:
+                    self.parents.setdefault(module, globals["__name__"])
+                self.total[module] = self.total.get(module, 0.) + elapsed
+                self.self_time[module] = (self.self_time.get(module, 0.) +
+                                          elapsed - children)
+
+    def report(self, package, show_all=False, number=30):
+        rows = []
+        for module, total in self.total.iteritems():
+            in_package = module == package or module.startswith(package + ".")
+            parent = self.parents.get(module, "")
+            imported_by_package = (parent == package or
+                                   parent.startswith(package + "."))
+            if show_all or in_package or imported_by_package:
+                rows.append((total, self.self_time[module], module, parent))
+
+        rows.sort(reverse=True)
+        print "%10s %10s  %-40s %s" % ("total [s]", "self [s]", "module",
+                                       "imported by")
+        for total, self_time, module, parent in rows[:number]:
+            print "%10.3f %10.3f  %-40s %s" % (total, self_time, module, parent)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reports the import time of opentidalfarm per module")
+    parser.add_argument('module', nargs='?', default='opentidalfarm', help='the module to import (default: opentidalfarm)')
+    parser.add_argument('-n', '--number', type=int, default=30, help='number of modules to list (default: 30)')
+    parser.add_argument('--all', action='store_true', help='list all imported modules, not only the package and its direct dependencies')
+    args = parser.parse_args()
+
+    start = time.time()
+    with ImportTimer() as timer:
+        __import__(args.module)
+    total = time.time() - start
+
+    timer.report(args.module.split(".")[0], show_all=args.all,
+                 number=args.number)
+    print
+    print "Importing %s took %.3f s." % (args.module, total)
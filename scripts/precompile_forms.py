@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+''' Compiles the forms of an OpenTidalFarm problem into the JIT cache.
+
+The problem script is executed without running its "__main__" block. It
+must define the solver at module level (and optionally the functional), for
+example:
+
+    solver = CoupledSWSolver(problem, solver_params)
+    functional = PowerFunctional(problem)
+
+    if __name__ == "__main__":
+        rf = FenicsReducedFunctional(functional, control, solver)
+        maximize(rf)
+
+Run this script once in serial before starting a parallel run, so that the
+parallel run loads the compiled forms from the cache. '''
+
+import time
+import runpy
+import argparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the forms of an OpenTidalFarm problem script into the JIT cache and reports the compile times")
+    parser.add_argument('script', help='the problem script')
+    parser.add_argument('--solver', default='solver', help='the name of the solver in the script (default: solver)')
+    parser.add_argument('--functional', default='functional', help='the name of the functional in the script (default: functional). The functional is skipped if the script does not define it')
+    args = parser.parse_args()
+
+    from opentidalfarm import precompile_forms
+
+    start = time.time()
+    namespace = runpy.run_path(args.script, run_name="__precompile__")
+    setup_time = time.time() - start
+
+    if args.solver not in namespace:
+        parser.error("%s does not define '%s'." % (args.script, args.solver))
+    solver = namespace[args.solver]
+    functional = namespace.get(args.functional)
+
+    start = time.time()
+    timings = precompile_forms(solver, functional)
+    total = time.time() - start
+
+    print "%-45s %10s" % ("form", "time [s]")
+    for name, seconds in timings:
+        print "%-45s %10.2f" % (name, seconds)
+    print
+    print "Setting up the problem took %.2f s." % setup_time
+    print "Compiling %i forms took %.2f s." % (len(timings), total)
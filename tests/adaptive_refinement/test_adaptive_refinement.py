@@ -0,0 +1,73 @@
+import numpy
+from opentidalfarm import *
+
+
+class TestAdaptiveRefinement(object):
+
+    def test_markers(self):
+        domain = RectangularDomain(0, 0, 3000, 1000, 30, 10)
+        markers = turbine_refinement_markers(domain, [(1500., 500.)], 50.)
+
+        marked = [cell for cell in cells(domain.mesh) if markers[cell]]
+        assert 0 < len(marked) < 20
+        for cell in marked:
+            assert cell.midpoint().distance(Point(1500., 500.)) < 250.
+
+    def test_refinement_follows_turbines(self, steady_sw_channel_rf):
+        domain = RectangularDomain(0, 0, 3000, 1000, 30, 10)
+        rf = AdaptiveReducedFunctional(
+                lambda d: steady_sw_channel_rf(domain=d, diameter=40.),
+                domain, levels=2)
+
+        # The local refinement adds much fewer cells than a uniform one
+        num_cells = rf.domain.mesh.num_cells()
+        assert domain.mesh.num_cells() < num_cells
+        assert num_cells < 2*domain.mesh.num_cells()
+
+        m0 = numpy.array(rf.controls[0].data())
+        j0 = rf.evaluate(m0)
+        fine_rf = rf.rf
+
+        # Small movements keep the mesh
+        assert not rf.adapt(m0 + 5.)
+        assert rf.rf is fine_rf
+
+        # Larger movements adapt the mesh and transfer the state cache
+        m1 = m0.copy()
+        m1[0] += 300.
+        assert rf.adapt(m1)
+        assert rf.rf is not fine_rf
+        assert len(rf.rf.solver.state_cache) == 1
+        farm = rf.rf.solver.problem.parameters.tidal_farm
+        assert farm.turbine_positions[0][0] == m1[0]
+
+        # The functional does not depend much on the mesh
+        assert abs(rf.evaluate(m0) - j0) < 0.05*abs(j0)
+
+    def test_adaptation_keeps_scaling_and_iterations(self,
+            steady_sw_channel_rf):
+        domain = RectangularDomain(0, 0, 3000, 1000, 30, 10)
+        rf = AdaptiveReducedFunctional(
+                lambda d: steady_sw_channel_rf(domain=d, diameter=40.,
+                                               automatic_scaling=5.),
+                domain, levels=2)
+
+        m0 = numpy.array(rf.controls[0].data())
+        dj0 = rf.derivative(m0)
+        factor = rf.rf._automatic_scaling_factor
+        assert factor is not None
+        # The largest scaled derivative is automatic_scaling*diameter
+        assert abs(numpy.abs(dj0).max() - 5.*40.) < 1e-8
+        iterations = (rf.rf.solver.optimisation_iteration,
+                      rf.rf.solver.search_iteration)
+
+        m1 = m0.copy()
+        m1[0] += 300.
+        assert rf.adapt(m1)
+        assert rf.rf._automatic_scaling_factor == factor
+        assert (rf.rf.solver.optimisation_iteration,
+                rf.rf.solver.search_iteration) == iterations
+
+        # The new mesh does not rescale the gradient
+        rf.derivative(m1)
+        assert rf.rf._automatic_scaling_factor == factor
@@ -0,0 +1,56 @@
+import os.path
+import numpy
+import utm
+from scipy.io import netcdf
+from opentidalfarm import *
+from opentidalfarm.tidal import _utm_to_latlon
+
+
+def write_bathymetry(filename):
+    """ Writes a NetCDF file with a smooth bathymetry around 58.6N 3W. """
+    lat = numpy.linspace(58.5, 58.8, 31)
+    lon = numpy.linspace(-3.2, -2.8, 41)
+    LAT, LON = numpy.meshgrid(lat, lon, indexing="ij")
+
+    nc = netcdf.netcdf_file(filename, "w")
+    nc.createDimension("lat", len(lat))
+    nc.createDimension("lon", len(lon))
+    nc.createVariable("lat", "d", ("lat",))[:] = lat
+    nc.createVariable("lon", "d", ("lon",))[:] = lon
+    nc.createVariable("z", "d", ("lat", "lon"))[:] = -(
+        5 + 100 * (LAT - 58.5) + 50 * (LON + 3.2))
+    nc.close()
+
+
+class TestBathymetry(object):
+
+    def test_utm_to_latlon(self):
+        easting = numpy.linspace(480000, 520000, 5)
+        northing = numpy.linspace(6480000, 6520000, 5)
+        lat, lon = _utm_to_latlon(easting, northing, 30, "V")
+        for i in range(5):
+            expected = utm.to_latlon(easting[i], northing[i], 30, "V")
+            # utm < 0.6 differs by up to 1e-9 degrees (about 0.1 mm)
+            assert numpy.allclose((lat[i], lon[i]), expected, rtol=0,
+                                  atol=1e-8)
+
+    def test_to_function(self, tmpdir):
+        filename = os.path.join(str(tmpdir), "bathymetry.nc")
+        cache_file = os.path.join(str(tmpdir), "depth.h5")
+        write_bathymetry(filename)
+
+        bathy_expr = BathymetryDepthExpression(filename=filename, utm_zone=30,
+                                               utm_band="V", maxval=10)
+        domain = RectangularDomain(490000, 6490000, 510000, 6510000, 10, 10)
+        V = FunctionSpace(domain.mesh, "CG", 1)
+
+        depth = bathy_expr.to_function(V, cache_file=cache_file)
+        expected = interpolate(bathy_expr, V)
+        assert numpy.allclose(depth.vector().array(), expected.vector().array())
+        # The maxval is applied
+        assert depth.vector().min() >= 10
+
+        # The second call reads the cache
+        assert os.path.exists(cache_file)
+        cached = bathy_expr.to_function(V, cache_file=cache_file)
+        assert numpy.allclose(cached.vector().array(), depth.vector().array())
@@ -0,0 +1,79 @@
+from opentidalfarm import *
+import numpy
+
+
+class LinearForcing(BoundaryForcing):
+    """ A forcing that is t times the y-coordinate. """
+
+    def evaluate(self, t):
+        return t * self.coordinates[:, 1]
+
+
+class TestBoundaryForcing(object):
+
+    def test_forcing_is_updated_with_bcs(self):
+        domain = RectangularDomain(0, 0, 100, 50, 10, 5)
+        V = FunctionSpace(domain.mesh, "CG", 1)
+        forcing = LinearForcing(V, domain.facet_ids, [1])
+
+        bcs = BoundaryConditionSet()
+        bcs.add_bc("eta", forcing, facet_id=1)
+        bcs.update_time(Constant(2.), only_type=["strong_dirichlet"])
+
+        assert forcing.t == 2.
+        # Left boundary
+        assert abs(forcing((0, 20)) - 40.) < 1e-10
+        # The forcing is zero away from the forced boundary
+        assert abs(forcing((100, 20))) < 1e-10
+
+        # The forcing can be used as a strong boundary condition
+        bc = DirichletBC(V, forcing, domain.facet_ids, 1)
+        values = bc.get_boundary_values()
+        assert numpy.allclose(sorted(values.values()),
+                              sorted(2. * forcing.coordinates[:, 1]))
+
+    def test_forcing_cache(self, tmpdir):
+        domain = RectangularDomain(0, 0, 100, 50, 10, 5)
+        V = FunctionSpace(domain.mesh, "CG", 1)
+        times = [0., 0.5, 1.]
+
+        class CountingForcing(LinearForcing):
+            evaluations = 0
+
+            def cache_key(self):
+                return "linear"
+
+            def evaluate(self, t):
+                CountingForcing.evaluations += 1
+                return LinearForcing.evaluate(self, t)
+
+        # The first run fills the cache
+        forcing = CountingForcing(V, domain.facet_ids, [1, 2])
+        forcing.use_cache(times, cache_dir=str(tmpdir))
+        for t in times:
+            forcing.t = t
+        assert CountingForcing.evaluations == 3
+
+        # Later runs read the values from the cache
+        forcing = CountingForcing(V, domain.facet_ids, [1, 2])
+        forcing.use_cache(times, cache_dir=str(tmpdir))
+        for t in times:
+            forcing.t = t
+        assert CountingForcing.evaluations == 3
+        assert abs(forcing((0, 20)) - 20.) < 1e-10
+
+        # Times that are not in the cache are evaluated
+        forcing.t = 2.
+        assert CountingForcing.evaluations == 4
+
+        # Forcings on other boundaries or in other spaces use other caches
+        forcing = CountingForcing(V, domain.facet_ids, [1])
+        forcing.use_cache(times, cache_dir=str(tmpdir))
+        forcing.t = 1.
+        assert CountingForcing.evaluations == 5
+
+        V2 = FunctionSpace(domain.mesh, "CG", 2)
+        forcing = CountingForcing(V2, domain.facet_ids, [1, 2])
+        forcing.use_cache(times, cache_dir=str(tmpdir))
+        forcing.t = 1.
+        assert CountingForcing.evaluations == 6
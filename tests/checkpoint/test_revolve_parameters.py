@@ -0,0 +1,59 @@
+import os
+import pytest
+from opentidalfarm import *
+
+
+class TestRevolveParameters(object):
+
+    def test_repetitions(self):
+        # With one snapshot, revolve recomputes up to n-1 timesteps
+        assert helpers.revolve_repetitions(10, 1) == 9
+        # binomial(5 + 2, 5) = 21 >= 20 timesteps
+        assert helpers.revolve_repetitions(20, 5) == 2
+        assert helpers.revolve_repetitions(22, 5) == 3
+        assert helpers.revolve_repetitions(5, 10) == 1
+
+    def test_snapshots_fit_into_ram_budget(self):
+        strategy, snaps_on_disk, snaps_in_ram, verbose = \
+            helpers.revolve_parameters(1000, snapshot_size=100,
+                                       ram_budget=5000)
+        assert snaps_in_ram == 50
+        assert snaps_on_disk == 0
+
+    def test_disk_snapshots_limit_recomputation(self):
+        strategy, snaps_on_disk, snaps_in_ram, verbose = \
+            helpers.revolve_parameters(1000, snapshot_size=100,
+                                       ram_budget=500, use_disk=True)
+        assert snaps_in_ram == 5
+        assert snaps_on_disk > 0
+        assert helpers.revolve_repetitions(1000,
+                                           snaps_in_ram + snaps_on_disk) <= 2
+
+    def test_no_checkpointing_if_all_timesteps_fit(self):
+        assert helpers.revolve_parameters(10, 100, 5000) is None
+
+    def test_too_small_budget_raises(self):
+        with pytest.raises(ValueError):
+            helpers.revolve_parameters(10, 100, 50)
+
+    def test_snapshot_directory_keeps_callback_directory(self, tmpdir):
+        snapshot_dir = tmpdir.mkdir("snapshots")
+        cwd = os.getcwd()
+        params = CoupledSWSolver.default_parameters()
+        directories = []
+        params.callback = lambda sol: directories.append(os.getcwd())
+
+        with helpers.snapshot_directory(str(snapshot_dir), params):
+            assert os.path.realpath(os.getcwd()) == snapshot_dir.realpath()
+            params.callback(None)
+        assert os.getcwd() == cwd
+        assert directories == [cwd]
+
+        # The default callback of the class is restored
+        params = CoupledSWSolver.default_parameters()
+        with helpers.snapshot_directory(str(snapshot_dir), params):
+            params.callback(None)
+        assert "callback" not in params.__dict__
+
+        with helpers.snapshot_directory(None, params):
+            assert os.getcwd() == cwd
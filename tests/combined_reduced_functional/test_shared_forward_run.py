@@ -0,0 +1,67 @@
+import numpy
+from opentidalfarm import *
+
+
+class TestSharedForwardRun(object):
+
+    def test_components_share_one_forward_run(self,
+                                              steady_sw_channel_solver):
+        solver = steady_sw_channel_solver()
+        problem = solver.problem
+        control = TurbineFarmControl(problem.parameters.tidal_farm)
+
+        rf_params = ReducedFunctional.default_parameters()
+        rf_params.automatic_scaling = False
+        power_rf = ReducedFunctional(PowerFunctional(problem), control,
+                                     solver, rf_params)
+        cost_rf = ReducedFunctional(CostFunctional(problem), control,
+                                    solver, rf_params)
+
+        combined = power_rf - 0.1*cost_rf
+        assert len(combined.terms) == 2
+        assert len(combined.components) == 1
+
+        m = control.data().copy()
+        solver.search_iteration = 0
+        j = combined(m)
+        assert solver.search_iteration == 1
+
+        j_expected = power_rf(m) - 0.1*cost_rf(m)
+        assert abs(j - j_expected) < 1e-10*abs(j_expected)
+
+        dj = combined.derivative(m)
+        dj_expected = power_rf.derivative(m) - 0.1*cost_rf.derivative(m)
+        assert numpy.allclose(dj, dj_expected, rtol=1e-8)
+
+    def test_merged_functional_keeps_outputs(self, steady_sw_channel_solver):
+        solver = steady_sw_channel_solver(print_individual_turbine_power=True)
+        problem = solver.problem
+        control = TurbineFarmControl(problem.parameters.tidal_farm)
+
+        rf_params = ReducedFunctional.default_parameters()
+        rf_params.automatic_scaling = False
+        rf_params.save_checkpoints = True
+        rf_params.checkpoints_basefilename = "shared_checkpoints"
+        power_rf = ReducedFunctional(PowerFunctional(problem), control,
+                                     solver, rf_params)
+        cost_rf = ReducedFunctional(CostFunctional(problem), control,
+                                    solver, rf_params)
+        output_writer = solver.parameters.output_writer
+
+        combined = power_rf - 0.1*cost_rf
+        weight, merged = combined.components[0]
+
+        # The output writer of the power functional is kept
+        assert solver.parameters.output_writer is output_writer
+        assert merged.solver is solver and merged.controls == power_rf.controls
+        assert merged.parameters.scale == 1.
+
+        # The checkpoints of the power functional are neither loaded nor
+        # overwritten by the combined functional
+        assert not merged.parameters.load_checkpoints
+        assert not merged.parameters.save_checkpoints
+        assert merged._compute_functional_mem is not \
+            power_rf._compute_functional_mem
+
+        # Printing the individual turbine power does not fail
+        combined(control.data().copy())
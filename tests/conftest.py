@@ -9,6 +9,8 @@ from fixtures import sw_nonlinear_problem_parameters
 from fixtures import steady_sw_problem_parameters
 from fixtures import multi_steady_sw_problem_parameters
 from fixtures import sin_ic
+from fixtures import steady_sw_channel_solver
+from fixtures import steady_sw_channel_rf
 
 default_params = dolfin.parameters.copy()
 def pytest_runtest_setup(item):
@@ -0,0 +1,53 @@
+''' This test checks the feasible area distance function and the domain
+restriction constraints. '''
+from opentidalfarm import *
+import numpy
+
+
+class Config(object):
+    """ A minimal stand-in for the configuration object. """
+
+    def __init__(self, mesh, turbine_pos):
+        self.domain = type("Domain", (object,), {"mesh": mesh})
+        self.params = {"controls": ["turbine_pos"],
+                       "turbine_pos": turbine_pos,
+                       "turbine_x": 0.1, "turbine_y": 0.1}
+
+
+class TestDomainRestriction(object):
+
+    def test_distance_function(self):
+        mesh = UnitSquareMesh(20, 20)
+        domains = CellFunction("size_t", mesh)
+        domains.set_all(0)
+        CompiledSubDomain("x[0] <= 0.5 + DOLFIN_EPS").mark(domains, 1)
+
+        feasible_area = get_distance_function(Config(mesh, []), domains)
+
+        # The distance is zero well inside the marked area and positive outside
+        assert abs(feasible_area((0.2, 0.5))) < 1e-12
+        assert feasible_area((0.8, 0.5)) > 0
+
+    def test_constraints(self):
+        mesh = UnitSquareMesh(20, 20)
+        V = FunctionSpace(mesh, "CG", 1)
+        feasible_area = interpolate(Expression("x[0]*x[0] + x[1]", degree=2), V)
+
+        m = numpy.array([0.21, 0.33, 0.72, 0.58, 1.5, 0.5])
+        config = Config(mesh, m.reshape(-1, 2).tolist())
+        ieq = get_domain_constraints(config, feasible_area,
+                                     attraction_center=(0.5, 0.5))
+
+        value = ieq.function(m)
+        assert ieq.length() == len(value) == 3
+        assert numpy.allclose(value[:2], [-feasible_area((0.21, 0.33)),
+                                          -feasible_area((0.72, 0.58))])
+        # The last turbine is outside and attracted to the center
+        assert numpy.allclose(value[2], -1.)
+
+        # The jacobian is exact for the piecewise linear feasible area and up
+        # to second order terms outside the domain
+        numpy.random.seed(0)
+        dm = 1e-4 * numpy.random.rand(len(m))
+        fd = ieq.function(m + dm) - ieq.function(m)
+        assert numpy.allclose(ieq.jacobian(m).dot(dm), fd, atol=1e-7)
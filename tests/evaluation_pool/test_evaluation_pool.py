@@ -0,0 +1,27 @@
+import numpy
+from opentidalfarm import *
+
+
+class TestEvaluationPool(object):
+
+    def test_batch_matches_serial_evaluation(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf()
+        m0 = rf.controls[0].data().copy()
+        ms = [m0, m0 + 20., m0 - 20.]
+
+        with EvaluationPool(rf, processes=2) as pool:
+            results = pool.evaluate_batch(ms, gradient=True)
+
+            # All results are memoised
+            for m in ms:
+                assert rf._compute_functional_mem.has_cache(m, annotate=True)
+                assert rf._compute_gradient_mem.has_cache(m, True)
+
+            # A second batch does not evaluate anything
+            assert pool.evaluate_batch(ms) == [j for j, dj in results]
+
+        serial_rf = steady_sw_channel_rf()
+        for m, (j, dj) in zip(ms, results):
+            assert abs(serial_rf.evaluate(m) - j) < 1e-10 * abs(j)
+            serial_dj = serial_rf.derivative(m)
+            assert numpy.allclose(serial_dj, dj, rtol=1e-8)
@@ -0,0 +1,40 @@
+''' This benchmark compares the time to load a FileDomain from dolfin XML
+files and from a HDF5 file for increasing mesh sizes. '''
+
+from opentidalfarm import *
+from timeit import default_timer as timer
+import tempfile
+import shutil
+import os.path
+
+
+def write_xml_domain(directory, n):
+    domain = RectangularDomain(0, 0, 3000, 1000, 3*n, n)
+    meshfile = os.path.join(directory, "mesh_%i.xml" % n)
+    File(meshfile) << domain.mesh
+    File(meshfile[:-4] + "_facet_region.xml") << domain.facet_ids
+    File(meshfile[:-4] + "_physical_region.xml") << domain.cell_ids
+    return meshfile, domain.mesh.num_cells()
+
+
+def time_load(*args, **kwargs):
+    start = timer()
+    FileDomain(*args, **kwargs)
+    return timer() - start
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+
+    print "%10s %12s %12s" % ("cells", "XML [s]", "HDF5 [s]")
+    for n in [25, 50, 100, 200, 400]:
+        meshfile, num_cells = write_xml_domain(directory, n)
+        xml_time = time_load(meshfile)
+
+        # Create the HDF5 cache and load from it
+        FileDomain(meshfile, cache=True)
+        hdf5_time = time_load(meshfile, cache=True)
+
+        print "%10i %12.4f %12.4f" % (num_cells, xml_time, hdf5_time)
+
+    shutil.rmtree(directory)
@@ -0,0 +1,40 @@
+import os
+import shutil
+import numpy
+from opentidalfarm import *
+
+
+class TestFileDomain(object):
+
+    def copy_mesh(self, tmpdir):
+        path = os.path.join(os.path.dirname(__file__), os.path.pardir,
+                            "dynamic_control")
+        for name in ["mesh.xml", "mesh_facet_region.xml",
+                     "mesh_physical_region.xml"]:
+            shutil.copy(os.path.join(path, name), str(tmpdir))
+        return os.path.join(str(tmpdir), "mesh.xml")
+
+    def assert_equal_domains(self, domain, other):
+        assert domain.mesh.num_cells() == other.mesh.num_cells()
+        assert numpy.allclose(domain.mesh.coordinates(),
+                              other.mesh.coordinates())
+        assert (domain.facet_ids.array() == other.facet_ids.array()).all()
+        assert (domain.cell_ids.array() == other.cell_ids.array()).all()
+
+    def test_hdf5_cache(self, tmpdir):
+        meshfile = self.copy_mesh(tmpdir)
+        cachefile = os.path.join(str(tmpdir), "mesh.h5")
+
+        domain = FileDomain(meshfile)
+        assert not os.path.exists(cachefile)
+
+        # The first load writes the cache, the second one reads it
+        cached_domain = FileDomain(meshfile, cache=True)
+        assert os.path.exists(cachefile)
+        self.assert_equal_domains(domain, cached_domain)
+
+        cached_domain = FileDomain(meshfile, cache=True)
+        self.assert_equal_domains(domain, cached_domain)
+
+        # The .h5 file can be loaded directly
+        self.assert_equal_domains(domain, FileDomain(cachefile))
@@ -1,3 +1,4 @@
+import copy
 import pytest
 from opentidalfarm import *
 
@@ -129,3 +130,70 @@ def sw_linear_problem_parameters():
     parameters.functional_final_time_only = False
 
     return parameters
+
+@pytest.fixture
+def steady_sw_channel_solver(steady_sw_problem_parameters):
+    ''' Returns a function that creates a CoupledSWSolver for a steady flow
+    through a channel with a small farm of bump turbines. The keyword
+    arguments of the function override the domain, the turbine, the layout
+    and the solver parameters. '''
+
+    def create(domain=None, diameter=20., controls=Controls(position=True),
+               num_x=2, num_y=1, **solver_settings):
+        if domain is None:
+            domain = RectangularDomain(0, 0, 3000, 1000, 10, 4)
+
+        turbine = BumpTurbine(diameter=diameter, friction=12.,
+                              controls=controls)
+        farm = RectangularFarm(domain, site_x_start=1000, site_x_end=2000,
+                               site_y_start=250, site_y_end=750,
+                               turbine=turbine)
+        farm.add_regular_turbine_layout(num_x=num_x, num_y=num_y)
+
+        bcs = BoundaryConditionSet()
+        bcs.add_bc("u", Constant((2, 0)), 1, "weak_dirichlet")
+        bcs.add_bc("eta", Constant(0), 2, "strong_dirichlet")
+        bcs.add_bc("u", facet_id=3, bctype="free_slip")
+
+        # Each solver gets its own copy of the problem parameters
+        prob_params = copy.copy(steady_sw_problem_parameters)
+        prob_params.bcs = bcs
+        prob_params.domain = domain
+        prob_params.tidal_farm = farm
+        problem = SteadySWProblem(prob_params)
+
+        solver_params = CoupledSWSolver.default_parameters()
+        solver_params.dump_period = -1
+        for name, value in solver_settings.items():
+            setattr(solver_params, name, value)
+        return CoupledSWSolver(problem, solver_params)
+
+    return create
+
+@pytest.fixture
+def steady_sw_channel_rf(steady_sw_channel_solver):
+    ''' Returns a function that creates a ReducedFunctional of the turbine farm
+    controls for the steady channel flow of :func:`steady_sw_channel_solver`.
+    The functional and the auxiliary functionals are given as classes, which
+    are created with the problem of the solver. If no solver is given, a new
+    one is created with the remaining keyword arguments. '''
+
+    def create(functional=PowerFunctional, automatic_scaling=False,
+               auxiliary_functionals=None, solver=None, **solver_settings):
+        if solver is None:
+            solver = steady_sw_channel_solver(**solver_settings)
+        problem = solver.problem
+        farm = problem.parameters.tidal_farm
+
+        if auxiliary_functionals is not None:
+            auxiliary_functionals = dict(
+                (name, cls(problem))
+                for name, cls in auxiliary_functionals.items())
+
+        rf_params = ReducedFunctional.default_parameters()
+        rf_params.automatic_scaling = automatic_scaling
+        return ReducedFunctional(functional(problem), TurbineFarmControl(farm),
+                                 solver, rf_params,
+                                 auxiliary_functionals=auxiliary_functionals)
+
+    return create
@@ -0,0 +1,24 @@
+import numpy
+from opentidalfarm import *
+
+
+class TestAuxiliaryFunctionals(object):
+
+    def test_auxiliary_functionals_are_reported(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            auxiliary_functionals={"cost": CostFunctional,
+                                   "power": PowerFunctional})
+        m = rf.controls[0].data().copy()
+        j = rf(m)
+        dj = rf.derivative(m)
+
+        assert sorted(rf.auxiliary_values.keys()) == ["cost", "power"]
+        assert abs(rf.auxiliary_values["power"] - j) < 1e-10*abs(j)
+
+        cost_rf = steady_sw_channel_rf(CostFunctional, solver=rf.solver)
+        cost = cost_rf(m)
+        assert abs(rf.auxiliary_values["cost"] - cost) < 1e-10*abs(cost)
+
+        # The auxiliary functionals are not part of the gradient
+        power_rf = steady_sw_channel_rf(solver=rf.solver)
+        assert numpy.allclose(power_rf.derivative(m), dj, rtol=1e-8)
@@ -0,0 +1,40 @@
+import os.path
+import numpy
+import h5py
+from opentidalfarm import *
+
+
+class TestVelocityTimeSeries(object):
+
+    def test_interpolation_in_time(self, tmpdir):
+        filename = os.path.join(str(tmpdir), "fvcom.h5")
+
+        # Write a mesh and a velocity time series in the layout of
+        # scripts/fvcom_to_otf.py
+        mesh = RectangularDomain(0, 0, 100, 50, 4, 2).mesh
+        f = HDF5File(mesh.mpi_comm(), filename, "w")
+        f.write(mesh, "/mesh")
+        f.close()
+
+        num_cells = mesh.num_cells()
+        u = numpy.zeros((2, num_cells, 2))
+        u[0, :, 0] = numpy.arange(num_cells)
+        u[1, :, 0] = numpy.arange(num_cells) + 1.
+        u[:, :, 1] = -1.
+
+        f = h5py.File(filename, "a")
+        f.create_dataset("velocity/times", data=[0., 10.])
+        f.create_dataset("velocity/u", data=u)
+        f.close()
+
+        domain = FileDomain(filename)
+        V = VectorFunctionSpace(domain.mesh, "DG", 0)
+        velocity = VelocityTimeSeries(V, filename)
+
+        bcs = BoundaryConditionSet()
+        bcs.add_bc("u", velocity, facet_id=1)
+        bcs.update_time(Constant(2.5))
+
+        for cell in cells(domain.mesh):
+            value = velocity(cell.midpoint())
+            assert numpy.allclose(value, [cell.index() + 0.25, -1.])
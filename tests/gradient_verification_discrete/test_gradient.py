@@ -1,4 +1,5 @@
 import numpy
+import pytest
 from opentidalfarm import *
 
 def model(controls, problem_params, sin_ic):
@@ -80,7 +81,9 @@ class TestDiscreteTurbine(object):
         rf = model(Controls(position=True), sw_linear_problem_parameters, sin_ic)
         m0 = rf.solver.problem.parameters.tidal_farm.control_array
 
-        p = numpy.random.rand(len(m0))
+        # A local random state keeps the direction independent of the
+        # order of the tests
+        p = numpy.random.RandomState(0).rand(len(m0))
         minconv = helpers.test_gradient_array(rf.evaluate, rf.derivative, m0,
                 seed=0.1, perturbation_direction=p, number_of_tests=4)
 
@@ -91,8 +94,47 @@ class TestDiscreteTurbine(object):
         rf = model(Controls(friction=True), sw_linear_problem_parameters, sin_ic)
         m0 = rf.solver.problem.parameters.tidal_farm.control_array
 
-        p = numpy.random.rand(len(m0))
+        p = numpy.random.RandomState(1).rand(len(m0))
         minconv = helpers.test_gradient_array(rf.evaluate, rf.derivative, m0,
                 seed=0.1, perturbation_direction=p, number_of_tests=4)
 
         assert minconv > 1.97
+
+    def test_parallel_taylor_test(self, sw_linear_problem_parameters, sin_ic):
+        rf = model(Controls(position=True), sw_linear_problem_parameters, sin_ic)
+        m0 = rf.solver.problem.parameters.tidal_farm.control_array
+
+        p = numpy.random.RandomState(2).rand(len(m0))
+        with EvaluationPool(rf, processes=2) as pool:
+            minconv = helpers.test_gradient_array(rf.evaluate, rf.derivative,
+                    m0, seed=0.1, perturbation_direction=p, number_of_tests=4,
+                    J_batch=pool.evaluate_batch)
+
+        assert minconv > 1.97
+
+    def test_tangent_linear_check(self, sw_linear_problem_parameters, sin_ic):
+        rf = model(Controls(position=True), sw_linear_problem_parameters, sin_ic)
+        m0 = rf.solver.problem.parameters.tidal_farm.control_array
+
+        dj = rf.derivative_with_check(m0, mode="tlm", rtol=1e-6)
+        assert numpy.allclose(dj, rf.derivative(m0))
+
+    @pytest.mark.parametrize("controls", [Controls(position=True),
+                                          Controls(position=True,
+                                                   friction=True)])
+    def test_hessian_action(self, controls, sw_linear_problem_parameters,
+                            sin_ic):
+        rf = model(controls, sw_linear_problem_parameters, sin_ic)
+        m0 = numpy.array(rf.solver.problem.parameters.tidal_farm.control_array)
+
+        p = numpy.random.RandomState(3).rand(len(m0))
+        rf.derivative(m0, forget=False)
+        hess = rf.hessian(m0, p)
+
+        # Compare with a central finite difference of the gradient
+        h = 1e-3
+        dj_plus = rf.derivative(m0 + h*p)
+        dj_minus = rf.derivative(m0 - h*p)
+        fd = (dj_plus - dj_minus)/(2*h)
+
+        assert numpy.linalg.norm(hess - fd) < 1e-3*numpy.linalg.norm(fd)
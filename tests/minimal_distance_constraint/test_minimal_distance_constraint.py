@@ -28,6 +28,61 @@ class TestMinimalDistanceConstraint(object):
 
         assert minconv > 1.99
 
+    def test_sparse(self):
+        farm = self.get_farm()
+        controls = farm._turbine_specification.controls
+
+        numpy.random.seed(0)
+        positions = numpy.random.uniform(0, 100, (30, 2))
+        m = positions.flatten()
+
+        ieq = MinimumDistanceConstraintsSparse(positions, 10., controls)
+        assert ieq.length() == 30
+
+        # Compare against a direct evaluation over all turbine pairs
+        value = numpy.zeros(30)
+        for i in range(30):
+            for j in range(30):
+                dist_sq = ((positions[i] - positions[j])**2).sum()
+                if i != j and dist_sq < 10.**2:
+                    value[i] -= (10.**2 - dist_sq)**2 / 10.**2
+
+        assert (value < 0).any() and not (value < 0).all()
+        assert numpy.allclose(ieq.function(m), value)
+
+        jacobian = ieq.jacobian(m)
+        assert jacobian.shape == (30, 60)
+        for row in numpy.where(value < 0)[0][:3]:
+            ieqcons_J = lambda m: ieq.function(m)[row]
+            ieqcons_dJ = lambda m, forget=False: ieq.jacobian(m)[row]
+            minconv = helpers.test_gradient_array(ieqcons_J, ieqcons_dJ, m,
+                                                  seed=0.01)
+            assert minconv > 1.99
+
+    def test_large_arrays(self):
+        farm = self.get_farm()
+        controls = farm._turbine_specification.controls
+        ieq = MinimumDistanceConstraintsLargeArrays(farm.turbine_positions,
+                                                    3., controls)
+
+        m = numpy.array([1., 2., 3., 4., 7., 1., 6., 9., 2., 2.5])
+
+        # Compare against a direct evaluation over all turbine pairs
+        value = 0.
+        dvalue = numpy.zeros(len(m))
+        p = m.reshape(-1, 2)
+        for i in range(len(p)):
+            for j in range(i):
+                diff = p[i] - p[j]
+                if numpy.dot(diff, diff) <= 3.**2:
+                    value += numpy.dot(diff, diff) - 3.**2
+                    dvalue[2*i:2*i+2] += 2*diff
+                    dvalue[2*j:2*j+2] -= 2*diff
+
+        assert value < 0
+        assert numpy.allclose(ieq.function(m), [value])
+        assert numpy.allclose(ieq.jacobian(m), [dvalue])
+
     def test_site_constraint(self):
 
         farm = self.get_farm()
@@ -49,3 +104,39 @@ class TestMinimalDistanceConstraint(object):
         # Let's check that the tolerance is not above a threshold
         log(INFO, "Expecting a Nan convergence order")
         assert math.isnan(minconv)
+
+    def test_site_constraint_sparse(self):
+        farm = self.get_farm()
+        vertices = [[0, 0], [10, 0], [10, 10]]
+        ieq = ConvexPolygonSiteConstraint(farm, vertices)
+        sparse_ieq = ConvexPolygonSiteConstraint(farm, vertices, sparse=True)
+
+        m = numpy.array([2., 1.])
+        assert ieq.length() == len(ieq.function(m)) == 3
+        assert (ieq.function(m) > 0).all()
+        assert numpy.allclose(ieq.jacobian(m),
+                              sparse_ieq.jacobian(m).toarray())
+
+    def test_polygon_site_constraint(self):
+        farm = self.get_farm()
+
+        # A non-convex L-shaped site with a square hole
+        site = [[0, 0], [100, 0], [100, 40], [40, 40], [40, 100], [0, 100]]
+        hole = [[10, 10], [20, 10], [20, 20], [10, 20]]
+        ieq = PolygonSiteConstraint(farm, [site, hole], resolution=200)
+
+        # Inside the site, inside the hole, in the notch of the L and far
+        # outside of the grid
+        m = numpy.array([5., 50., 15., 15., 70., 70., 300., -50.])
+        value = ieq.function(m)
+        assert abs(value[0] - 5.) < 1e-8
+        assert value[1] < 0
+        assert value[2] < 0
+        assert value[3] < -190
+
+        # Compare the jacobian with central finite differences
+        numpy.random.seed(0)
+        dm = numpy.random.rand(len(m))
+        eps = 1e-4
+        fd = (ieq.function(m + eps*dm) - ieq.function(m - eps*dm))/(2*eps)
+        assert numpy.allclose(ieq.jacobian(m).dot(dm), fd, atol=1e-6)
@@ -0,0 +1,100 @@
+''' Test description
+ - single turbine on a hierarchy of two meshes
+ - bubble velocity profile with maximum in the center of the domain
+ - control: turbine position
+ - the optimal placement for the turbine is where the velocity profile reaches
+   its maximum (the center of the domain)
+'''
+
+import pytest
+from opentidalfarm import *
+from dolfin import log, INFO
+
+
+def BumpInitialCondition(x0, y0, x1, y1):
+
+    class BumpExpr(Expression):
+        '''This class implements a initial condition with a bump velocity profile.
+           With that we know that the optimal turbine location must be in the center of the domain. '''
+
+        def bump_function(self, x):
+            '''The velocity is initially a bump function (a smooth function with limited support):
+                       /  e**-1/(1-x**2)   for |x| < 1
+              psi(x) = |
+                       \  0   otherwise
+              For more information see http://en.wikipedia.org/wiki/Bump_function
+            '''
+            if x[0] ** 2 < 1 and x[1] ** 2 < 1:
+                bump = exp(-1.0 / (1.0 - x[0] ** 2))
+                bump *= exp(-1.0 / (1.0 - x[1] ** 2))
+                bump /= exp(-1) ** 2
+            else:
+                bump = 0.0
+            return bump
+
+        def eval(self, values, X):
+            x_unit = 2 * (x1 - X[0]) / (x1-x0) - 1.0
+            y_unit = 2 * (y1 - X[1]) / (y1-y0) - 1.0
+
+            values[0] = self.bump_function([x_unit, y_unit])
+            values[1] = 0
+            values[2] = 0
+
+        def value_shape(self):
+            return (3,)
+
+    return BumpExpr(degree=2)
+
+
+class TestMultilevelOptimisation(object):
+
+    def build_rf(self, domain):
+        problem_params = DummyProblem.default_parameters()
+        problem_params.dt = 0.8
+        problem_params.functional_final_time_only = False
+        problem_params.finite_element = finite_elements.p1dgp2
+        problem_params.domain = domain
+        problem_params.initial_condition = BumpInitialCondition(0, 0, 3000,
+                                                                1000)
+
+        turbine = BumpTurbine(diameter=800., friction=12.0,
+                              controls=Controls(position=True))
+        farm = Farm(domain, turbine)
+        farm.add_turbine((500., 200.))
+        problem_params.tidal_farm = farm
+
+        problem = DummyProblem(problem_params)
+        solver = DummySolver(problem)
+        functional = PowerFunctional(problem)
+        control = TurbineFarmControl(farm)
+        rf_params = ReducedFunctionalParameters()
+        rf_params.automatic_scaling = 5.
+
+        return ReducedFunctional(functional, control, solver, rf_params)
+
+    def test_domain_refinement_keeps_markers(self):
+        domain = RectangularDomain(0, 0, 3000, 1000, 10, 5)
+        fine_domain = domain.refine()
+
+        assert isinstance(fine_domain, RectangularDomain)
+        assert (fine_domain.mesh.num_cells() ==
+                4*domain.mesh.num_cells())
+        # The length of the inflow boundary does not change.
+        assert abs(assemble(Constant(1)*fine_domain.ds(1)) - 1000) < 1e-8
+        assert abs(assemble(Constant(1)*domain.ds(1)) - 1000) < 1e-8
+
+    def test_multilevel_recovers_optimal_position(self):
+        domains = domain_hierarchy(RectangularDomain(0, 0, 3000, 1000, 20, 10),
+                                   2)
+        m, rf = multilevel_maximize(self.build_rf, domains,
+                                    bounds=[[0, 0], [3000, 1000]], tol=1e-8)
+
+        assert rf.solver.problem.parameters.domain is domains[-1]
+        log(INFO, "Solution of the primal variables: m=" + repr(m) + "\n")
+        assert abs(m[0]-1500) < 40
+        assert abs(m[1]-500) < 0.4
+
+    def test_wrong_number_of_tolerances(self):
+        domains = [RectangularDomain(0, 0, 3000, 1000, 20, 10)]
+        with pytest.raises(ValueError):
+            multilevel_maximize(self.build_rf, domains, tol=[1e-4, 1e-6])
@@ -0,0 +1,86 @@
+import numpy
+from opentidalfarm import *
+from dolfin_adjoint import adjglobals
+from opentidalfarm.domains.domain import Domain
+
+
+class FixedDomain(RectangularDomain):
+    """ A domain that cannot be coarsened, like a :class:`FileDomain`. """
+    def coarsen(self):
+        return Domain.coarsen(self)
+
+
+# Settings of the turbine farm and the solver, the nested iteration is
+# switched on and off by the tests
+settings = dict(controls=Controls(position=True, friction=True),
+                cache_forward_state=False)
+
+
+class TestNestedIteration(object):
+
+    def test_coarsen_rectangular_domain(self):
+        domain = RectangularDomain(0, 0, 3000, 1000, 20, 8)
+        coarse = domain.coarsen()
+        assert coarse.mesh.num_cells() * 4 == domain.mesh.num_cells()
+        assert domain.refine().coarsen() is domain
+
+    def test_same_solution_and_gradient(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            domain=RectangularDomain(0, 0, 3000, 1000, 20, 8),
+            nested_iteration=False, **settings)
+        m0 = numpy.array(rf.controls[0].data())
+        j = rf.evaluate(m0)
+        dj = rf.derivative(m0)
+
+        rf_nested = steady_sw_channel_rf(
+            domain=RectangularDomain(0, 0, 3000, 1000, 20, 8),
+            nested_iteration=True, **settings)
+        j_nested = rf_nested.evaluate(m0)
+        dj_nested = rf_nested.derivative(m0)
+
+        assert abs(j - j_nested) < 1e-8 * abs(j)
+        assert numpy.linalg.norm(dj - dj_nested) < 1e-6 * numpy.linalg.norm(dj)
+
+    def test_coarse_solve_is_cached_and_not_annotated(self,
+            steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            domain=RectangularDomain(0, 0, 3000, 1000, 20, 8),
+            nested_iteration=True, **settings)
+        solver = rf.solver
+        m0 = numpy.array(rf.controls[0].data())
+
+        rf.evaluate(m0)
+        coarse_solver = solver._coarse_solver
+        assert coarse_solver is not None
+        assert (coarse_solver.mesh.num_cells() * 4 ==
+                solver.mesh.num_cells())
+
+        # Only the fine solve is on the tape
+        adj_reset()
+        for _ in solver.solve(annotate=True):
+            pass
+        annotated = adjglobals.adjointer.equation_count
+        adj_reset()
+        solver.parameters.nested_iteration = False
+        for _ in solver.solve(annotate=True):
+            pass
+        assert adjglobals.adjointer.equation_count == annotated
+        solver.parameters.nested_iteration = True
+
+        rf.evaluate(m0 + 1.)
+        assert solver._coarse_solver is coarse_solver
+
+    def test_fallback_without_coarse_domain(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            domain=RectangularDomain(0, 0, 3000, 1000, 20, 8),
+            nested_iteration=False, **settings)
+        m0 = numpy.array(rf.controls[0].data())
+        j = rf.evaluate(m0)
+
+        rf_nested = steady_sw_channel_rf(
+            domain=FixedDomain(0, 0, 3000, 1000, 20, 8), nested_iteration=True,
+            **settings)
+        j_nested = rf_nested.evaluate(m0)
+
+        assert rf_nested.solver._coarse_solver is False
+        assert abs(j - j_nested) < 1e-8 * abs(j)
@@ -105,3 +105,48 @@ class TestTurbineDerivatives(object):
         minconv = helpers.test_gradient_array(j, dj, m0, 0.001, perturbation_direction=p)
 
         assert minconv > 1.99
+
+    def test_turbine_second_derivatives_match_finite_differences(self):
+        domain = RectangularDomain(0, 0, 3000, 1000, 40, 20)
+        farm = self.default_farm(domain)
+        variables = ("turbine_friction", "turbine_pos_x", "turbine_pos_y")
+
+        def first_derivative(n, var, params):
+            farm._parameters = params
+            turbines = TurbineFunction(farm, farm._turbine_function_space,
+                                       farm.turbine_specification)
+            return turbines(derivative_index=n,
+                            derivative_var=var).vector().array()
+
+        def perturbed(n, var, h):
+            params = {"friction": numpy.array(farm._parameters["friction"],
+                                              dtype=float),
+                      "position": numpy.array(farm._parameters["position"],
+                                              dtype=float)}
+            if var == "turbine_friction":
+                params["friction"][n] += h
+            else:
+                params["position"][n][variables.index(var) - 1] += h
+            return params
+
+        original = farm._parameters
+        for n in xrange(len(original["position"])):
+            for var1 in variables:
+                for var2 in variables:
+                    farm._parameters = original
+                    turbines = TurbineFunction(farm,
+                                               farm._turbine_function_space,
+                                               farm.turbine_specification)
+                    analytic = turbines(derivative_index=n,
+                                        derivative_var=var1,
+                                        second_derivative_var=var2)
+                    analytic = analytic.vector().array()
+
+                    h = 1e-4 if var2 == "turbine_friction" else 1e-2
+                    fd = (first_derivative(n, var1, perturbed(n, var2, h)) -
+                          first_derivative(n, var1, perturbed(n, var2, -h)))
+                    fd /= 2*h
+
+                    scale = max(numpy.abs(fd).max(), 1e-10)
+                    assert numpy.abs(analytic - fd).max() < 1e-4*scale
+        farm._parameters = original
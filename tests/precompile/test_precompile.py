@@ -0,0 +1,40 @@
+import importlib
+from opentidalfarm import *
+
+
+class TestPrecompile(object):
+
+    def test_forms_are_compiled(self, steady_sw_channel_solver, monkeypatch):
+        solver = steady_sw_channel_solver(num_y=2, dump_period=1)
+        solver_params = solver.parameters
+        problem = solver.problem
+        functional = PowerFunctional(problem)
+
+        timings = dict(precompile_forms(solver, functional))
+
+        for name in ["residual", "jacobian", "adjoint_jacobian",
+                     "adjoint_residual_friction_derivative", "functional",
+                     "functional_state_derivative",
+                     "functional_friction_derivative"]:
+            assert name in timings
+            assert timings[name] >= 0
+
+        # The output settings are restored
+        assert solver_params.dump_period == 1
+
+        # The second time the forms are loaded from the JIT cache, so that no
+        # shared library is built
+        jit_module = importlib.import_module("dijitso.jit")
+        build_shared_library = jit_module.build_shared_library
+        builds = []
+
+        def counting_build(signature, *args, **kwargs):
+            builds.append(signature)
+            return build_shared_library(signature, *args, **kwargs)
+
+        monkeypatch.setattr(jit_module, "build_shared_library",
+                            counting_build)
+        cached_timings = dict(precompile_forms(solver, functional))
+
+        assert sorted(cached_timings) == sorted(timings)
+        assert builds == []
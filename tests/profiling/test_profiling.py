@@ -0,0 +1,45 @@
+import json
+import os.path
+from opentidalfarm import *
+
+
+class TestProfiling(object):
+
+    def test_phases_are_recorded(self, tmpdir):
+        filename = os.path.join(str(tmpdir), "profile.jsonl")
+        profiler = Profiler()
+        profiler.enable(filename)
+
+        for i in range(3):
+            with profiler.phase("newton_solve"):
+                pass
+        with profiler.phase("output"):
+            pass
+
+        report = profiler.end_iteration()
+        assert report.iteration == 0
+        assert report.calls("newton_solve") == 3
+        assert report.calls("output") == 1
+        assert report.calls("adjoint_solve") == 0
+        assert report.time("newton_solve") >= 0
+
+        with profiler.phase("adjoint_solve"):
+            pass
+        report = profiler.end_iteration(5)
+        assert report.iteration == 5
+        assert report.phases.keys() == ["adjoint_solve"]
+        assert len(profiler.reports) == 2
+
+        lines = [json.loads(line) for line in open(filename)]
+        assert [line["iteration"] for line in lines] == [0, 5]
+        assert lines[0]["phases"]["newton_solve"]["calls"] == 3
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = Profiler()
+
+        with profiler.phase("newton_solve"):
+            pass
+
+        assert profiler.current().phases == {}
+        assert profiler.end_iteration() is None
+        assert profiler.reports == []
@@ -0,0 +1,34 @@
+import os.path
+from opentidalfarm import *
+
+
+class TestRunLog(object):
+
+    def test_records_are_read_back_in_order(self, tmpdir):
+        filename = os.path.join(str(tmpdir), "run_log.dat")
+        run_log = RunLog(filename)
+
+        for i in range(3):
+            run_log.write("forward", optimisation_iteration=i, j=float(i),
+                          temporal_breakdown=[i, 2*i])
+            run_log.write("adjoint", optimisation_iteration=i, dj_norm=1.)
+
+        records = load_run_log(filename)
+        assert len(records) == 6
+        assert records[0]["kind"] == "forward"
+        assert records[1]["kind"] == "adjoint"
+
+        forward = load_run_log(filename, kind="forward")
+        assert list(forward.field("j")) == [0., 1., 2.]
+        assert forward.field("temporal_breakdown").shape == (3, 2)
+
+    def test_log_is_truncated(self, tmpdir):
+        filename = os.path.join(str(tmpdir), "run_log.dat")
+        RunLog(filename).write("forward", j=1.)
+
+        run_log = RunLog(filename)
+        assert len(run_log.load()) == 0
+
+        run_log = RunLog(filename, append=True)
+        run_log.write("forward", j=2.)
+        assert len(run_log.load()) == 1
@@ -0,0 +1,49 @@
+import numpy
+import pytest
+from opentidalfarm import *
+
+
+class TestReusedFactorisation(object):
+
+    def test_gradient_matches_dolfin_adjoint(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            controls=Controls(position=True, friction=True),
+            reuse_forward_factorisation=False)
+        m0 = numpy.array(rf.controls[0].data())
+        j = rf.evaluate(m0)
+        dj = rf.derivative(m0)
+
+        rf_reuse = steady_sw_channel_rf(
+            controls=Controls(position=True, friction=True),
+            reuse_forward_factorisation=True)
+        j_reuse = rf_reuse.evaluate(m0)
+        assert rf_reuse.solver.steady_adjoint_available()
+        dj_reuse = rf_reuse.derivative(m0)
+
+        assert abs(j - j_reuse) < 1e-8 * abs(j)
+        assert numpy.linalg.norm(dj - dj_reuse) < 1e-6 * numpy.linalg.norm(dj)
+
+    def test_taylor_test(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            controls=Controls(position=True, friction=True),
+            reuse_forward_factorisation=True)
+        m0 = numpy.array(rf.controls[0].data())
+
+        p = numpy.random.rand(len(m0))
+        minconv = helpers.test_gradient_array(rf.evaluate, rf.derivative, m0,
+                seed=0.1, perturbation_direction=p, number_of_tests=4)
+
+        assert minconv > 1.97
+
+    def test_newton_parameters_are_used(self, steady_sw_channel_rf):
+        rf = steady_sw_channel_rf(
+            controls=Controls(position=True, friction=True),
+            reuse_forward_factorisation=True)
+        m0 = numpy.array(rf.controls[0].data())
+
+        newton_params = dict(
+            rf.solver.parameters.dolfin_solver["newton_solver"],
+            maximum_iterations=1, error_on_nonconvergence=True)
+        rf.solver.parameters.dolfin_solver = {"newton_solver": newton_params}
+        with pytest.raises(RuntimeError):
+            rf.evaluate(m0)
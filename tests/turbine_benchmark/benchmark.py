@@ -1,64 +1,501 @@
-''' This test checks the performance of the turbine model implementation. One
-of the slowest part of the code is the interpolation of the turbine field onto
-a discrete function space, because turbine's eval function is called very
-often.  This test was used to optimise the eval implementation. On 4 Intel(R)
-Xeon(R) CPU  E5506  @ 2.13GHz the benchmark time should be around 11s. '''
+''' The OpenTidalFarm benchmark suite.
+
+The benchmarks measure the hot paths of a turbine optimisation: the turbine
+cache build, the gradient chain rule, the minimum distance constraints, a
+steady and a short transient coupled solve, an adjoint solve, the state
+output and the number of PDE solves of an L-BFGS-B and a Newton-CG
+optimisation. The solves run on the channel mesh of tests/dynamic_control.
+
+Each benchmark runs in its own process, so that its peak memory usage (RSS)
+can be measured. The results are written as JSON and can be compared against a
+baseline from an earlier run:
+
+    python benchmark.py --save-baseline              # on the reference version
+    python benchmark.py --baseline baseline.json     # after a change
+
+A timing or the peak RSS of a benchmark that grows by more than the threshold
+(default 25%) compared to the baseline is reported as a regression, and the
+script exits with a non-zero status. Use --quick for smaller problem sizes. '''
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import argparse
+import subprocess
+from collections import OrderedDict
+from timeit import default_timer as timer
 
-from opentidalfarm import *
 import numpy
-import cProfile
-
-
-def default_config():
-    # We set the perturbation_direction with a constant seed,
-    # so that it is consistent in a parallel environment.
-    config = configuration.DefaultConfiguration(
-        nx=600,
-        ny=200,
-        finite_element=finite_elements.p1dgp2
-    )
-    domain = domains.RectangularDomain(3000, 1000, 600, 200)
-    config.set_domain(domain)
-
-    period = 1.24*60*60  # Wave period
-    config.params["k"] = 2*pi/(period*sqrt(config.params["g"] *
-                               config.params["depth"]))
-    config.params["finish_time"] = 2./4*period
-    config.params["dt"] = config.params["finish_time"]/20
-    config.params["dump_period"] = 1
-    config.params["verbose"] = 100
-
-    # Start at rest state
-    config.params["start_time"] = config.params["finish_time"] - 3 * \
-        config.params["dt"]  # period/4
-
-    # Turbine settings
-    config.params["friction"] = 0.0025
-    # The turbine position is the control variable
-    turbine_pos = []
-    border = 100
-    for x_r in numpy.linspace(0.+border, config.domain.basin_x-border, 30):
-        for y_r in numpy.linspace(0.+border, config.domain.basin_y-border, 10):
-            turbine_pos.append((float(x_r), float(y_r)))
-
-    config.set_turbine_pos(turbine_pos, friction=1.0)
-    info_blue("Deployed " + str(len(turbine_pos)) + " turbines.")
-
-    config.params["turbine_x"] = 190  # We overlap the turbines on purpose
-    config.params["turbine_y"] = 20
-
-    return config
-
-# Set up the turbine friction field using the provided control variable
-config = default_config()
-tf = Function(config.turbine_function_space)
-turbines = Turbines(config.turbine_function_space, config.params)
-
-# Benchmark the generation of the turbine function
-cProfile.run("tf = turbines()")
-
-print "norm(tf) = ", norm(tf)
-correct_norm = 634.425772066
-if abs(norm(tf) - correct_norm) > 0.000000001:
-    log(ERROR, "Warning: Wrong norm. Should be %e" % correct_norm)
-log(INFO, "This test should take round 1 min.")
+
+path = os.path.dirname(os.path.abspath(__file__))
+mesh_file = os.path.join(path, os.pardir, "dynamic_control", "mesh.xml")
+default_baseline = os.path.join(path, "baseline.json")
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(f):
+    """ Registers a benchmark. A benchmark takes the arguments `quick` and
+    `repeat` and returns a dictionary that maps case names to timings in
+    seconds, or to counts such as the number of PDE solves. """
+    BENCHMARKS[f.__name__] = f
+    return f
+
+
+def best_of(f, repeat):
+    """ Returns the fastest of `repeat` runs of f. """
+    times = []
+    for i in range(repeat):
+        start = timer()
+        f()
+        times.append(timer() - start)
+    return min(times)
+
+
+class PositionControls(object):
+    position = True
+    friction = False
+    dynamic_friction = False
+
+
+def jittered_positions(n, spacing):
+    """ Returns n turbine positions on a jittered regular grid. """
+    numpy.random.seed(0)
+    nx = int(numpy.ceil(numpy.sqrt(n)))
+    x, y = numpy.meshgrid(numpy.arange(nx), numpy.arange(nx))
+    positions = numpy.c_[x.ravel(), y.ravel()][:n]*spacing
+    positions += numpy.random.uniform(-0.3, 0.3, positions.shape)*spacing
+    return positions
+
+
+def channel_farm(domain, num_x, num_y):
+    from opentidalfarm import BumpTurbine, RectangularFarm
+
+    turbine = BumpTurbine(diameter=20., friction=12., minimum_distance=25.)
+    farm = RectangularFarm(domain, site_x_start=160, site_x_end=480,
+                           site_y_start=80, site_y_end=240, turbine=turbine)
+    farm.add_regular_turbine_layout(num_x=num_x, num_y=num_y)
+    return farm
+
+
+def steady_solver(num_x=4, num_y=2, dump_period=-1, output_dir=os.curdir,
+                  reuse_forward_factorisation=False):
+    from opentidalfarm import (FileDomain, BoundaryConditionSet, Constant,
+                               SteadySWProblem, CoupledSWSolver)
+
+    domain = FileDomain(mesh_file)
+
+    bcs = BoundaryConditionSet()
+    bcs.add_bc("u", Constant((2, 0)), facet_id=1)
+    bcs.add_bc("eta", Constant(0), facet_id=2)
+    bcs.add_bc("u", facet_id=3, bctype="free_slip")
+
+    prob_params = SteadySWProblem.default_parameters()
+    prob_params.domain = domain
+    prob_params.bcs = bcs
+    prob_params.viscosity = Constant(2)
+    prob_params.depth = Constant(50)
+    prob_params.friction = Constant(0.0025)
+    prob_params.tidal_farm = channel_farm(domain, num_x, num_y)
+    problem = SteadySWProblem(prob_params)
+
+    sol_params = CoupledSWSolver.default_parameters()
+    sol_params.dump_period = dump_period
+    sol_params.output_dir = output_dir
+    sol_params.reuse_forward_factorisation = reuse_forward_factorisation
+    return CoupledSWSolver(problem, sol_params)
+
+
+def transient_solver(timesteps):
+    from opentidalfarm import (FileDomain, BoundaryConditionSet, Constant,
+                               Expression, SWProblem, CoupledSWSolver, pi,
+                               sqrt)
+
+    domain = FileDomain(mesh_file)
+
+    prob_params = SWProblem.default_parameters()
+    period = 12. * 60 * 60
+    prob_params.start_time = Constant(1. / 4 * period)
+    prob_params.dt = Constant(period / 50)
+    prob_params.finish_time = Constant(1. / 4 * period +
+                                       timesteps * period / 50)
+    prob_params.theta = 1.0
+    prob_params.include_advection = True
+    prob_params.include_viscosity = True
+    prob_params.linear_divergence = False
+    prob_params.friction = Constant(0.0025)
+    prob_params.viscosity = Constant(3.0)
+    prob_params.depth = Constant(50)
+    prob_params.g = Constant(9.81)
+
+    k = Constant(2 * pi / (period * sqrt(9.81 * 50)))
+    expression = Expression(
+        ("eta0*sqrt(g/depth)*cos(k*x[0]-sqrt(g*depth)*k*t)", "0"),
+        eta0=2., g=9.81, depth=50., t=float(prob_params.start_time), k=k,
+        degree=2)
+    bcs = BoundaryConditionSet()
+    bcs.add_bc("u", expression, 1, "weak_dirichlet")
+    bcs.add_bc("u", expression, 2, "weak_dirichlet")
+    bcs.add_bc("u", facet_id=3, bctype="free_slip")
+
+    prob_params.bcs = bcs
+    prob_params.domain = domain
+    prob_params.tidal_farm = channel_farm(domain, 4, 2)
+    problem = SWProblem(prob_params)
+
+    sol_params = CoupledSWSolver.default_parameters()
+    sol_params.dump_period = -1
+    return CoupledSWSolver(problem, sol_params)
+
+
+def reduced_functional(solver):
+    from opentidalfarm import (PowerFunctional, TurbineFarmControl,
+                               ReducedFunctional)
+
+    farm = solver.problem.parameters.tidal_farm
+    functional = PowerFunctional(solver.problem)
+    rf_params = ReducedFunctional.default_parameters()
+    rf_params.automatic_scaling = False
+    rf = ReducedFunctional(functional, TurbineFarmControl(farm), solver,
+                           rf_params)
+    return rf, farm.control_array
+
+
+@benchmark
+def turbine_cache_build(quick, repeat):
+    """ Interpolation of the turbine field and its position derivatives. """
+    from opentidalfarm import RectangularDomain
+
+    meshes = [30, 60] if quick else [60, 120, 240]
+    turbines = [(4, 4), (8, 8)] if quick else [(4, 4), (8, 8), (16, 8)]
+
+    timings = OrderedDict()
+    for nx in meshes:
+        domain = RectangularDomain(0, 0, 640, 320, nx, nx / 2)
+        for num_x, num_y in turbines:
+            farm = channel_farm(domain, num_x, num_y)
+            positions = numpy.array(farm.turbine_positions)
+            shift = [0.]
+
+            def rebuild():
+                # Move the turbines, so that the cache is recomputed
+                shift[0] += 1e-3
+                farm._parameters["position"] = (positions + shift[0]).tolist()
+                farm.update()
+
+            name = "n=%i,nx=%i" % (num_x * num_y, nx)
+            timings[name] = best_of(rebuild, repeat)
+    return timings
+
+
+@benchmark
+def gradient_chain_rule(quick, repeat):
+    """ The inner products of the adjoint solution with the turbine field
+    derivatives, as in :meth:`ReducedFunctional._compute_gradient`. """
+    from opentidalfarm import RectangularDomain, Function
+
+    nx = 60 if quick else 120
+    turbines = [(4, 4), (8, 8)] if quick else [(4, 4), (8, 8), (16, 8)]
+
+    timings = OrderedDict()
+    domain = RectangularDomain(0, 0, 640, 320, nx, nx / 2)
+    for num_x, num_y in turbines:
+        farm = channel_farm(domain, num_x, num_y)
+        farm.update()
+        djdtf = Function(farm._turbine_function_space)
+        djdtf.vector()[:] = numpy.random.rand(djdtf.vector().local_size())
+
+        def chain_rule():
+            dj = []
+            for d in farm.turbine_cache["turbine_derivative_pos"]:
+                for var in ("turbine_pos_x", "turbine_pos_y"):
+                    farm.update()
+                    dj.append(djdtf.vector().inner(d[var].vector()))
+            return dj
+
+        timings["n=%i" % (num_x * num_y)] = best_of(chain_rule, repeat)
+    return timings
+
+
+@benchmark
+def minimum_distance_constraints(quick, repeat):
+    """ Value and jacobian of the dense, sparse and large array minimum
+    distance constraints. """
+    from opentidalfarm import (MinimumDistanceConstraints,
+                               MinimumDistanceConstraintsSparse,
+                               MinimumDistanceConstraintsLargeArrays)
+
+    minimum_distance = 40.
+    controls = PositionControls()
+    sizes = [100, 500] if quick else [100, 500, 2000]
+
+    timings = OrderedDict()
+    for n in sizes:
+        positions = jittered_positions(n, 2 * minimum_distance)
+        m = positions.flatten()
+
+        implementations = [("sparse", MinimumDistanceConstraintsSparse),
+                           ("large", MinimumDistanceConstraintsLargeArrays)]
+        if n <= 500:
+            implementations.insert(0, ("dense", MinimumDistanceConstraints))
+
+        for name, cls in implementations:
+            ieq = cls(positions, minimum_distance, controls)
+
+            def evaluate():
+                ieq.function(m)
+                ieq.jacobian(m)
+
+            timings["%s,n=%i" % (name, n)] = best_of(evaluate, repeat)
+    return timings
+
+
+@benchmark
+def steady_solve(quick, repeat):
+    """ A steady coupled forward solve. The first run includes the form
+    compilation (if not cached). """
+    solver = steady_solver()
+
+    def solve():
+        for sol in solver.solve(annotate=False):
+            pass
+
+    timings = OrderedDict()
+    timings["first"] = best_of(solve, 1)
+    timings["solve"] = best_of(solve, repeat)
+    return timings
+
+
+@benchmark
+def transient_solve(quick, repeat):
+    """ A short transient coupled forward solve. """
+    timesteps = 2 if quick else 5
+    solver = transient_solver(timesteps)
+
+    def solve():
+        for sol in solver.solve(annotate=False):
+            pass
+
+    solve()
+    return {"timesteps=%i" % timesteps: best_of(solve, repeat)}
+
+
+@benchmark
+def adjoint_solve(quick, repeat):
+    """ A forward and adjoint solve of the power functional with respect to
+    the turbine positions, with the adjoint from dolfin-adjoint and with the
+    adjoint that reuses the factorisation of the forward solve. """
+    from dolfin_adjoint import adj_reset
+
+    timings = OrderedDict()
+    for reuse, suffix in [(False, ""), (True, "_reused_factorisation")]:
+        rf, m = reduced_functional(steady_solver(
+            reuse_forward_factorisation=reuse))
+        m = numpy.array(m)
+
+        def forward():
+            rf._compute_functional(m, annotate=True)
+
+        def gradient():
+            rf._compute_functional(m, annotate=True)
+            rf._compute_gradient(m, forget=True)
+
+        forward()
+        timings["forward" + suffix] = best_of(forward, repeat)
+        timings["forward_and_adjoint" + suffix] = best_of(gradient, repeat)
+        adj_reset()
+    return timings
+
+
+@benchmark
+def newton_optimisation(quick, repeat):
+    """ The number of PDE solves (forward, adjoint, tangent linear and second
+    order adjoint runs) and the run time of a position optimisation with
+    L-BFGS-B and with Newton-CG. """
+    from opentidalfarm import maximize, profiler
+    from dolfin_adjoint import adj_reset
+
+    options = {"L-BFGS-B": {"gtol": 1e-6}, "Newton-CG": {"xtol": 1e-6}}
+    maxiter = 5 if quick else 30
+
+    results = OrderedDict()
+    for method in ["L-BFGS-B", "Newton-CG"]:
+        rf, m = reduced_functional(steady_solver(num_x=2, num_y=2))
+        profiler.reset()
+        profiler.enable()
+
+        start = timer()
+        maximize(rf, method=method, scale=1e-3,
+                 options=dict(options[method], maxiter=maxiter))
+        elapsed = timer() - start
+
+        reports = profiler.reports + [profiler.current()]
+        profiler.disable()
+        solves = sum(report.calls("forward_solve") +
+                     report.calls("adjoint_solve") +
+                     2*report.calls("hessian_solve") for report in reports)
+        results["%s_pde_solves" % method] = solves
+        results["%s_time" % method] = elapsed
+        adj_reset()
+    return results
+
+
+@benchmark
+def output_writing(quick, repeat):
+    """ Projection and output of the state with the StateWriter. """
+    from opentidalfarm.helpers import StateWriter
+
+    output_dir = tempfile.mkdtemp()
+    solver = steady_solver(output_dir=output_dir)
+    for sol in solver.solve(annotate=False):
+        state = sol["state"]
+
+    writes = 5 if quick else 20
+    writer = StateWriter(solver)
+
+    def write():
+        for i in range(writes):
+            writer.write(state)
+
+    return {"writes=%i" % writes: best_of(write, repeat)}
+
+
+def run_benchmark(name, quick, repeat):
+    """ Runs a benchmark in this process and returns its results. """
+    timings = BENCHMARKS[name](quick, repeat)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    return {"timings": timings, "peak_rss_mb": peak_rss}
+
+
+def run_in_subprocess(name, quick, repeat):
+    """ Runs a benchmark in a new process, so that the peak RSS only includes
+    this benchmark. """
+    cmd = [sys.executable, os.path.abspath(__file__), "--run", name,
+           "--repeat", str(repeat)]
+    if quick:
+        cmd.append("--quick")
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    stdout, _ = process.communicate()
+
+    for line in reversed(stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError("Benchmark %s failed with exit code %i." %
+                       (name, process.returncode))
+
+
+def compare(results, baseline, threshold, min_time=0.01):
+    """ Compares the results with a baseline.
+
+    :param threshold: The relative increase that counts as a regression.
+    :param min_time: Timing increases of less than this (in seconds) are
+        ignored as noise.
+    :returns: A list of (benchmark, metric, baseline value, value) tuples of
+        the regressions.
+    """
+    regressions = []
+    for name, result in results["benchmarks"].iteritems():
+        if name not in baseline["benchmarks"]:
+            continue
+        reference = baseline["benchmarks"][name]
+
+        for case, seconds in result["timings"].iteritems():
+            old = reference["timings"].get(case)
+            if old is None:
+                continue
+            if seconds > old * (1 + threshold) and seconds - old > min_time:
+                regressions.append((name, case, old, seconds))
+
+        old_rss = reference.get("peak_rss_mb")
+        if (old_rss is not None and
+            result["peak_rss_mb"] > old_rss * (1 + threshold)):
+            regressions.append((name, "peak_rss_mb", old_rss,
+                                result["peak_rss_mb"]))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print "%-30s %-25s %12s %12s" % ("benchmark", "case", "value",
+                                     "baseline")
+    for name, result in results["benchmarks"].iteritems():
+        reference = (baseline or {}).get("benchmarks", {}).get(name, {})
+        rows = [(case, seconds, reference.get("timings", {}).get(case))
+                for case, seconds in result["timings"].iteritems()]
+        rows.append(("peak_rss_mb", result["peak_rss_mb"],
+                     reference.get("peak_rss_mb")))
+        for case, value, old in rows:
+            old = "%12.4f" % old if old is not None else "%12s" % "-"
+            print "%-30s %-25s %12.4f %s" % (name, case, value, old)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the OpenTidalFarm benchmark suite")
+    parser.add_argument('benchmarks', nargs='*', help='the benchmarks to run (default: all). Available: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--output', default='benchmark_results.json', help='the JSON file for the results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', help='a JSON file of an earlier run to compare against (default: baseline.json next to this script, if it exists)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the default baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='the relative increase of a timing or of the peak RSS that is reported as a regression (default: 0.25)')
+    parser.add_argument('--repeat', type=int, default=3, help='the timings are the fastest of this many runs (default: 3)')
+    parser.add_argument('--quick', action='store_true', help='use smaller problem sizes')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        result = run_benchmark(args.run, args.quick, args.repeat)
+        sys.stdout.flush()
+        print "RESULT " + json.dumps(result)
+        sys.exit(0)
+
+    names = args.benchmarks or BENCHMARKS.keys()
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark %s." % name)
+
+    results = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "host": platform.node(),
+               "python": platform.python_version(),
+               "quick": args.quick,
+               "benchmarks": OrderedDict()}
+    for name in names:
+        print "Running %s..." % name
+        results["benchmarks"][name] = run_in_subprocess(name, args.quick,
+                                                        args.repeat)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(default_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline_file = args.baseline
+    if baseline_file is None and not args.save_baseline and \
+       os.path.exists(default_baseline):
+        baseline_file = default_baseline
+
+    baseline = None
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get("quick") != args.quick:
+            print "Warning: The baseline was run with quick=%s." % \
+                baseline.get("quick")
+
+    print
+    print_results(results, baseline)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        print
+        if regressions:
+            print "Regressions (more than %i%% slower or larger):" % \
+                (100 * args.threshold)
+            for name, case, old, new in regressions:
+                print "  %s %s: %.4f -> %.4f" % (name, case, old, new)
+            sys.exit(1)
+        else:
+            print "No regressions compared to %s." % baseline_file
@@ -0,0 +1,55 @@
+''' This benchmark compares the cost of the minimum distance constraints for
+farms with 50 to 2000 turbines. The turbines are placed on a jittered regular
+grid with a spacing of about twice the minimum distance.
+
+The dense implementation stores a jacobian with N(N-1)/2 x 2N entries and is
+therefore only run up to 250 turbines. '''
+
+from opentidalfarm import *
+from timeit import default_timer as timer
+import numpy
+
+
+class Controls(object):
+    position = True
+    friction = False
+
+
+def turbine_positions(n, minimum_distance):
+    numpy.random.seed(0)
+    nx = int(numpy.ceil(numpy.sqrt(n)))
+    x, y = numpy.meshgrid(numpy.arange(nx), numpy.arange(nx))
+    positions = numpy.c_[x.ravel(), y.ravel()][:n]*2*minimum_distance
+    positions += numpy.random.uniform(-0.6, 0.6, positions.shape)*minimum_distance
+    return positions
+
+
+def time_constraint(ieq, m, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = timer()
+        ieq.function(m)
+        ieq.jacobian(m)
+        times.append(timer() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    minimum_distance = 40.
+    controls = Controls()
+
+    print "%6s %12s %12s" % ("N", "dense [s]", "sparse [s]")
+    for n in [50, 100, 250, 500, 1000, 2000]:
+        positions = turbine_positions(n, minimum_distance)
+        m = positions.flatten()
+
+        if n <= 250:
+            dense = MinimumDistanceConstraints(positions, minimum_distance,
+                                               controls)
+            dense_time = "%12.4f" % time_constraint(dense, m)
+        else:
+            dense_time = "%12s" % "-"
+
+        sparse = MinimumDistanceConstraintsSparse(positions, minimum_distance,
+                                                  controls)
+        print "%6i %s %12.4f" % (n, dense_time, time_constraint(sparse, m))
@@ -0,0 +1,93 @@
+''' This benchmark compares the vectorised MinimumDistanceConstraintsLargeArrays
+against the previous implementation, which looped over all turbine pairs in
+Python, for farms with 64 to 1000 turbines. The turbines are placed on a
+jittered regular grid so that some of them violate the minimum distance. '''
+
+from opentidalfarm import *
+from timeit import default_timer as timer
+import numpy
+
+
+class Controls(object):
+    position = True
+    friction = False
+
+
+class LoopMinimumDistanceConstraintsLargeArrays(
+        MinimumDistanceConstraintsLargeArrays):
+    """ The pair loop implementation that was used before vectorisation. """
+
+    def _penalty(self, x_sq):
+        return min(0, x_sq - self._minimum_distance**2)
+
+    def _dpenalty(self, x_sq):
+        if x_sq - self._minimum_distance**2 > 0:
+            return 0.0
+        else:
+            return 1.0
+
+    def function(self, m):
+        value = 0
+        for i in range(len(m)/2):
+            for j in range(len(m)/2):
+                if i <= j:
+                    continue
+                dist_sq = self._sl2norm([m[2*i]-m[2*j],
+                                         m[2*i+1]-m[2*j+1]])
+                value += self._penalty(dist_sq)
+        return numpy.array([value])
+
+    def jacobian(self, m):
+        p_ineq_c = numpy.zeros(len(m))
+        for i in range(len(m)/2):
+            for j in range(len(m)/2):
+                if i <= j:
+                    continue
+
+                dist_sq = self._sl2norm([m[2*i]-m[2*j],
+                                         m[2*i+1]-m[2*j+1]])
+                dvalue = self._dpenalty(dist_sq)
+
+                p_ineq_c[2*i] += dvalue * 2*(m[2*i] - m[2*j])
+                p_ineq_c[2*j] += dvalue * (-2*(m[2*i] - m[2*j]))
+                p_ineq_c[2*i+1] += dvalue * 2*(m[2*i+1] - m[2*j+1])
+                p_ineq_c[2*j+1] += dvalue * (-2*(m[2*i+1] - m[2*j+1]))
+        return numpy.array([p_ineq_c])
+
+
+def turbine_positions(n, minimum_distance):
+    numpy.random.seed(0)
+    nx = int(numpy.ceil(numpy.sqrt(n)))
+    x, y = numpy.meshgrid(numpy.arange(nx), numpy.arange(nx))
+    positions = numpy.c_[x.ravel(), y.ravel()][:n]*1.2*minimum_distance
+    positions += numpy.random.uniform(-0.2, 0.2, positions.shape)*minimum_distance
+    return positions
+
+
+def time_constraint(ieq, m):
+    start = timer()
+    value = ieq.function(m)
+    jacobian = ieq.jacobian(m)
+    return timer() - start, value, jacobian
+
+
+if __name__ == "__main__":
+    minimum_distance = 40.
+    controls = Controls()
+
+    print "%6s %12s %12s %10s" % ("N", "loop [s]", "numpy [s]", "speedup")
+    for n in [64, 256, 1000]:
+        positions = turbine_positions(n, minimum_distance)
+        m = positions.flatten()
+
+        loop = LoopMinimumDistanceConstraintsLargeArrays(
+            positions, minimum_distance, controls)
+        vectorised = MinimumDistanceConstraintsLargeArrays(
+            positions, minimum_distance, controls)
+
+        loop_time, loop_value, loop_jacobian = time_constraint(loop, m)
+        time, value, jacobian = time_constraint(vectorised, m)
+
+        assert numpy.allclose(loop_value, value)
+        assert numpy.allclose(loop_jacobian, jacobian)
+        print "%6i %12.4f %12.4f %10.1f" % (n, loop_time, time, loop_time/time)
@@ -0,0 +1,25 @@
+from benchmark import compare
+
+
+class TestBenchmark(object):
+
+    def results(self, seconds, peak_rss):
+        return {"benchmarks": {"steady_solve": {"timings": {"solve": seconds},
+                                                "peak_rss_mb": peak_rss}}}
+
+    def test_regressions_are_flagged(self):
+        baseline = self.results(1.0, 100.)
+
+        assert compare(self.results(1.2, 100.), baseline, 0.25) == []
+        assert compare(self.results(1.3, 100.), baseline, 0.25) == \
+            [("steady_solve", "solve", 1.0, 1.3)]
+        assert compare(self.results(1.0, 130.), baseline, 0.25) == \
+            [("steady_solve", "peak_rss_mb", 100., 130.)]
+
+    def test_small_timing_differences_are_ignored(self):
+        baseline = self.results(0.001, 100.)
+        assert compare(self.results(0.005, 100.), baseline, 0.25) == []
+
+    def test_new_benchmarks_are_skipped(self):
+        baseline = {"benchmarks": {}}
+        assert compare(self.results(1.0, 100.), baseline, 0.25) == []
@@ -0,0 +1,128 @@
+import numpy
+import pytest
+from opentidalfarm import *
+from opentidalfarm.memoize import MemoizeMutable
+from opentidalfarm.optimisation import _serialise_bounds, _uses_fused_evaluation
+from opentidalfarm.reduced_functional_prototype import ReducedFunctionalPrototype
+
+
+class ArrayControl(object):
+
+    def __init__(self, m):
+        self.m = numpy.array(m, dtype=float)
+
+    def data(self):
+        return self.m
+
+
+class QuadraticReducedFunctional(ReducedFunctionalPrototype):
+    """ j(m) = |m - 1|^2, which counts the number of "forward" and "adjoint"
+    runs. """
+
+    def __init__(self, m):
+        self.controls = [ArrayControl(m)]
+        self.evaluations = 0
+        self.derivatives = 0
+
+    def evaluate(self, m, **kwargs):
+        self.evaluations += 1
+        return numpy.sum((m - 1)**2)
+
+    def derivative(self, m, **kwargs):
+        self.derivatives += 1
+        return 2*(m - 1)
+
+    def value_and_derivative(self, m, **kwargs):
+        self.evaluations += 1
+        self.derivatives += 1
+        return numpy.sum((m - 1)**2), 2*(m - 1)
+
+    def hessian(self, m, m_dot):
+        return 2*m_dot
+
+
+class TestValueAndDerivative(object):
+
+    def test_memoize_insert(self):
+        calls = []
+        def f(m, annotate=True):
+            calls.append(m)
+            return 2*m
+        mem = MemoizeMutable(f)
+
+        mem.insert(42., 3., annotate=True)
+        assert mem.has_cache(3., annotate=True)
+        assert not mem.has_cache(3., annotate=False)
+        assert mem(3., annotate=True) == 42.
+        assert mem(3., annotate=False) == 6.
+        assert calls == [3.]
+
+    def test_prototype_default(self):
+        rf = QuadraticReducedFunctional([0., 0.])
+        j, dj = ReducedFunctionalPrototype.value_and_derivative(rf,
+                numpy.array([3., 1.]))
+        assert j == 4.
+        assert (dj == [4., 0.]).all()
+
+    def test_scaled_and_combined(self):
+        rf = QuadraticReducedFunctional([0., 0.])
+        m = numpy.array([2., 3.])
+
+        j, dj = (2*rf).value_and_derivative(m)
+        assert j == 10.
+        assert (dj == [4., 8.]).all()
+
+        j, dj = (rf + 3*rf).value_and_derivative(m)
+        assert j == 20.
+        assert (dj == [8., 16.]).all()
+
+    def test_fused_minimize(self):
+        rf = QuadraticReducedFunctional([5., -3., 0.])
+        m = minimize(rf, method="L-BFGS-B", bounds=[-10, [10, 10, 0.5]])
+
+        assert numpy.allclose(m, [1., 1., 0.5], atol=1e-5)
+        # Every iteration used one combined evaluation.
+        assert rf.evaluations == rf.derivatives
+
+    def test_fused_minimize_with_site_constraints(self):
+        domain = RectangularDomain(0, 0, 3000, 1000, 10, 4)
+        turbine = BumpTurbine(diameter=20., friction=12.,
+                              controls=Controls(position=True))
+        farm = RectangularFarm(domain, site_x_start=1000, site_x_end=2000,
+                               site_y_start=250, site_y_end=750,
+                               turbine=turbine)
+        farm.add_regular_turbine_layout(num_x=2, num_y=1)
+        lb, ub = farm.site_boundary_constraints()
+
+        bounds = _serialise_bounds([lb, ub], 4)
+        assert all(isinstance(b, float) for pair in bounds for b in pair)
+
+        # The unconstrained minimum at (1, 1) lies outside of the site.
+        rf = QuadraticReducedFunctional(farm.control_array)
+        m = minimize(rf, method="L-BFGS-B", bounds=[lb, ub])
+        assert numpy.allclose(m, [float(b) for b in lb])
+
+    def test_newton_cg(self):
+        rf = QuadraticReducedFunctional([5., -3., 0.])
+        m = minimize(rf, method="Newton-CG", options={"xtol": 1e-10})
+
+        assert numpy.allclose(m, [1., 1., 1.])
+        # The exact Hessian finds the minimum of a quadratic in one iteration
+        assert rf.evaluations <= 3
+
+    def test_newton_cg_rejects_bounds(self):
+        rf = QuadraticReducedFunctional([5., -3.])
+        with pytest.raises(ValueError):
+            minimize(rf, method="Newton-CG", bounds=[0, 10])
+
+    def test_fused_maximize(self):
+        rf = -1*QuadraticReducedFunctional([5., -3.])
+        m = maximize(rf, method="BFGS", options={"gtol": 1e-8})
+
+        assert numpy.allclose(m, [1., 1.], atol=1e-5)
+
+    def test_project_is_passed_to_dolfin_adjoint(self):
+        rf = QuadraticReducedFunctional([5., -3.])
+        assert _uses_fused_evaluation(rf, "BFGS", {})
+        assert _uses_fused_evaluation(rf, "BFGS", {"project": False})
+        assert not _uses_fused_evaluation(rf, "BFGS", {"project": True})